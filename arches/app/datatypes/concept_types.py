@@ -2,6 +2,7 @@ import uuid
 import csv
 from arches.app.models import models
 from arches.app.models import concept
+from arches.app.models.concept_labels import concept_labels
 from arches.app.models.system_settings import settings
 from arches.app.datatypes.base import BaseDataType
 from arches.app.datatypes.datatypes import DataTypeFactory, get_value_from_jsonld
@@ -20,16 +21,16 @@ cidoc_nm = Namespace("http://www.cidoc-crm.org/cidoc-crm/")
 
 
 class BaseConceptDataType(BaseDataType):
-    def __init__(self, model=None):
-        super(BaseConceptDataType, self).__init__(model=model)
-        self.value_lookup = {}
-
     def get_value(self, valueid):
-        try:
-            return self.value_lookup[valueid]
-        except:
-            self.value_lookup[valueid] = models.Value.objects.get(pk=valueid)
-            return self.value_lookup[valueid]
+        """
+        Returns the ConceptLabel (value, conceptid, language...) of a value from the concept label cache
+
+        """
+
+        label = concept_labels.get(valueid)
+        if label is None:
+            raise models.Value.DoesNotExist("No concept value with the id %s" % valueid)
+        return label
 
     def get_concept_export_value(self, valueid, concept_export_value_type=None):
         ret = ''
@@ -44,10 +45,9 @@ class BaseConceptDataType(BaseDataType):
     def get_concept_dates(self, concept):
         result = None
         date_range = {}
-        values = models.Value.objects.filter(concept=concept)
-        for value in values:
-            if value.valuetype.valuetype in ('min_year' 'max_year'):
-                date_range[value.valuetype.valuetype] = value.value
+        values = models.Value.objects.filter(concept=concept, valuetype_id__in=('min_year', 'max_year'))
+        for valuetype, value in values.values_list('valuetype_id', 'value'):
+            date_range[valuetype] = value
         if 'min_year' in date_range and 'max_year' in date_range:
             result = date_range
         return result
@@ -59,13 +59,13 @@ class BaseConceptDataType(BaseDataType):
             nodevalue = [nodevalue]
         for valueid in nodevalue:
             value = self.get_value(valueid)
-            date_range = self.get_concept_dates(value.concept)
+            date_range = self.get_concept_dates(value.conceptid)
             if date_range is not None:
                 min_date = ExtendedDateFormat(date_range['min_year']).lower
                 max_date = ExtendedDateFormat(date_range['max_year']).upper
                 if {'gte': min_date, 'lte': max_date} not in document['date_ranges']:
                     document['date_ranges'].append({'date_range': {'gte': min_date, 'lte': max_date}, 'nodegroup_id': tile.nodegroup_id, 'provisional': provisional})
-            document['domains'].append({'label': value.value, 'conceptid': value.concept_id, 'valueid': valueid, 'nodegroup_id': tile.nodegroup_id, 'provisional': provisional})
+            document['domains'].append({'label': value.value, 'conceptid': value.conceptid, 'valueid': valueid, 'nodegroup_id': tile.nodegroup_id, 'provisional': provisional})
             document['strings'].append({'string': value.value, 'nodegroup_id': tile.nodegroup_id, 'provisional': provisional})
 
 
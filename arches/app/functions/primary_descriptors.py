@@ -1,35 +1,186 @@
+import time
 import uuid
+from django.core.cache import cache
+from django.db import transaction
 from arches.app.functions.base import BaseFunction
 from arches.app.models import models
-from arches.app.models.tile import Tile
+from arches.app.models.concept_labels import concept_labels
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.datatypes.datatypes import DataTypeFactory
 
+DESCRIPTORS = ("name", "description", "map_popup")
 
-class PrimaryDescriptorsFunction(BaseFunction):
+CONCEPT_DATATYPES = ("concept", "concept-list")
+RESOURCE_INSTANCE_DATATYPES = ("resource-instance", "resource-instance-list")
 
-    def get_primary_descriptor_from_nodes(self, resource, config):
+
+class DescriptorTemplate(object):
+    """
+    A descriptor's string template compiled into the list of (nodegroup, node, datatype)
+    slots whose <node name> placeholders appear in the template
+
+    """
+
+    def __init__(self, config, nodes_by_nodegroup):
+        self.string_template = config.get("string_template", "")
+        self.nodegroup_id = None
+        self.slots = []
         try:
-            if 'nodegroup_id' in config and config['nodegroup_id'] != '' and config['nodegroup_id'] is not None:
-                tiles = models.TileModel.objects.filter(
-                        nodegroup_id=uuid.UUID(config['nodegroup_id']),
-                        sortorder=0).filter(resourceinstance_id=resource.resourceinstanceid)
-                if len(tiles) == 0:
-                    tiles = models.TileModel.objects.filter(
-                        nodegroup_id=uuid.UUID(config['nodegroup_id'])).filter(
-                        resourceinstance_id=resource.resourceinstanceid)
-                for tile in tiles:
-                    for node in models.Node.objects.filter(nodegroup_id=uuid.UUID(config['nodegroup_id'])):
-                        if len(list(tile.data.keys())) > 0:
-                            data = tile.data
-                        elif tile.provisionaledits is not None and len(list(tile.provisionaledits.keys())) == 1:
-                            userid = list(tile.provisionaledits.keys())[0]
-                            data = tile.provisionaledits[userid]['value']
-                        if str(node.nodeid) in data:
-                            datatype_factory = DataTypeFactory()
-                            datatype = datatype_factory.get_instance(node.datatype)
-                            value = datatype.get_display_value(tile, node)
-                            config['string_template'] = config['string_template'].replace('<%s>' % node.name, value)
+            if "nodegroup_id" in config and config["nodegroup_id"] != "" and config["nodegroup_id"] is not None:
+                self.nodegroup_id = str(uuid.UUID(config["nodegroup_id"]))
         except ValueError as e:
-            print(e, 'invalid nodegroupid participating in descriptor function.')
+            print(e, "invalid nodegroupid participating in descriptor function.")
+
+        for node in nodes_by_nodegroup.get(self.nodegroup_id, []):
+            if "<%s>" % node.name in self.string_template:
+                self.slots.append((self.nodegroup_id, node, node.datatype))
+
+    def render(self, tiles, datatype_factory):
+        """
+        Fills in the template from an already loaded list of tiles
+
+        """
+
+        result = self.string_template
+        if self.nodegroup_id is None:
+            return result
+
+        tiles = [tile for tile in tiles if str(tile.nodegroup_id) == self.nodegroup_id]
+        first_tiles = [tile for tile in tiles if tile.sortorder == 0]
+        for tile in first_tiles if len(first_tiles) > 0 else tiles:
+            data = {}
+            if len(list(tile.data.keys())) > 0:
+                data = tile.data
+            elif tile.provisionaledits is not None and len(list(tile.provisionaledits.keys())) == 1:
+                userid = list(tile.provisionaledits.keys())[0]
+                data = tile.provisionaledits[userid]["value"]
+            for nodegroup_id, node, datatype in self.slots:
+                if str(node.nodeid) in data:
+                    value = datatype_factory.get_instance(datatype).get_display_value(tile, node)
+                    result = result.replace("<%s>" % node.name, value)
+        return result
+
+
+class PrimaryDescriptorsFunction(BaseFunction):
+    """
+    Rendered descriptors are cached by resource, and the cache keys include the version of the resource's graph.
+    If a graph's descriptors show concepts, the keys also include the version of the concept labels.
+    If they show related resources, they include a version of the resource names, which is bumped whenever
+    a tile that's part of any resource's descriptors changes (see invalidate_descriptors)
+
+    """
+
+    RESOURCE_NAMES_VERSION_KEY = "resource_names_version"
+    VERSION_CHECK_INTERVAL = 1
+
+    # compiled descriptor templates keyed by graph id, rebuilt whenever the graph metadata is reloaded
+    _templates = {}
+    _resource_names_version = (None, 0)
+
+    def get_descriptor_templates(self, graphid):
+        """
+        Returns a dictionary of DescriptorTemplates keyed by descriptor name ("name", "description", "map_popup"),
+        or None if the graph doesn't have exactly one primary descriptors function
+
+        """
 
-        return config['string_template']
+        metadata = graph_metadata.get(graphid)
+        compiled = PrimaryDescriptorsFunction._templates.get(metadata.graphid)
+        if compiled is None or compiled[0] is not metadata:
+            templates = None
+            configs = metadata.get_function_configs("primarydescriptors")
+            if len(configs) == 1:
+                templates = {
+                    descriptor: DescriptorTemplate(configs[0][descriptor], metadata.nodes_by_nodegroup)
+                    for descriptor in DESCRIPTORS
+                    if descriptor in configs[0]
+                }
+            compiled = (metadata, templates)
+            PrimaryDescriptorsFunction._templates[metadata.graphid] = compiled
+        return compiled[1]
+
+    def get_participating_nodegroups(self, graphid):
+        templates = self.get_descriptor_templates(graphid)
+        if templates is None:
+            return set()
+        return set(template.nodegroup_id for template in templates.values() if template.nodegroup_id is not None)
+
+    def get_descriptors_from_tiles(self, graphid, tiles, datatype_factory=None):
+        """
+        Renders all the descriptors of a resource from its already loaded tiles
+        returns a dictionary keyed by descriptor name
+
+        """
+
+        templates = self.get_descriptor_templates(graphid)
+        if templates is None:
+            return {descriptor: "undefined" for descriptor in DESCRIPTORS}
+        if datatype_factory is None:
+            datatype_factory = DataTypeFactory()
+        return {
+            descriptor: templates[descriptor].render(tiles, datatype_factory) if descriptor in templates else "undefined"
+            for descriptor in DESCRIPTORS
+        }
+
+    def get_slot_datatypes(self, graphid):
+        templates = self.get_descriptor_templates(graphid)
+        if templates is None:
+            return set()
+        return set(datatype for template in templates.values() for nodegroup_id, node, datatype in template.slots)
+
+    def get_resource_names_version(self):
+        now = time.time()
+        version, checked = PrimaryDescriptorsFunction._resource_names_version
+        if now - checked < self.VERSION_CHECK_INTERVAL:
+            return version
+        version = cache.get(self.RESOURCE_NAMES_VERSION_KEY)
+        if version is None:
+            cache.add(self.RESOURCE_NAMES_VERSION_KEY, str(uuid.uuid4()), None)
+            version = cache.get(self.RESOURCE_NAMES_VERSION_KEY)
+        PrimaryDescriptorsFunction._resource_names_version = (version, now)
+        return version
+
+    def get_cache_key_prefix(self, graphid):
+        """
+        Returns the part of the descriptor cache keys shared by every resource of a graph
+
+        """
+
+        versions = [graph_metadata.get(graphid).version]
+        datatypes = self.get_slot_datatypes(graphid)
+        if any(datatype in CONCEPT_DATATYPES for datatype in datatypes):
+            versions.append(concept_labels.get_version())
+        if any(datatype in RESOURCE_INSTANCE_DATATYPES for datatype in datatypes):
+            versions.append(self.get_resource_names_version())
+        return "resource_descriptors_%s" % "_".join(str(version) for version in versions)
+
+    def get_cache_key(self, graphid, resourceinstanceid, prefix=None):
+        if prefix is None:
+            prefix = self.get_cache_key_prefix(graphid)
+        return "%s_%s" % (prefix, resourceinstanceid)
+
+    def invalidate_descriptors(self, graphid, resourceinstanceid, nodegroupid):
+        """
+        Removes a resource's cached descriptors if the given nodegroup participates in any of them
+
+        The resource's name may have changed too, so the descriptors of every resource that shows
+        related resources are also dropped (once the current transaction, if any, commits)
+
+        """
+
+        if str(nodegroupid) in self.get_participating_nodegroups(graphid):
+            cache.delete(self.get_cache_key(graphid, resourceinstanceid))
+
+            def expire():
+                version = str(uuid.uuid4())
+                cache.set(self.RESOURCE_NAMES_VERSION_KEY, version, None)
+                PrimaryDescriptorsFunction._resource_names_version = (version, time.time())
+
+            transaction.on_commit(expire)
+
+    def get_primary_descriptor_from_nodes(self, resource, config):
+        template = DescriptorTemplate(config, graph_metadata.get(resource.graph_id).nodes_by_nodegroup)
+        tiles = []
+        if template.nodegroup_id is not None:
+            tiles = models.TileModel.objects.filter(nodegroup_id=template.nodegroup_id, resourceinstance_id=resource.resourceinstanceid)
+        return template.render(tiles, DataTypeFactory())
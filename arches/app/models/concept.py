@@ -24,6 +24,8 @@ from operator import methodcaller
 from django.db import transaction, connection
 from django.db.models import Q
 from arches.app.models import models
+from arches.app.models.concept_closure import concept_closure, get_hierarchy_of
+from arches.app.models.concept_labels import concept_labels
 from arches.app.models.system_settings import settings
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Term, Query, Bool, Match, Terms
@@ -648,6 +650,7 @@ class Concept(object):
 
         """
 
+        relationtype_list = relationtypes
         relationtypes = " or ".join(
             ["r.relationtype = '%s'" % (relationtype) for relationtype in relationtypes]
         )
@@ -811,9 +814,27 @@ class Concept(object):
             )
 
         else:
-            sql = """
-                WITH RECURSIVE
+            hierarchy = get_hierarchy_of(relationtype_list)
+            if hierarchy is not None:
+                # the concepts below conceptid are read from the concept_closure table,
+                # so only the relations from conceptid and those concepts need to be joined
+                children = """
                     children AS (
+                        SELECT r.conceptidfrom, r.conceptidto, r.relationtype
+                            FROM relations r
+                            JOIN (
+                                SELECT '{conceptid}'::uuid AS conceptid, 0 AS depth
+                                UNION ALL
+                                SELECT descendantid, depth
+                                FROM concept_closure
+                                WHERE ancestorid = '{conceptid}' AND relationtype = '{hierarchy}'
+                            ) c ON(c.conceptid = r.conceptidfrom)
+                            WHERE ({relationtypes})
+                            {depth_limit}
+                    ),"""
+            else:
+                children = """
+                    RECURSIVE children AS (
                         SELECT r.conceptidfrom, r.conceptidto, r.relationtype, 1 AS depth
                             FROM relations r
                             WHERE r.conceptidfrom = '{conceptid}'
@@ -824,7 +845,10 @@ class Concept(object):
                             JOIN children c ON(c.conceptidto = r.conceptidfrom)
                             WHERE ({relationtypes})
                             {depth_limit}
-                    ),
+                    ),"""
+
+            sql = """
+                WITH {children}
                     results AS (
                         SELECT
                             valuefrom.value as valuefrom, valueto.value as valueto,
@@ -857,6 +881,9 @@ class Concept(object):
                 """
 
             sql = sql.format(
+                children=children.format(
+                    conceptid=conceptid, relationtypes=relationtypes, depth_limit=depth_limit, hierarchy=hierarchy
+                ),
                 conceptid=conceptid,
                 relationtypes=relationtypes,
                 child_valuetypes=child_valuetypes,
@@ -1694,19 +1721,30 @@ def get_preflabel_from_conceptid(conceptid, lang):
     bool_query.filter(Terms(field="conceptid", terms=[conceptid]))
     query.add_query(bool_query)
     preflabels = query.search(index="concepts")["hits"]["hits"]
+    return select_preflabel([preflabel["_source"] for preflabel in preflabels], lang, default)
+
+
+def select_preflabel(preflabels, lang, default=None):
+    """
+    Returns the prefLabel (a dictionary like the documents in the concepts index) in the preferred language,
+    otherwise one in the same language family or in the default language, otherwise the last one
+
+    """
+
+    ret = None
     for preflabel in preflabels:
-        default = preflabel["_source"]
-        if preflabel["_source"]["language"] is not None and lang is not None:
+        default = preflabel
+        if preflabel["language"] is not None and lang is not None:
             # get the label in the preferred language, otherwise get the label in the default language
-            if preflabel["_source"]["language"] == lang:
-                return preflabel["_source"]
-            if preflabel["_source"]["language"].split("-")[0] == lang.split("-")[0]:
-                ret = preflabel["_source"]
+            if preflabel["language"] == lang:
+                return preflabel
+            if preflabel["language"].split("-")[0] == lang.split("-")[0]:
+                ret = preflabel
             if (
-                preflabel["_source"]["language"] == settings.LANGUAGE_CODE
+                preflabel["language"] == settings.LANGUAGE_CODE
                 and ret is None
             ):
-                ret = preflabel["_source"]
+                ret = preflabel
     return default if ret is None else ret
 
 
@@ -1762,9 +1800,15 @@ def get_concept_label_from_valueid(valueid):
 
 
 def get_preflabel_from_valueid(valueid, lang):
-    se = SearchEngineFactory().create()
-    concept_label = se.search(index="concepts", id=valueid)
-    if concept_label["found"]:
-        return get_preflabel_from_conceptid(
-            get_concept_label_from_valueid(valueid)["conceptid"], lang
-        )
+    # the value and its concept's prefLabels are read from the concept label cache rather than the concepts index
+    label = concept_labels.get(valueid)
+    if label is not None:
+        preflabels = [preflabel._asdict() for preflabel in concept_labels.get_preflabels(label.conceptid)]
+        return select_preflabel(preflabels, lang, {
+            "category": "",
+            "conceptid": "",
+            "language": "",
+            "value": "",
+            "type": "",
+            "id": "",
+        })
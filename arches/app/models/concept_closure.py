@@ -0,0 +1,304 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+
+# the relation types that make up each hierarchy in the concept_closure table, keyed by the hierarchy's relationtype
+HIERARCHIES = {"narrower": ("narrower", "hasTopConcept"), "member": ("member",)}
+
+
+def get_hierarchy(relationtype):
+    """
+    Returns the hierarchy (a relationtype of the concept_closure table) that a relation type belongs to,
+    or None if it isn't part of a hierarchy
+
+    """
+
+    for hierarchy, relationtypes in HIERARCHIES.items():
+        if relationtype in relationtypes:
+            return hierarchy
+    return None
+
+
+def get_hierarchy_of(relationtypes):
+    """
+    Returns the hierarchy made up of exactly the given relation types, or None if there isn't one
+
+    """
+
+    for hierarchy, hierarchy_relationtypes in HIERARCHIES.items():
+        if set(relationtypes) == set(hierarchy_relationtypes):
+            return hierarchy
+    return None
+
+
+class ConceptClosureTable(object):
+    """
+    Maintains and reads the concept_closure table, which holds every ancestor and descendant pair
+    of the narrower and member hierarchies of concepts, so descendants are found with one indexed lookup
+    instead of a recursive walk of the relations table
+
+    The table is updated as relations are saved and deleted.  The descendants of the most recently
+    used concepts are also kept in a process wide, least recently used cache that every process drops
+    when a relation is changed (checked at most every VERSION_CHECK_INTERVAL seconds), the cache is shared
+    by every thread of the process so it's only read and changed while holding a lock
+
+    Usage:
+        from arches.app.models.concept_closure import concept_closure
+        concept_closure.get_descendants(conceptid)
+
+    """
+
+    VERSION_KEY = "concept_closure_version"
+    VERSION_CHECK_INTERVAL = 1
+
+    def __init__(self):
+        self._descendants = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = 0
+
+    def _check_version(self):
+        now = time.time()
+        if now - self._version_checked < self.VERSION_CHECK_INTERVAL:
+            return
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            cache.add(self.VERSION_KEY, str(uuid.uuid4()), None)
+            version = cache.get(self.VERSION_KEY)
+        if version != self._version:
+            self.clear()
+            self._version = version
+        self._version_checked = now
+
+    def get_descendants(self, conceptid, relationtype="narrower"):
+        """
+        Returns the ids of every concept below a concept in a hierarchy ('narrower' or 'member')
+
+        """
+
+        self._check_version()
+        key = (str(conceptid), relationtype)
+        with self._lock:
+            descendants = self._descendants.get(key)
+            if descendants is not None:
+                self._descendants.move_to_end(key)
+                return descendants
+
+        descendants = [
+            str(descendantid)
+            for descendantid in models.ConceptClosure.objects.filter(ancestor_id=conceptid, relationtype_id=relationtype).values_list(
+                "descendant_id", flat=True
+            )
+        ]
+        with self._lock:
+            self._descendants[key] = descendants
+            while len(self._descendants) > settings.CONCEPT_CLOSURE_CACHE_SIZE:
+                self._descendants.popitem(last=False)
+        return descendants
+
+    def get_ancestors(self, conceptid, relationtype="narrower"):
+        """
+        Returns the ids of every concept above a concept in a hierarchy ('narrower' or 'member')
+
+        """
+
+        return [
+            str(ancestorid)
+            for ancestorid in models.ConceptClosure.objects.filter(descendant_id=conceptid, relationtype_id=relationtype).values_list(
+                "ancestor_id", flat=True
+            )
+        ]
+
+    def add_relation(self, conceptidfrom, conceptidto, relationtype):
+        """
+        Adds the pairs of concepts joined by a new relation: each ancestor of conceptidfrom (and conceptidfrom itself)
+        with each descendant of conceptidto (and conceptidto itself)
+
+        """
+
+        hierarchy = get_hierarchy(relationtype)
+        if hierarchy is None:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO concept_closure (ancestorid, descendantid, relationtype, depth)
+                SELECT a.ancestorid, d.descendantid, %(hierarchy)s, a.depth + 1 + d.depth
+                FROM (
+                    SELECT %(conceptidfrom)s::uuid AS ancestorid, 0 AS depth
+                    UNION ALL
+                    SELECT ancestorid, depth FROM concept_closure WHERE descendantid = %(conceptidfrom)s AND relationtype = %(hierarchy)s
+                ) a, (
+                    SELECT %(conceptidto)s::uuid AS descendantid, 0 AS depth
+                    UNION ALL
+                    SELECT descendantid, depth FROM concept_closure WHERE ancestorid = %(conceptidto)s AND relationtype = %(hierarchy)s
+                ) d
+                WHERE a.ancestorid <> d.descendantid
+                ON CONFLICT (ancestorid, descendantid, relationtype) DO UPDATE SET depth = LEAST(concept_closure.depth, EXCLUDED.depth)""",
+                {"conceptidfrom": str(conceptidfrom), "conceptidto": str(conceptidto), "hierarchy": hierarchy},
+            )
+        self.invalidate()
+
+    def remove_relation(self, conceptidfrom, conceptidto, relationtype):
+        """
+        Removes the pairs of concepts that were only joined through a deleted relation
+
+        Only pairs of an ancestor of conceptidfrom (or conceptidfrom itself) and a descendant of conceptidto
+        (or conceptidto itself) can have been joined through the relation, those pairs are deleted and then
+        added back from the remaining relations, one ancestor at a time starting from those lowest in the hierarchy
+
+        """
+
+        hierarchy = get_hierarchy(relationtype)
+        if hierarchy is None:
+            return
+        conceptidfrom = str(conceptidfrom)
+        conceptidto = str(conceptidto)
+        ancestors = [conceptidfrom] + self.get_ancestors(conceptidfrom, hierarchy)
+        descendants = [conceptidto] + [
+            str(descendantid)
+            for descendantid in models.ConceptClosure.objects.filter(ancestor_id=conceptidto, relationtype_id=hierarchy).values_list(
+                "descendant_id", flat=True
+            )
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """DELETE FROM concept_closure
+                WHERE relationtype = %s AND ancestorid = ANY(%s::uuid[]) AND descendantid = ANY(%s::uuid[])""",
+                [hierarchy, ancestors, descendants],
+            )
+            cursor.execute(
+                """SELECT conceptidfrom::text, conceptidto::text FROM relations
+                WHERE relationtype = ANY(%s) AND conceptidfrom = ANY(%s::uuid[]) AND conceptidto = ANY(%s::uuid[])""",
+                [list(HIERARCHIES[hierarchy]), ancestors, ancestors],
+            )
+            for ancestorid in self._order_bottom_up(ancestors, cursor.fetchall()):
+                cursor.execute(
+                    """INSERT INTO concept_closure (ancestorid, descendantid, relationtype, depth)
+                    SELECT %(ancestorid)s::uuid, descendantid, %(hierarchy)s, min(depth)
+                    FROM (
+                        SELECT r.conceptidto AS descendantid, 1 AS depth
+                        FROM relations r
+                        WHERE r.conceptidfrom = %(ancestorid)s AND r.relationtype = ANY(%(relationtypes)s)
+                        UNION ALL
+                        SELECT c.descendantid, c.depth + 1
+                        FROM relations r
+                            JOIN concept_closure c ON c.ancestorid = r.conceptidto AND c.relationtype = %(hierarchy)s
+                        WHERE r.conceptidfrom = %(ancestorid)s AND r.relationtype = ANY(%(relationtypes)s)
+                    ) paths
+                    WHERE descendantid = ANY(%(descendants)s::uuid[]) AND descendantid <> %(ancestorid)s::uuid
+                    GROUP BY descendantid
+                    ON CONFLICT (ancestorid, descendantid, relationtype) DO UPDATE SET depth = LEAST(concept_closure.depth, EXCLUDED.depth)""",
+                    {
+                        "ancestorid": ancestorid,
+                        "hierarchy": hierarchy,
+                        "relationtypes": list(HIERARCHIES[hierarchy]),
+                        "descendants": descendants,
+                    },
+                )
+        self.invalidate()
+
+    def _order_bottom_up(self, conceptids, relations):
+        """
+        Orders concepts so that each comes after the concepts below it (given the relations between them),
+        any concepts in a cycle come last
+
+        """
+
+        children = {conceptid: set() for conceptid in conceptids}
+        parents = {conceptid: set() for conceptid in conceptids}
+        for conceptidfrom, conceptidto in relations:
+            if conceptidfrom != conceptidto:
+                children[conceptidfrom].add(conceptidto)
+                parents[conceptidto].add(conceptidfrom)
+
+        ordered = []
+        ready = [conceptid for conceptid in conceptids if len(children[conceptid]) == 0]
+        while len(ready) > 0:
+            conceptid = ready.pop()
+            ordered.append(conceptid)
+            for parentid in parents[conceptid]:
+                children[parentid].discard(conceptid)
+                if len(children[parentid]) == 0:
+                    ready.append(parentid)
+        ordered_ids = set(ordered)
+        return ordered + [conceptid for conceptid in conceptids if conceptid not in ordered_ids]
+
+    def rebuild(self):
+        """
+        Rebuilds the whole table from the relations table
+
+        """
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT __arches_refresh_concept_closure()")
+        self.invalidate()
+
+    def clear(self):
+        with self._lock:
+            self._descendants.clear()
+
+    def invalidate(self):
+        """
+        Discards the cached descendants in every process, once the current transaction (if any) commits
+
+        """
+
+        def expire():
+            self.clear()
+            cache.set(self.VERSION_KEY, str(uuid.uuid4()), None)
+
+        self.clear()
+        transaction.on_commit(expire)
+
+
+concept_closure = ConceptClosureTable()
+
+
+@receiver(pre_save, sender=models.Relation)
+def get_previous_relation(sender, instance, **kwargs):
+    # a relation that's changed to another type or between other concepts is removed from the closure once it's saved
+    instance._previous_relation = None
+    if not instance._state.adding:
+        instance._previous_relation = (
+            models.Relation.objects.filter(pk=instance.pk).values_list("conceptfrom_id", "conceptto_id", "relationtype_id").first()
+        )
+
+
+@receiver(post_save, sender=models.Relation)
+def add_relation_to_closure(sender, instance, **kwargs):
+    relation = (instance.conceptfrom_id, instance.conceptto_id, instance.relationtype_id)
+    previous = getattr(instance, "_previous_relation", None)
+    if previous is not None and tuple(str(value) for value in previous) != tuple(str(value) for value in relation):
+        concept_closure.remove_relation(*previous)
+    concept_closure.add_relation(*relation)
+
+
+@receiver(post_delete, sender=models.Relation)
+def remove_relation_from_closure(sender, instance, **kwargs):
+    concept_closure.remove_relation(instance.conceptfrom_id, instance.conceptto_id, instance.relationtype_id)
@@ -0,0 +1,214 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import uuid
+import threading
+from collections import namedtuple, OrderedDict
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+
+# a concept value, the fields match the documents in the concepts index
+ConceptLabel = namedtuple("ConceptLabel", ["id", "value", "conceptid", "language", "type", "category"])
+
+LABEL_FIELDS = ("valueid", "value", "concept_id", "language_id", "valuetype_id", "valuetype__category")
+
+
+class ConceptLabelCache(object):
+    """
+    A process wide, least recently used cache of concept values keyed by valueid
+    and of the prefLabels of concepts keyed by conceptid
+
+    Missing values are loaded in bulk (see get_many and load_collection), and every process drops
+    its cached values when a value is saved or deleted.  The version is read from the django cache
+    at most every VERSION_CHECK_INTERVAL seconds, so that lookups of cached values don't go to the network
+
+    The cache is shared by every thread of the process, so it's only read and changed while holding a lock
+
+    Usage:
+        from arches.app.models.concept_labels import concept_labels
+        concept_labels.get(valueid).value
+
+    """
+
+    VERSION_KEY = "concept_labels_version"
+    VERSION_CHECK_INTERVAL = 1
+
+    def __init__(self):
+        self._labels = OrderedDict()
+        self._preflabels = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = 0
+
+    def _check_version(self):
+        now = time.time()
+        if now - self._version_checked < self.VERSION_CHECK_INTERVAL:
+            return
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            cache.add(self.VERSION_KEY, str(uuid.uuid4()), None)
+            version = cache.get(self.VERSION_KEY)
+        if version != self._version:
+            self.clear()
+            self._version = version
+        self._version_checked = now
+
+    def get_version(self):
+        """
+        Returns the version of the cached values, which changes whenever a value is saved or deleted
+
+        """
+
+        self._check_version()
+        return self._version
+
+    def _get(self, entries, key):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def _add(self, entries, key, value):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > settings.CONCEPT_LABEL_CACHE_SIZE:
+                entries.popitem(last=False)
+
+    def _add_rows(self, rows):
+        labels = {}
+        for row in rows:
+            label = ConceptLabel(str(row[0]), row[1], str(row[2]), row[3], row[4], row[5])
+            self._add(self._labels, label.id, label)
+            labels[label.id] = label
+        return labels
+
+    def get(self, valueid):
+        """
+        Returns the ConceptLabel of a value, or None if there isn't a value with that id
+
+        """
+
+        labels = self.get_many([valueid])
+        return next(iter(labels.values())) if len(labels) > 0 else None
+
+    def get_many(self, valueids):
+        """
+        Returns a dictionary of ConceptLabels keyed by valueid, loading any that aren't cached with a single query
+
+        """
+
+        self._check_version()
+        labels = {}
+        missing = []
+        for valueid in valueids:
+            try:
+                valueid = str(uuid.UUID(str(valueid)))
+            except ValueError:
+                continue
+            label = self._get(self._labels, valueid)
+            if label is None:
+                missing.append(valueid)
+            else:
+                labels[valueid] = label
+        if len(missing) > 0:
+            labels.update(self._add_rows(models.Value.objects.filter(valueid__in=missing).values_list(*LABEL_FIELDS)))
+        return labels
+
+    def get_preflabels(self, conceptid):
+        """
+        Returns the ConceptLabels of the prefLabels of a concept (in every language)
+
+        """
+
+        self._check_version()
+        conceptid = str(conceptid)
+        preflabels = self._get(self._preflabels, conceptid)
+        if preflabels is None:
+            rows = models.Value.objects.filter(concept_id=conceptid, valuetype_id="prefLabel").values_list(*LABEL_FIELDS)
+            preflabels = list(self._add_rows(rows).values())
+        self._add(self._preflabels, conceptid, preflabels)
+        return preflabels
+
+    def load_collection(self, collectionid):
+        """
+        Loads the values of every concept in a collection (and the collections within it) with a single query
+
+        """
+
+        self._check_version()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """WITH RECURSIVE members(conceptid) AS (
+                    SELECT conceptidto FROM relations WHERE conceptidfrom = %s AND relationtype = 'member'
+                    UNION
+                    SELECT r.conceptidto FROM relations r JOIN members m ON r.conceptidfrom = m.conceptid
+                    WHERE r.relationtype = 'member'
+                )
+                SELECT v.valueid, v.value, v.conceptid, v.languageid, v.valuetype, d.category
+                FROM values v
+                    JOIN d_value_types d ON d.valuetype = v.valuetype
+                WHERE v.conceptid IN (SELECT conceptid FROM members)""",
+                [collectionid],
+            )
+            return self._add_rows(cursor.fetchall())
+
+    def load_nodes(self, nodes):
+        """
+        Loads the values of the collections of any concept or concept-list nodes in a list of nodes
+
+        """
+
+        for node in nodes:
+            if node.datatype in ("concept", "concept-list") and node.config and node.config.get("rdmCollection"):
+                self.load_collection(node.config["rdmCollection"])
+
+    def clear(self):
+        with self._lock:
+            self._labels.clear()
+            self._preflabels.clear()
+
+    def invalidate(self):
+        """
+        Discards the cached values in every process, once the current transaction (if any) commits
+
+        """
+
+        def expire():
+            self.clear()
+            cache.set(self.VERSION_KEY, str(uuid.uuid4()), None)
+
+        self.clear()
+        transaction.on_commit(expire)
+
+
+concept_labels = ConceptLabelCache()
+
+
+@receiver(post_save, sender=models.Value)
+@receiver(post_delete, sender=models.Value)
+@receiver(post_save, sender=models.FileValue)
+@receiver(post_delete, sender=models.FileValue)
+def invalidate_concept_labels(sender, instance, **kwargs):
+    concept_labels.invalidate()
@@ -23,6 +23,7 @@ from copy import copy, deepcopy
 from django.db import transaction
 from arches.app.models import models
 from arches.app.models.resource import Resource
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.models.system_settings import settings
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 from django.utils.translation import ugettext as _
@@ -383,6 +384,8 @@ class Graph(models.GraphModel):
                 nodegroup.delete()
             self._nodegroups_to_delete = []
 
+            graph_metadata.invalidate(self.graphid)
+
         return self
 
     def delete(self):
@@ -404,6 +407,7 @@ class Graph(models.GraphModel):
                     widget.delete()
 
                 super(Graph, self).delete()
+                graph_metadata.invalidate(self.graphid)
         else:
             raise GraphValidationError(_("Your resource model: {0}, already has instances saved. You cannot delete a Resource Model with instances.".format(self.name)))
 
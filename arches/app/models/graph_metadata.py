@@ -0,0 +1,243 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+
+
+class GraphMetadata(object):
+    """
+    A read only snapshot of the parts of a graph that are needed when reading,
+    writing and indexing resource instances of that graph
+
+    """
+
+    def __init__(self, graphid, version=None):
+        self.graphid = str(graphid)
+        self.version = version
+        self.graph = models.GraphModel.objects.filter(graphid=self.graphid).first()
+        self.nodes = {}
+        self.node_datatypes = {}
+        self.nodes_by_nodegroup = {}
+        self.nodegroups = {}
+        self.cardinality = {}
+        self.widget_labels = {}
+        self.root_ontology_class = None
+
+        for node in models.Node.objects.filter(graph_id=self.graphid).select_related("nodegroup"):
+            nodeid = str(node.nodeid)
+            self.nodes[nodeid] = node
+            self.node_datatypes[nodeid] = node.datatype
+            if node.istopnode:
+                self.root_ontology_class = node.ontologyclass
+            if node.nodegroup_id is not None:
+                nodegroupid = str(node.nodegroup_id)
+                self.nodes_by_nodegroup.setdefault(nodegroupid, []).append(node)
+                self.nodegroups[nodegroupid] = node.nodegroup
+                self.cardinality[nodegroupid] = node.nodegroup.cardinality
+
+        for nodeid, label in models.CardXNodeXWidget.objects.filter(node__graph_id=self.graphid).values_list("node_id", "label"):
+            self.widget_labels.setdefault(str(nodeid), label)
+
+        self.functions = list(models.FunctionXGraph.objects.filter(graph_id=self.graphid).select_related("function"))
+
+    def get_node(self, nodeid):
+        return self.nodes[str(nodeid)]
+
+    def get_function_configs(self, functiontype):
+        """
+        Returns the configs of the functions of the given type attached to this graph
+
+        """
+
+        return [function.config for function in self.functions if function.function.functiontype == functiontype]
+
+
+class GraphMetadataCache(object):
+    """
+    A process wide cache of GraphMetadata keyed by graph id
+
+    Each entry is stamped with a version stored in the django cache.  Saving or deleting
+    a graph (or any of its nodes, nodegroups, functions or widgets) writes a new version,
+    so every process reloads its copy of that graph the next time it is requested
+
+    The map of the nodegroups of every resource model to their graph (see get_resource_nodegroups)
+    is versioned the same way, any change to a graph writes a new version of it
+
+    Versions are read from the django cache at most every VERSION_CHECK_INTERVAL seconds,
+    so that lookups of graphs that are already loaded don't go to the network
+
+    To use, import the module level instance:
+
+        from arches.app.models.graph_metadata import graph_metadata
+        ....
+        graph_metadata.get(graphid).node_datatypes
+
+    """
+
+    RESOURCE_NODEGROUPS_VERSION_KEY = "resource_nodegroups_version"
+    VERSION_CHECK_INTERVAL = 1
+
+    def __init__(self):
+        self._graphs = {}
+        self._nodegroup_graphs = {}
+        self._resource_nodegroups = None
+        self._versions = {}
+
+    def _version_key(self, graphid):
+        return "graph_metadata_version_%s" % graphid
+
+    def _get_version(self, graphid):
+        return self._get_cache_version(self._version_key(graphid))
+
+    def _get_cache_version(self, key):
+        now = time.time()
+        version, checked = self._versions.get(key, (None, 0))
+        if now - checked < self.VERSION_CHECK_INTERVAL:
+            return version
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, str(uuid.uuid4()), None)
+            version = cache.get(key)
+        self._versions[key] = (version, now)
+        return version
+
+    def get(self, graphid):
+        graphid = str(graphid)
+        version = self._get_version(graphid)
+        metadata = self._graphs.get(graphid)
+        if metadata is None or metadata.version != version:
+            metadata = GraphMetadata(graphid, version=version)
+            self._graphs[graphid] = metadata
+            for nodegroupid in metadata.nodegroups:
+                self._nodegroup_graphs[nodegroupid] = graphid
+        return metadata
+
+    def get_by_nodegroup(self, nodegroupid):
+        """
+        Returns the GraphMetadata of the graph that contains the given nodegroup
+
+        """
+
+        nodegroupid = str(nodegroupid)
+        graphid = self._nodegroup_graphs.get(nodegroupid)
+        if graphid is None:
+            graphid = models.Node.objects.filter(nodegroup_id=nodegroupid).values_list("graph_id", flat=True).first()
+            if graphid is None:
+                return None
+            self._nodegroup_graphs[nodegroupid] = str(graphid)
+        return self.get(graphid)
+
+    def get_node_datatypes(self, graphids):
+        """
+        Returns a dictionary of datatypes keyed to node ids for all the nodes of the given graphs
+
+        """
+
+        node_datatypes = {}
+        for graphid in set(str(graphid) for graphid in graphids):
+            node_datatypes.update(self.get(graphid).node_datatypes)
+        return node_datatypes
+
+    def get_resource_nodegroups_version(self):
+        return self._get_cache_version(self.RESOURCE_NODEGROUPS_VERSION_KEY)
+
+    def get_resource_nodegroups(self):
+        """
+        Returns a dictionary of graph ids keyed by the ids of the nodegroups of every resource model
+        (other than the system settings model), loaded with one query and then kept until a graph changes
+
+        """
+
+        version = self.get_resource_nodegroups_version()
+        if self._resource_nodegroups is None or self._resource_nodegroups[0] != version:
+            nodegroups = (
+                models.Node.objects.filter(graph__isresource=True, nodegroup__isnull=False)
+                .exclude(graph_id=settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID)
+                .values_list("nodegroup_id", "graph_id")
+            )
+            self._resource_nodegroups = (version, {str(nodegroupid): str(graphid) for nodegroupid, graphid in nodegroups})
+        return self._resource_nodegroups[1]
+
+    def invalidate(self, graphid):
+        """
+        Discards the cached metadata of a graph in every process, once the current transaction (if any) commits
+
+        """
+
+        graphid = str(graphid)
+
+        def expire():
+            self._graphs.pop(graphid, None)
+            self._resource_nodegroups = None
+            versions = {self._version_key(graphid): str(uuid.uuid4()), self.RESOURCE_NODEGROUPS_VERSION_KEY: str(uuid.uuid4())}
+            cache.set_many(versions, None)
+            now = time.time()
+            for key, version in versions.items():
+                self._versions[key] = (version, now)
+
+        self._graphs.pop(graphid, None)
+        self._resource_nodegroups = None
+        transaction.on_commit(expire)
+
+
+graph_metadata = GraphMetadataCache()
+
+
+@receiver(post_save, sender=models.GraphModel)
+@receiver(post_delete, sender=models.GraphModel)
+def invalidate_graph(sender, instance, **kwargs):
+    graph_metadata.invalidate(instance.graphid)
+
+
+@receiver(post_save, sender=models.Node)
+@receiver(post_delete, sender=models.Node)
+def invalidate_node_graph(sender, instance, **kwargs):
+    if instance.graph_id is not None:
+        graph_metadata.invalidate(instance.graph_id)
+
+
+@receiver(post_save, sender=models.FunctionXGraph)
+@receiver(post_delete, sender=models.FunctionXGraph)
+def invalidate_function_graph(sender, instance, **kwargs):
+    graph_metadata.invalidate(instance.graph_id)
+
+
+@receiver(post_save, sender=models.NodeGroup)
+@receiver(pre_delete, sender=models.NodeGroup)
+def invalidate_nodegroup_graph(sender, instance, **kwargs):
+    # the graph is looked up before a nodegroup is deleted, while its nodes still exist
+    graphid = models.Node.objects.filter(nodegroup_id=instance.nodegroupid).values_list("graph_id", flat=True).first()
+    if graphid is None:
+        graphid = graph_metadata._nodegroup_graphs.get(str(instance.nodegroupid))
+    if graphid is not None:
+        graph_metadata.invalidate(graphid)
+
+
+@receiver(post_save, sender=models.CardXNodeXWidget)
+@receiver(post_delete, sender=models.CardXNodeXWidget)
+def invalidate_widget_graph(sender, instance, **kwargs):
+    graphid = models.Node.objects.filter(nodeid=instance.node_id).values_list("graph_id", flat=True).first()
+    if graphid is not None:
+        graph_metadata.invalidate(graphid)
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '5473_move_expoprtable_to_node'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexQueue',
+            fields=[
+                ('indexqueueid', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resourceinstanceid', models.UUIDField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'index_queue',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='indexqueue',
+            index=models.Index(fields=['resourceinstanceid'], name='index_queue_resourceid_idx'),
+        ),
+    ]
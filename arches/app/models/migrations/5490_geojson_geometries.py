@@ -0,0 +1,114 @@
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '5480_index_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoJSONGeometry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.GeometryField(srid=3857)),
+                ('node', models.ForeignKey(db_column='nodeid', on_delete=django.db.models.deletion.CASCADE, to='models.Node')),
+                ('resourceinstance', models.ForeignKey(db_column='resourceinstanceid', on_delete=django.db.models.deletion.CASCADE, to='models.ResourceInstance')),
+                ('tile', models.ForeignKey(db_column='tileid', on_delete=django.db.models.deletion.CASCADE, to='models.TileModel')),
+            ],
+            options={
+                'db_table': 'geojson_geometries',
+                'managed': True,
+            },
+        ),
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION __arches_geojson_feature_geometries(p_featurecollection jsonb)
+                RETURNS SETOF geometry
+                LANGUAGE plpgsql
+                IMMUTABLE
+            AS $BODY$
+            DECLARE
+                v_geometry jsonb;
+            BEGIN
+                IF jsonb_typeof(p_featurecollection -> 'features') IS DISTINCT FROM 'array' THEN
+                    RETURN;
+                END IF;
+
+                -- features without a geometry, or with one that isn't valid geojson, are skipped rather than failing the tile save
+                FOR v_geometry IN
+                    SELECT f.feature -> 'geometry'
+                    FROM jsonb_array_elements(p_featurecollection -> 'features') AS f(feature)
+                    WHERE jsonb_typeof(f.feature -> 'geometry') = 'object'
+                LOOP
+                    BEGIN
+                        RETURN NEXT ST_Transform(ST_SetSRID(st_geomfromgeojson(v_geometry::text), 4326), 3857);
+                    EXCEPTION WHEN OTHERS THEN
+                        NULL;
+                    END;
+                END LOOP;
+            END;
+            $BODY$;
+
+            CREATE OR REPLACE FUNCTION __arches_refresh_geojson_geometries(p_nodeid uuid = NULL)
+                RETURNS void
+                LANGUAGE plpgsql
+            AS $BODY$
+            BEGIN
+                DELETE FROM geojson_geometries WHERE p_nodeid IS NULL OR nodeid = p_nodeid;
+                INSERT INTO geojson_geometries (tileid, resourceinstanceid, nodeid, geom)
+                SELECT t.tileid, t.resourceinstanceid, n.nodeid, f.geom
+                FROM tiles t
+                    JOIN nodes n ON t.nodegroupid = n.nodegroupid,
+                    LATERAL __arches_geojson_feature_geometries(t.tiledata -> n.nodeid::text) f(geom)
+                WHERE n.datatype = 'geojson-feature-collection'
+                    AND (p_nodeid IS NULL OR n.nodeid = p_nodeid);
+            END;
+            $BODY$;
+
+            CREATE OR REPLACE FUNCTION __arches_refresh_tile_geojson_geometries()
+                RETURNS trigger
+                LANGUAGE plpgsql
+            AS $BODY$
+            BEGIN
+                IF TG_OP = 'UPDATE'
+                    AND NEW.tiledata IS NOT DISTINCT FROM OLD.tiledata
+                    AND NEW.nodegroupid IS NOT DISTINCT FROM OLD.nodegroupid
+                    AND NEW.resourceinstanceid IS NOT DISTINCT FROM OLD.resourceinstanceid THEN
+                    RETURN NULL;
+                END IF;
+
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM geojson_geometries WHERE tileid = OLD.tileid;
+                END IF;
+
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO geojson_geometries (tileid, resourceinstanceid, nodeid, geom)
+                    SELECT NEW.tileid, NEW.resourceinstanceid, n.nodeid, f.geom
+                    FROM nodes n,
+                        LATERAL __arches_geojson_feature_geometries(NEW.tiledata -> n.nodeid::text) f(geom)
+                    WHERE n.nodegroupid = NEW.nodegroupid
+                        AND n.datatype = 'geojson-feature-collection';
+                END IF;
+
+                RETURN NULL;
+            END;
+            $BODY$;
+
+            CREATE TRIGGER __arches_tiles_geojson_geometries
+                AFTER INSERT OR UPDATE OR DELETE ON tiles
+                FOR EACH ROW EXECUTE PROCEDURE __arches_refresh_tile_geojson_geometries();
+
+            SELECT __arches_refresh_geojson_geometries();
+            """,
+            """
+            DROP TRIGGER IF EXISTS __arches_tiles_geojson_geometries ON tiles;
+            DROP FUNCTION IF EXISTS __arches_refresh_tile_geojson_geometries();
+            DROP FUNCTION IF EXISTS __arches_refresh_geojson_geometries(uuid);
+            DROP FUNCTION IF EXISTS __arches_geojson_feature_geometries(jsonb);
+            """,
+        ),
+    ]
@@ -0,0 +1,317 @@
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '5490_geojson_geometries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoJSONGeometryCluster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.IntegerField()),
+                ('cell_x', models.IntegerField()),
+                ('cell_y', models.IntegerField()),
+                ('total', models.IntegerField()),
+                ('geom', django.contrib.gis.db.models.fields.PointField(srid=3857)),
+                ('extent', django.contrib.gis.db.models.fields.GeometryField(srid=3857)),
+                ('members', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), null=True, size=None)),
+                ('node', models.ForeignKey(db_column='nodeid', on_delete=django.db.models.deletion.CASCADE, to='models.Node')),
+            ],
+            options={
+                'db_table': 'geojson_geometry_clusters',
+                'managed': True,
+                'unique_together': {('node', 'zoom', 'cell_x', 'cell_y')},
+            },
+        ),
+        migrations.AlterField(
+            model_name='geojsongeometry',
+            name='resourceinstance',
+            field=models.ForeignKey(db_column='resourceinstanceid', on_delete=django.db.models.deletion.DO_NOTHING, to='models.ResourceInstance'),
+        ),
+        migrations.AlterField(
+            model_name='geojsongeometry',
+            name='tile',
+            field=models.ForeignKey(db_column='tileid', on_delete=django.db.models.deletion.DO_NOTHING, to='models.TileModel'),
+        ),
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION __arches_refresh_geojson_clusters(p_nodeid uuid, p_bbox geometry = NULL)
+                RETURNS void
+                LANGUAGE plpgsql
+            AS $BODY$
+            DECLARE
+                v_config jsonb;
+                v_max_zoom integer;
+                v_min_points integer;
+                v_origin double precision := 20037508.3428;
+                v_size double precision;
+                v_min_x integer;
+                v_min_y integer;
+                v_max_x integer;
+                v_max_y integer;
+                v_cells geometry;
+            BEGIN
+                SELECT config INTO v_config FROM nodes WHERE nodeid = p_nodeid AND datatype = 'geojson-feature-collection';
+                IF v_config ->> 'clusterMaxZoom' IS NULL OR v_config ->> 'clusterDistance' IS NULL THEN
+                    RETURN;
+                END IF;
+
+                v_max_zoom := (v_config ->> 'clusterMaxZoom')::integer;
+                v_min_points := coalesce((v_config ->> 'clusterMinPoints')::integer, 2);
+                -- the size (in meters) of a cell at clusterMaxZoom, cells are twice as wide at each lower zoom level
+                v_size := 40075016.6856 / ((2 ^ v_max_zoom) * 256) * (v_config ->> 'clusterDistance')::double precision;
+
+                -- concurrent refreshes of a node would otherwise delete and insert the same cells
+                PERFORM pg_advisory_xact_lock(hashtext(p_nodeid::text));
+
+                IF p_bbox IS NULL THEN
+                    DELETE FROM geojson_geometry_clusters WHERE nodeid = p_nodeid;
+                ELSE
+                    v_min_x := floor((ST_XMin(p_bbox) + v_origin) / v_size);
+                    v_min_y := floor((ST_YMin(p_bbox) + v_origin) / v_size);
+                    v_max_x := floor((ST_XMax(p_bbox) + v_origin) / v_size);
+                    v_max_y := floor((ST_YMax(p_bbox) + v_origin) / v_size);
+                    v_cells := ST_MakeEnvelope(
+                        v_min_x * v_size - v_origin,
+                        v_min_y * v_size - v_origin,
+                        (v_max_x + 1) * v_size - v_origin,
+                        (v_max_y + 1) * v_size - v_origin,
+                        3857
+                    );
+                END IF;
+
+                FOR v_zoom IN REVERSE v_max_zoom..0 LOOP
+                    IF p_bbox IS NOT NULL THEN
+                        IF v_zoom < v_max_zoom THEN
+                            v_min_x := floor(v_min_x / 2.0);
+                            v_min_y := floor(v_min_y / 2.0);
+                            v_max_x := floor(v_max_x / 2.0);
+                            v_max_y := floor(v_max_y / 2.0);
+                        END IF;
+                        DELETE FROM geojson_geometry_clusters
+                        WHERE nodeid = p_nodeid
+                            AND zoom = v_zoom
+                            AND cell_x BETWEEN v_min_x AND v_max_x
+                            AND cell_y BETWEEN v_min_y AND v_max_y;
+                    END IF;
+
+                    IF v_zoom = v_max_zoom THEN
+                        INSERT INTO geojson_geometry_clusters (nodeid, zoom, cell_x, cell_y, total, geom, extent, members)
+                        SELECT p_nodeid,
+                            v_zoom,
+                            cells.cell_x,
+                            cells.cell_y,
+                            count(*),
+                            ST_SetSRID(ST_MakePoint(avg(ST_X(cells.centroid)), avg(ST_Y(cells.centroid))), 3857),
+                            ST_SetSRID(ST_Extent(cells.geom)::geometry, 3857),
+                            CASE WHEN count(*) < v_min_points THEN array_agg(cells.id) END
+                        FROM (
+                            SELECT g.id,
+                                g.geom,
+                                ST_Centroid(g.geom) AS centroid,
+                                floor((ST_X(ST_Centroid(g.geom)) + v_origin) / v_size)::integer AS cell_x,
+                                floor((ST_Y(ST_Centroid(g.geom)) + v_origin) / v_size)::integer AS cell_y
+                            FROM geojson_geometries g
+                            WHERE g.nodeid = p_nodeid
+                                AND NOT ST_IsEmpty(g.geom)
+                                AND (p_bbox IS NULL OR g.geom && v_cells)
+                        ) cells
+                        WHERE p_bbox IS NULL
+                            OR (cells.cell_x BETWEEN v_min_x AND v_max_x AND cells.cell_y BETWEEN v_min_y AND v_max_y)
+                        GROUP BY cells.cell_x, cells.cell_y;
+                    ELSE
+                        INSERT INTO geojson_geometry_clusters (nodeid, zoom, cell_x, cell_y, total, geom, extent)
+                        SELECT p_nodeid,
+                            v_zoom,
+                            floor(c.cell_x / 2.0)::integer,
+                            floor(c.cell_y / 2.0)::integer,
+                            sum(c.total),
+                            ST_SetSRID(ST_MakePoint(
+                                sum(ST_X(c.geom) * c.total) / sum(c.total),
+                                sum(ST_Y(c.geom) * c.total) / sum(c.total)
+                            ), 3857),
+                            ST_SetSRID(ST_Extent(c.extent)::geometry, 3857)
+                        FROM geojson_geometry_clusters c
+                        WHERE c.nodeid = p_nodeid
+                            AND c.zoom = v_zoom + 1
+                            AND (p_bbox IS NULL OR (
+                                c.cell_x BETWEEN v_min_x * 2 AND v_max_x * 2 + 1
+                                AND c.cell_y BETWEEN v_min_y * 2 AND v_max_y * 2 + 1
+                            ))
+                        GROUP BY floor(c.cell_x / 2.0)::integer, floor(c.cell_y / 2.0)::integer;
+
+                        -- cells too small to be drawn as a cluster list the geometries of the cells they're made from
+                        UPDATE geojson_geometry_clusters p
+                        SET members = (
+                            SELECT array_agg(m.id)
+                            FROM geojson_geometry_clusters c, unnest(c.members) AS m(id)
+                            WHERE c.nodeid = p_nodeid
+                                AND c.zoom = v_zoom + 1
+                                AND c.cell_x BETWEEN p.cell_x * 2 AND p.cell_x * 2 + 1
+                                AND c.cell_y BETWEEN p.cell_y * 2 AND p.cell_y * 2 + 1
+                        )
+                        WHERE p.nodeid = p_nodeid
+                            AND p.zoom = v_zoom
+                            AND p.total < v_min_points
+                            AND (p_bbox IS NULL OR (p.cell_x BETWEEN v_min_x AND v_max_x AND p.cell_y BETWEEN v_min_y AND v_max_y));
+                    END IF;
+                END LOOP;
+            END;
+            $BODY$;
+            CREATE OR REPLACE FUNCTION __arches_refresh_geojson_geometries(p_nodeid uuid = NULL)
+                RETURNS void
+                LANGUAGE plpgsql
+            AS $BODY$
+            BEGIN
+                DELETE FROM geojson_geometries WHERE p_nodeid IS NULL OR nodeid = p_nodeid;
+                INSERT INTO geojson_geometries (tileid, resourceinstanceid, nodeid, geom)
+                SELECT t.tileid, t.resourceinstanceid, n.nodeid, f.geom
+                FROM tiles t
+                    JOIN nodes n ON t.nodegroupid = n.nodegroupid,
+                    LATERAL __arches_geojson_feature_geometries(t.tiledata -> n.nodeid::text) f(geom)
+                WHERE n.datatype = 'geojson-feature-collection'
+                    AND (p_nodeid IS NULL OR n.nodeid = p_nodeid);
+
+                PERFORM __arches_refresh_geojson_clusters(n.nodeid)
+                FROM nodes n
+                WHERE n.datatype = 'geojson-feature-collection'
+                    AND (p_nodeid IS NULL OR n.nodeid = p_nodeid);
+            END;
+            $BODY$;
+
+            CREATE TABLE geojson_geometry_cluster_changes (
+                nodeid uuid NOT NULL,
+                extent geometry(Geometry, 3857) NOT NULL
+            );
+
+            CREATE OR REPLACE FUNCTION __arches_refresh_changed_geojson_clusters()
+                RETURNS trigger
+                LANGUAGE plpgsql
+            AS $BODY$
+            DECLARE
+                v_change record;
+            BEGIN
+                -- the first of these deferred triggers to fire in a transaction rebuilds the cells of every change
+                -- made in it, one refresh per node, and the rest find nothing left to do
+                FOR v_change IN
+                    WITH changes AS (
+                        DELETE FROM geojson_geometry_cluster_changes RETURNING nodeid, extent
+                    )
+                    SELECT nodeid, ST_SetSRID(ST_Extent(extent)::geometry, 3857) AS extent
+                    FROM changes
+                    GROUP BY nodeid
+                    ORDER BY nodeid
+                LOOP
+                    PERFORM __arches_refresh_geojson_clusters(v_change.nodeid, v_change.extent);
+                END LOOP;
+
+                RETURN NULL;
+            END;
+            $BODY$;
+
+            CREATE CONSTRAINT TRIGGER __arches_refresh_changed_geojson_clusters_trigger
+                AFTER INSERT ON geojson_geometry_cluster_changes
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW EXECUTE PROCEDURE __arches_refresh_changed_geojson_clusters();
+
+            CREATE OR REPLACE FUNCTION __arches_refresh_tile_geojson_geometries()
+                RETURNS trigger
+                LANGUAGE plpgsql
+            AS $BODY$
+            BEGIN
+                IF TG_OP = 'UPDATE'
+                    AND NEW.tiledata IS NOT DISTINCT FROM OLD.tiledata
+                    AND NEW.nodegroupid IS NOT DISTINCT FROM OLD.nodegroupid
+                    AND NEW.resourceinstanceid IS NOT DISTINCT FROM OLD.resourceinstanceid THEN
+                    RETURN NULL;
+                END IF;
+
+                -- the clusters of the cells that the old and new geometries were in are rebuilt when the transaction commits
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO geojson_geometry_cluster_changes (nodeid, extent)
+                    SELECT nodeid, ST_SetSRID(ST_Extent(geom)::geometry, 3857)
+                    FROM geojson_geometries
+                    WHERE tileid = OLD.tileid AND NOT ST_IsEmpty(geom)
+                    GROUP BY nodeid;
+
+                    DELETE FROM geojson_geometries WHERE tileid = OLD.tileid;
+                END IF;
+
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO geojson_geometries (tileid, resourceinstanceid, nodeid, geom)
+                    SELECT NEW.tileid, NEW.resourceinstanceid, n.nodeid, f.geom
+                    FROM nodes n,
+                        LATERAL __arches_geojson_feature_geometries(NEW.tiledata -> n.nodeid::text) f(geom)
+                    WHERE n.nodegroupid = NEW.nodegroupid
+                        AND n.datatype = 'geojson-feature-collection';
+
+                    INSERT INTO geojson_geometry_cluster_changes (nodeid, extent)
+                    SELECT nodeid, ST_SetSRID(ST_Extent(geom)::geometry, 3857)
+                    FROM geojson_geometries
+                    WHERE tileid = NEW.tileid AND NOT ST_IsEmpty(geom)
+                    GROUP BY nodeid;
+                END IF;
+
+                RETURN NULL;
+            END;
+            $BODY$;
+            SELECT __arches_refresh_geojson_clusters(nodeid) FROM nodes WHERE datatype = 'geojson-feature-collection';
+            """,
+            """
+            CREATE OR REPLACE FUNCTION __arches_refresh_geojson_geometries(p_nodeid uuid = NULL)
+                RETURNS void
+                LANGUAGE plpgsql
+            AS $BODY$
+            BEGIN
+                DELETE FROM geojson_geometries WHERE p_nodeid IS NULL OR nodeid = p_nodeid;
+                INSERT INTO geojson_geometries (tileid, resourceinstanceid, nodeid, geom)
+                SELECT t.tileid, t.resourceinstanceid, n.nodeid, f.geom
+                FROM tiles t
+                    JOIN nodes n ON t.nodegroupid = n.nodegroupid,
+                    LATERAL __arches_geojson_feature_geometries(t.tiledata -> n.nodeid::text) f(geom)
+                WHERE n.datatype = 'geojson-feature-collection'
+                    AND (p_nodeid IS NULL OR n.nodeid = p_nodeid);
+            END;
+            $BODY$;
+
+            CREATE OR REPLACE FUNCTION __arches_refresh_tile_geojson_geometries()
+                RETURNS trigger
+                LANGUAGE plpgsql
+            AS $BODY$
+            BEGIN
+                IF TG_OP = 'UPDATE'
+                    AND NEW.tiledata IS NOT DISTINCT FROM OLD.tiledata
+                    AND NEW.nodegroupid IS NOT DISTINCT FROM OLD.nodegroupid
+                    AND NEW.resourceinstanceid IS NOT DISTINCT FROM OLD.resourceinstanceid THEN
+                    RETURN NULL;
+                END IF;
+
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM geojson_geometries WHERE tileid = OLD.tileid;
+                END IF;
+
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO geojson_geometries (tileid, resourceinstanceid, nodeid, geom)
+                    SELECT NEW.tileid, NEW.resourceinstanceid, n.nodeid, f.geom
+                    FROM nodes n,
+                        LATERAL __arches_geojson_feature_geometries(NEW.tiledata -> n.nodeid::text) f(geom)
+                    WHERE n.nodegroupid = NEW.nodegroupid
+                        AND n.datatype = 'geojson-feature-collection';
+                END IF;
+
+                RETURN NULL;
+            END;
+            $BODY$;
+            DROP TABLE IF EXISTS geojson_geometry_cluster_changes;
+            DROP FUNCTION IF EXISTS __arches_refresh_changed_geojson_clusters();
+            DROP FUNCTION IF EXISTS __arches_refresh_geojson_clusters(uuid, geometry);
+            """,
+        ),
+    ]
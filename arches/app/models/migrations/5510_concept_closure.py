@@ -0,0 +1,65 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '5500_geojson_geometry_clusters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConceptClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(db_column='ancestorid', on_delete=django.db.models.deletion.CASCADE, related_name='closure_descendants', to='models.Concept')),
+                ('descendant', models.ForeignKey(db_column='descendantid', on_delete=django.db.models.deletion.CASCADE, related_name='closure_ancestors', to='models.Concept')),
+                ('relationtype', models.ForeignKey(db_column='relationtype', on_delete=django.db.models.deletion.CASCADE, to='models.DRelationType')),
+            ],
+            options={
+                'db_table': 'concept_closure',
+                'managed': True,
+                'unique_together': {('ancestor', 'descendant', 'relationtype')},
+            },
+        ),
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION __arches_refresh_concept_closure()
+                RETURNS void
+                LANGUAGE sql
+            AS $BODY$
+                DELETE FROM concept_closure;
+
+                -- paths stop at a concept they've already been through, so cycles in the relations can't recurse forever
+                WITH RECURSIVE hierarchy AS (
+                    SELECT conceptidfrom, conceptidto,
+                        CASE WHEN relationtype = 'member' THEN 'member' ELSE 'narrower' END AS relationtype
+                    FROM relations
+                    WHERE relationtype IN ('narrower', 'hasTopConcept', 'member')
+                ),
+                paths AS (
+                    SELECT conceptidfrom AS ancestorid, conceptidto AS descendantid, relationtype, 1 AS depth,
+                        ARRAY[conceptidfrom, conceptidto] AS path
+                    FROM hierarchy
+                    WHERE conceptidfrom <> conceptidto
+                    UNION ALL
+                    SELECT p.ancestorid, h.conceptidto, p.relationtype, p.depth + 1, p.path || h.conceptidto
+                    FROM paths p
+                        JOIN hierarchy h ON h.conceptidfrom = p.descendantid AND h.relationtype = p.relationtype
+                    WHERE NOT h.conceptidto = ANY(p.path)
+                )
+                INSERT INTO concept_closure (ancestorid, descendantid, relationtype, depth)
+                SELECT ancestorid, descendantid, relationtype, min(depth)
+                FROM paths
+                GROUP BY ancestorid, descendantid, relationtype;
+            $BODY$;
+
+            SELECT __arches_refresh_concept_closure();
+            """,
+            """
+            DROP FUNCTION IF EXISTS __arches_refresh_concept_closure();
+            """,
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '5510_concept_closure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexqueue',
+            name='claimed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
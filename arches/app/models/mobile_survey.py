@@ -347,14 +347,25 @@ class MobileSurvey(models.MobileSurveyModel):
                             db.compact()
 
     def append_to_instances(self, request, instances, resource_type_id):
-        search_res_json = search.search_results(request)
-        search_res = JSONDeserializer().deserialize(search_res_json.content)
+        # the results are read a page at a time with search_after, so the requested count
+        # isn't limited by the number of results a single search can return
+        count = int(self.datadownloadconfig['count'])
+        request.GET['search_after'] = ''
         try:
-            for hit in search_res['results']['hits']['hits']:
-                if hit['_source']['graph_id'] == resource_type_id and len(list(instances)) < int(self.datadownloadconfig['count']):
-                    instances[hit['_source']['resourceinstanceid']] = hit['_source']
+            while len(instances) < count:
+                search_res_json = search.search_results(request)
+                search_res = JSONDeserializer().deserialize(search_res_json.content)
+                for hit in search_res['results']['hits']['hits']:
+                    if hit['_source']['graph_id'] == resource_type_id and len(instances) < count:
+                        instances[hit['_source']['resourceinstanceid']] = hit['_source']
+                paginator = search_res['paging-filter']['paginator']
+                if not paginator['has_next']:
+                    break
+                request.GET['search_after'] = json.dumps(paginator['search_after'])
         except Exception as e:
             print(e)
+        finally:
+            del request.GET['search_after']
 
     def collect_resource_instances_for_couch(self):
         """
@@ -18,7 +18,7 @@ from datetime import timedelta
 from arches.app.utils.module_importer import get_class_from_modulename
 from django.forms.models import model_to_dict
 from django.contrib.gis.db import models
-from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.fields import ArrayField, JSONField
 from django.core.files.storage import FileSystemStorage
 from django.core.validators import RegexValidator
 from django.db.models import Q, Max
@@ -129,6 +129,31 @@ class Concept(models.Model):
         managed = True
         db_table = 'concepts'
 
+
+class ConceptClosure(models.Model):
+    """
+    Every ancestor and descendant pair of the concept hierarchies (the transitive closure of the relations table)
+    with the length of the shortest path between them
+
+    relationtype is 'narrower' for the hierarchy of narrower and hasTopConcept relations
+    and 'member' for the hierarchy of collection members
+
+    The table is kept up to date as relations are saved and deleted (see concept_closure.py)
+    and can be rebuilt with "python manage.py concepts rebuild_closure"
+
+    """
+
+    ancestor = models.ForeignKey(Concept, db_column='ancestorid', related_name='closure_descendants', on_delete=models.CASCADE)
+    descendant = models.ForeignKey(Concept, db_column='descendantid', related_name='closure_ancestors', on_delete=models.CASCADE)
+    relationtype = models.ForeignKey('DRelationType', db_column='relationtype', on_delete=models.CASCADE)
+    depth = models.IntegerField()
+
+    class Meta:
+        managed = True
+        db_table = 'concept_closure'
+        unique_together = (('ancestor', 'descendant', 'relationtype'),)
+
+
 class DDataType(models.Model):
     datatype = models.TextField(primary_key=True)
     iconclass = models.TextField()
@@ -413,6 +438,54 @@ class GraphModel(models.Model):
         db_table = 'graphs'
 
 
+class GeoJSONGeometry(models.Model):
+    """
+    One row per feature of the geojson-feature-collection nodes in the tiles table, projected to web mercator
+
+    The table is maintained by a trigger on tiles (see migration 5490_geojson_geometries)
+    and read by the MVT api, rebuild it with "python manage.py geometries backfill"
+
+    """
+
+    # rows are removed by the trigger when their tile is deleted, which needs to see them to update the clusters
+    tile = models.ForeignKey('TileModel', db_column='tileid', on_delete=models.DO_NOTHING)
+    resourceinstance = models.ForeignKey('ResourceInstance', db_column='resourceinstanceid', on_delete=models.DO_NOTHING)
+    node = models.ForeignKey('Node', db_column='nodeid', on_delete=models.CASCADE)
+    geom = models.GeometryField(srid=3857)
+
+    class Meta:
+        managed = True
+        db_table = 'geojson_geometries'
+
+
+class GeoJSONGeometryCluster(models.Model):
+    """
+    The point clusters drawn by the MVT api at zoom levels up to a node's clusterMaxZoom
+
+    Geometries are grouped by the grid cell (clusterDistance pixels square) that their centroid falls in,
+    each cell is split into four at the next zoom level so the cells of a zoom level are built from those below it.
+    Cells with fewer than clusterMinPoints geometries list the ids of their geojson_geometries (members)
+    and those geometries are drawn instead of a cluster
+
+    The table is maintained by the same trigger as geojson_geometries
+
+    """
+
+    node = models.ForeignKey('Node', db_column='nodeid', on_delete=models.CASCADE)
+    zoom = models.IntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    total = models.IntegerField()
+    geom = models.PointField(srid=3857)
+    extent = models.GeometryField(srid=3857)
+    members = ArrayField(models.IntegerField(), null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'geojson_geometry_clusters'
+        unique_together = (('node', 'zoom', 'cell_x', 'cell_y'),)
+
+
 class Icon(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.TextField(blank=True, null=True)
@@ -423,6 +496,18 @@ class Icon(models.Model):
         db_table = 'icons'
 
 
+class IndexQueue(models.Model):
+    indexqueueid = models.BigAutoField(primary_key=True)
+    resourceinstanceid = models.UUIDField()
+    created = models.DateTimeField(auto_now_add=True)
+    claimed = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'index_queue'
+        indexes = [models.Index(fields=['resourceinstanceid'], name='index_queue_resourceid_idx')]
+
+
 class NodeGroup(models.Model):
     nodegroupid = models.UUIDField(primary_key=True, default=uuid.uuid1)  # This field type is a guess.
     legacygroupid = models.TextField(blank=True, null=True)
@@ -931,18 +1016,18 @@ class UserProfile(models.Model):
 
     @property
     def viewable_nodegroups(self):
-        from arches.app.utils.permission_backend import get_nodegroups_by_perm
-        return set(str(nodegroup.pk) for nodegroup in get_nodegroups_by_perm(self.user, ['models.read_nodegroup'], any_perm=True))
+        from arches.app.utils.permission_backend import get_nodegroup_permissions
+        return set(get_nodegroup_permissions(self.user).readable)
 
     @property
     def editable_nodegroups(self):
-        from arches.app.utils.permission_backend import get_nodegroups_by_perm
-        return set(str(nodegroup.pk) for nodegroup in get_nodegroups_by_perm(self.user, ['models.write_nodegroup'], any_perm=True))
+        from arches.app.utils.permission_backend import get_nodegroup_permissions
+        return set(get_nodegroup_permissions(self.user).writable)
 
     @property
     def deletable_nodegroups(self):
-        from arches.app.utils.permission_backend import get_nodegroups_by_perm
-        return set(str(nodegroup.pk) for nodegroup in get_nodegroups_by_perm(self.user, ['models.delete_nodegroup'], any_perm=True))
+        from arches.app.utils.permission_backend import get_nodegroup_permissions
+        return set(get_nodegroup_permissions(self.user).deletable)
 
     class Meta:
         managed = True
@@ -22,19 +22,24 @@ import datetime
 from pprint import pprint
 from time import time
 from uuid import UUID
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Q
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Q
 from django.utils.translation import ugettext as _
 from arches.app.models import models
 from arches.app.models.models import EditLog
 from arches.app.models.models import TileModel
 from arches.app.models.concept import get_preflabel_from_valueid
+from arches.app.models.concept_labels import concept_labels
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.models.system_settings import settings
 from arches.app.search.search_engine_factory import SearchEngineFactory
-from arches.app.search.elasticsearch_dsl_builder import Query, Bool, Terms
+from arches.app.search.elasticsearch_dsl_builder import Aggregation, Query, Bool, Terms
 from arches.app.utils import import_class_from_string
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
+from arches.app.utils import mvt
+from arches.app.utils.index_queue import queue_resource
+from arches.app.utils.data_management.resources import copy_loader
 from arches.app.utils.exceptions import (
     InvalidNodeNameException,
     MultipleNodesFoundException,
@@ -42,6 +47,57 @@ from arches.app.utils.exceptions import (
 from arches.app.datatypes.datatypes import DataTypeFactory
 
 
+# replaces the values (and the copy of the tile) a single tile contributes to a resource document,
+# leaving the document untouched if any of its values aren't tagged with a tileid
+TILE_UPDATE_SCRIPT = """
+    boolean tagged = true;
+    for (field in params.values.keySet()) {
+        if (ctx._source[field] != null) {
+            for (value in ctx._source[field]) {
+                if (!value.containsKey('tileid')) {
+                    tagged = false;
+                }
+            }
+        }
+    }
+    if (tagged) {
+        String tileid = params.tileid;
+        for (field in params.values.keySet()) {
+            if (ctx._source[field] == null) {
+                ctx._source[field] = [];
+            }
+            ctx._source[field].removeIf(value -> tileid.equals(value.tileid));
+            ctx._source[field].addAll(params.values[field]);
+        }
+        if (ctx._source.tiles == null) {
+            ctx._source.tiles = [];
+        }
+        ctx._source.tiles.removeIf(tile -> tileid.equals(tile.tileid));
+        if (params.tile != null) {
+            ctx._source.tiles.add(params.tile);
+        }
+        ctx._source.provisional_resource = params.provisional_resource;
+        ctx._source.displayname = params.displayname;
+        ctx._source.displaydescription = params.displaydescription;
+        ctx._source.map_popup = params.map_popup;
+    } else {
+        ctx.op = 'noop';
+    }
+"""
+
+# the nested arrays of a resource document that hold values taken from its tiles
+INDEXED_VALUE_FIELDS = (
+    "strings",
+    "dates",
+    "domains",
+    "geometries",
+    "points",
+    "numbers",
+    "date_ranges",
+    "ids",
+)
+
+
 class Resource(models.ResourceInstance):
     class Meta:
         proxy = True
@@ -56,17 +112,76 @@ class Resource(models.ResourceInstance):
         self.tiles = []
 
     def get_descriptor(self, descriptor):
+        return self.get_descriptors()[descriptor]
+
+    def get_descriptors(self):
+        """
+        Returns a dictionary of this resource's "name", "description" and "map_popup" descriptors
+
+        """
+
+        return Resource.get_descriptors_in_bulk([self])[str(self.resourceinstanceid)]
+
+    @classmethod
+    def get_descriptors_in_bulk(cls, resources, tiles=None, datatype_factory=None):
+        """
+        Renders the "name", "description" and "map_popup" descriptors of many resources,
+        using the descriptor cache where possible and caching the newly rendered ones
+        returns a dictionary of descriptor dictionaries keyed to resourceinstanceid
+
+        Arguments:
+        resources -- a list of resource instances
+
+        Keyword Arguments:
+        tiles -- a dictionary of already loaded tile lists keyed to resourceinstanceid,
+            the tiles of any resource not in the dictionary are fetched in a single query
+
+        """
+
         module = importlib.import_module("arches.app.functions.primary_descriptors")
         PrimaryDescriptorsFunction = getattr(module, "PrimaryDescriptorsFunction")()
-        functionConfig = models.FunctionXGraph.objects.filter(
-            graph_id=self.graph_id, function__functiontype="primarydescriptors"
-        )
-        if len(functionConfig) == 1:
-            return PrimaryDescriptorsFunction.get_primary_descriptor_from_nodes(
-                self, functionConfig[0].config[descriptor]
+        prefixes = {}
+        for resource in resources:
+            if resource.graph_id not in prefixes:
+                prefixes[resource.graph_id] = PrimaryDescriptorsFunction.get_cache_key_prefix(resource.graph_id)
+        keys = {
+            str(resource.resourceinstanceid): PrimaryDescriptorsFunction.get_cache_key(
+                resource.graph_id, resource.resourceinstanceid, prefix=prefixes[resource.graph_id]
             )
-        else:
-            return "undefined"
+            for resource in resources
+        }
+        cached = cache.get_many(list(keys.values()))
+        ret = {
+            resourceid: cached[key] for resourceid, key in keys.items() if key in cached
+        }
+
+        uncached = [
+            resource
+            for resource in resources
+            if str(resource.resourceinstanceid) not in ret
+        ]
+        if len(uncached) > 0:
+            tiles = {} if tiles is None else {str(k): v for k, v in tiles.items()}
+            unloaded = [
+                resource.resourceinstanceid
+                for resource in uncached
+                if str(resource.resourceinstanceid) not in tiles
+            ]
+            if len(unloaded) > 0:
+                tiles.update(Resource.get_tiles_by_resource(unloaded))
+            if datatype_factory is None:
+                datatype_factory = DataTypeFactory()
+
+            rendered = {}
+            for resource in uncached:
+                resourceid = str(resource.resourceinstanceid)
+                ret[resourceid] = PrimaryDescriptorsFunction.get_descriptors_from_tiles(
+                    resource.graph_id, tiles.get(resourceid, []), datatype_factory
+                )
+                rendered[keys[resourceid]] = ret[resourceid]
+            cache.set_many(rendered)
+
+        return ret
 
     @property
     def displaydescription(self):
@@ -123,14 +238,7 @@ class Resource(models.ResourceInstance):
         Finds and returns the ontology class of the instance's root node
 
         """
-        root_ontology_class = None
-        graph_nodes = models.Node.objects.filter(graph_id=self.graph_id).filter(
-            istopnode=True
-        )
-        if len(graph_nodes) > 0:
-            root_ontology_class = graph_nodes[0].ontologyclass
-
-        return root_ontology_class
+        return graph_metadata.get(self.graph_id).root_ontology_class
 
     def load_tiles(self):
         """
@@ -151,6 +259,7 @@ class Resource(models.ResourceInstance):
     def bulk_save(resources, primaryDescriptorsFunctionConfig, graph_nodes):
         """
         Saves and indexes a list of resources
+        if settings.BULK_IMPORT_USE_COPY is True the resources are written with COPY and aren't indexed
 
         Arguments:
         resources -- a list of resource models
@@ -162,12 +271,9 @@ class Resource(models.ResourceInstance):
 
         se = SearchEngineFactory().create()
         datatype_factory = DataTypeFactory()
-        node_datatypes = {
-            str(nodeid): datatype
-            for nodeid, datatype in models.Node.objects.values_list(
-                "nodeid", "datatype"
-            )
-        }
+        node_datatypes = graph_metadata.get_node_datatypes(
+            [resource.graph_id for resource in resources]
+        )
         tiles = []
         documents = []
         term_list = []
@@ -181,6 +287,14 @@ class Resource(models.ResourceInstance):
         print("time to extend tiles: %s" % datetime.timedelta(seconds=time() - start))
         start = time()
 
+        if settings.BULK_IMPORT_USE_COPY:
+            copy_loader.load_resources(resources)
+            print(
+                "time to copy %s resources and %s tiles to db: %s (not indexed)"
+                % (len(resources), len(tiles), datetime.timedelta(seconds=time() - start))
+            )
+            return
+
         # need to save the models first before getting the documents for index
         Resource.objects.bulk_create(resources)
         TileModel.objects.bulk_create(tiles)
@@ -204,49 +318,29 @@ class Resource(models.ResourceInstance):
         )
         start = time()
 
-        time_to_get_docs = 0
-        time_to_get_root_ontology = 0
-        time_to_create_bulk_docs = 0
-        time_to_create_bulk_term_docs = 0
-        timers = {"timer": 0, "timer1": 0, "timer2": 0, "timer3": 0, "timer4": 0}
-        for resource in resources:
-            s = time()
-            document, terms = resource.get_documents_to_index(
-                fetchTiles=False,
-                datatype_factory=datatype_factory,
-                node_datatypes=node_datatypes,
-                config=primaryDescriptorsFunctionConfig,
-                graph_nodes=graph_nodes,
-            )
-            time_to_get_docs = time_to_get_docs + (time() - s)
-            # s = time()
-            # #document['root_ontology_class'] = resource.get_root_ontology()
-            # time_to_get_root_ontology = time_to_get_root_ontology + (time()-s)
-            s = time()
+        resource_documents, resource_terms = Resource.get_documents_to_index_in_bulk(
+            resources,
+            fetchTiles=False,
+            datatype_factory=datatype_factory,
+            node_datatypes=node_datatypes,
+            config=primaryDescriptorsFunctionConfig,
+            graph_nodes=graph_nodes,
+        )
+        for document in resource_documents:
             documents.append(
                 se.create_bulk_item(
                     index="resources", id=document["resourceinstanceid"], data=document
                 )
             )
-            time_to_create_bulk_docs = time_to_create_bulk_docs + (time() - s)
-            s = time()
-            for term in terms:
-                term_list.append(
-                    se.create_bulk_item(
-                        index="terms", id=term["_id"], data=term["_source"]
-                    )
-                )
-            time_to_create_bulk_term_docs = time_to_create_bulk_term_docs + (time() - s)
-
-        # print("timer: %s" % datetime.timedelta(seconds=timers['timer'])
-        # print("timer1: %s" % datetime.timedelta(seconds=timers['timer1'])
-        # print("timer2: %s" % datetime.timedelta(seconds=timers['timer2'])
-        # print("timer3: %s" % datetime.timedelta(seconds=timers['timer3'])
-        # print("timer4: %s" % datetime.timedelta(seconds=timers['timer4'])
-        # print("time to get documents to index: %s" % datetime.timedelta(seconds=time_to_get_docs)
-        # print("time to get root ontology: %s" % datetime.timedelta(seconds=time_to_get_root_ontology)
-        # print("time to create bulk docs: %s" % datetime.timedelta(seconds=time_to_create_bulk_docs)
-        # print("time to create bulk term docs: %s" % datetime.timedelta(seconds=time_to_create_bulk_term_docs)
+        for term in resource_terms:
+            term_list.append(
+                se.create_bulk_item(index="terms", id=term["_id"], data=term["_source"])
+            )
+
+        print(
+            "time to get documents to index: %s"
+            % datetime.timedelta(seconds=time() - start)
+        )
         start = time()
 
         if not settings.STREAMLINE_IMPORT:
@@ -268,25 +362,222 @@ class Resource(models.ResourceInstance):
     def index(self):
         """
         Indexes all the nessesary items values of a resource to support search
+        if settings.INDEXING_QUEUE is True the resource is queued to be indexed by a celery worker instead
 
         """
-        if str(self.graph_id) != str(settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
+        if settings.INDEXING_QUEUE is True:
+            queue_resource(self.resourceinstanceid)
+        elif str(self.graph_id) != str(settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
             se = SearchEngineFactory().create()
             datatype_factory = DataTypeFactory()
-            node_datatypes = {
-                str(nodeid): datatype
-                for nodeid, datatype in models.Node.objects.values_list(
-                    "nodeid", "datatype"
-                )
-            }
+            node_datatypes = graph_metadata.get(self.graph_id).node_datatypes
             document, terms = self.get_documents_to_index(
                 datatype_factory=datatype_factory, node_datatypes=node_datatypes
             )
             document["root_ontology_class"] = self.get_root_ontology()
             doc = JSONSerializer().serializeToPython(document)
-            se.index_data(index="resources", body=doc, id=self.pk)
+            items = [se.create_bulk_item(index="resources", id=str(self.pk), data=doc)]
             for term in terms:
-                se.index_data("terms", body=term["_source"], id=term["_id"])
+                items.append(
+                    se.create_bulk_item(index="terms", id=term["_id"], data=term["_source"])
+                )
+            se.bulk_index(items)
+
+    def index_tile(self, tileid, tile=None):
+        """
+        Updates this resource's search document and terms with the changes made to a single tile,
+        replacing only that tile's values rather than rebuilding the document from every tile
+
+        Falls back to reindexing the whole resource if its document hasn't been indexed yet
+        or was indexed before its values were tagged with the tiles they came from
+
+        Arguments:
+        tileid -- the id of the tile that was saved or deleted
+
+        Keyword Arguments:
+        tile -- the saved tile, or None if the tile has been deleted
+
+        """
+
+        if settings.INDEXING_QUEUE is True:
+            queue_resource(self.resourceinstanceid)
+        elif str(self.graph_id) != str(settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
+            se = SearchEngineFactory().create()
+            if tile is None:
+                values = {field: [] for field in INDEXED_VALUE_FIELDS}
+                terms = []
+            else:
+                values, terms = Resource.get_tile_index_values(
+                    tile,
+                    DataTypeFactory(),
+                    graph_metadata.get(self.graph_id).node_datatypes,
+                )
+
+            query = Query(se)
+            bool_query = Bool()
+            bool_query.filter(Terms(field="tileid", terms=[tileid]))
+            query.add_query(bool_query)
+            query.delete(index="terms")
+
+            descriptors = self.get_descriptors()
+            params = JSONSerializer().serializeToPython(
+                {
+                    "tileid": tileid,
+                    "tile": None if tile is None else JSONSerializer().handle_model(tile),
+                    "values": {field: values[field] for field in INDEXED_VALUE_FIELDS},
+                    "provisional_resource": self.get_provisional_status(),
+                    "displayname": descriptors["name"],
+                    "displaydescription": descriptors["description"],
+                    "map_popup": descriptors["map_popup"],
+                }
+            )
+            response = se.update_data(
+                index="resources",
+                id=str(self.resourceinstanceid),
+                body={
+                    "script": {
+                        "source": TILE_UPDATE_SCRIPT,
+                        "lang": "painless",
+                        "params": params,
+                    }
+                },
+            )
+            if response is None or response["result"] == "noop":
+                self.index()
+            elif len(terms) > 0:
+                se.bulk_index(
+                    [
+                        se.create_bulk_item(
+                            index="terms", id=term["_id"], data=term["_source"]
+                        )
+                        for term in terms
+                    ]
+                )
+
+    @staticmethod
+    def get_tile_index_values(tile, datatype_factory, node_datatypes):
+        """
+        Gets the values a single tile contributes to its resource's document
+        returns a tuple of a partial document and a list of terms
+
+        Arguments:
+        tile -- the tile to get values from
+        datatype_factory -- refernce to the DataTypeFactory instance
+        node_datatypes -- a dictionary of datatypes keyed to node ids
+
+        """
+
+        document = {field: [] for field in INDEXED_VALUE_FIELDS}
+        document["tiles"] = [tile]
+        document["provisional_resource"] = "false"
+        terms = []
+        Resource.append_tile_to_document(
+            document, terms, tile, datatype_factory, node_datatypes
+        )
+        return document, terms
+
+    def get_provisional_status(self):
+        """
+        Returns "true" if none of this resource's tiles have authoritative data,
+        "partial" if some of its tiles have provisional edits, otherwise "false"
+
+        """
+
+        tiles = models.TileModel.objects.filter(
+            resourceinstance_id=self.resourceinstanceid
+        )
+        if not tiles.exclude(data={}).exists():
+            return "true"
+        if tiles.filter(provisionaledits__isnull=False).exclude(provisionaledits={}).exists():
+            return "partial"
+        return "false"
+
+    @staticmethod
+    def get_tiles_by_resource(resourceids):
+        """
+        Fetches the tiles of many resources with a single query
+        returns a dictionary of tile lists keyed to resourceinstanceid
+
+        Arguments:
+        resourceids -- a list of resourceinstanceids
+
+        """
+
+        tiles = {}
+        for tile in models.TileModel.objects.filter(
+            resourceinstance_id__in=resourceids
+        ):
+            tiles.setdefault(str(tile.resourceinstance_id), []).append(tile)
+        return tiles
+
+    @classmethod
+    def get_documents_to_index_in_bulk(
+        cls,
+        resources,
+        fetchTiles=True,
+        datatype_factory=None,
+        node_datatypes=None,
+        config=None,
+        graph_nodes=None,
+    ):
+        """
+        Gets all the documents nessesary to index a batch of resources
+        returns a tuple of a list of documents and a list of terms
+
+        Arguments:
+        resources -- a list of resource instances or resourceinstanceids
+
+        Keyword Arguments:
+        fetchTiles -- instead of fetching the tiles from the database (in one query
+            for the whole batch) get them off the models themselves
+        datatype_factory -- refernce to the DataTypeFactory instance
+        node_datatypes -- a dictionary of datatypes keyed to node ids
+
+        """
+
+        resources = list(resources)
+        resourceids = [r for r in resources if not isinstance(r, Resource)]
+        if len(resourceids) > 0:
+            resources = [r for r in resources if isinstance(r, Resource)]
+            resources.extend(cls.objects.filter(resourceinstanceid__in=resourceids))
+
+        if datatype_factory is None:
+            datatype_factory = DataTypeFactory()
+        if node_datatypes is None:
+            node_datatypes = graph_metadata.get_node_datatypes(
+                [resource.graph_id for resource in resources]
+            )
+        if fetchTiles:
+            tiles = Resource.get_tiles_by_resource(
+                [resource.resourceinstanceid for resource in resources]
+            )
+            for resource in resources:
+                resource.tiles = tiles.get(str(resource.resourceinstanceid), [])
+
+        # the descriptors of the whole batch are read from (and written to) the cache at once
+        descriptors = {}
+        if not settings.STREAMLINE_IMPORT:
+            descriptors = Resource.get_descriptors_in_bulk(
+                resources,
+                tiles={str(resource.resourceinstanceid): resource.tiles for resource in resources},
+                datatype_factory=datatype_factory,
+            )
+
+        documents = []
+        terms = []
+        for resource in resources:
+            document, resource_terms = resource.get_documents_to_index(
+                fetchTiles=False,
+                datatype_factory=datatype_factory,
+                node_datatypes=node_datatypes,
+                config=config,
+                graph_nodes=graph_nodes,
+                descriptors=descriptors.get(str(resource.resourceinstanceid)),
+            )
+            documents.append(document)
+            terms.extend(resource_terms)
+
+        return documents, terms
 
     def get_documents_to_index(
         self,
@@ -295,6 +586,7 @@ class Resource(models.ResourceInstance):
         node_datatypes=None,
         config=None,
         graph_nodes=None,
+        descriptors=None,
     ):
         """
         Gets all the documents nessesary to index a single resource
@@ -304,6 +596,7 @@ class Resource(models.ResourceInstance):
         fetchTiles -- instead of fetching the tiles from the database get them off the model itself
         datatype_factory -- refernce to the DataTypeFactory instance
         node_datatypes -- a dictionary of datatypes keyed to node ids
+        descriptors -- this resource's already rendered descriptors (see get_descriptors_in_bulk)
 
         """
 
@@ -313,13 +606,17 @@ class Resource(models.ResourceInstance):
             document = {}
             document["displaydescription"] = None
             document["resourceinstanceid"] = str(self.resourceinstanceid)
-            document["graph_id"] = str(self.graph.pk)
+            document["graph_id"] = str(self.graph_id)
             document["map_popup"] = None
             document["displayname"] = None
             document["root_ontology_class"] = self.get_root_ontology()
             document["legacyid"] = self.legacyid
         else:
-            document = JSONSerializer().serializeToPython(self)
+            document = JSONSerializer().serializeToPython(
+                JSONSerializer().handle_model(
+                    self, exclude=["displayname", "displaydescription", "map_popup"]
+                )
+            )
         # timers['timer4'] = timers['timer4'] + (time()-s)
 
         tiles = (
@@ -327,6 +624,16 @@ class Resource(models.ResourceInstance):
             if fetchTiles
             else self.tiles
         )
+        if not settings.STREAMLINE_IMPORT:
+            if descriptors is None:
+                descriptors = Resource.get_descriptors_in_bulk(
+                    [self],
+                    tiles={str(self.resourceinstanceid): tiles},
+                    datatype_factory=datatype_factory,
+                )[str(self.resourceinstanceid)]
+            document["displayname"] = descriptors["name"]
+            document["displaydescription"] = descriptors["description"]
+            document["map_popup"] = descriptors["map_popup"]
         document["tiles"] = tiles
         document["strings"] = []
         document["dates"] = []
@@ -343,116 +650,155 @@ class Resource(models.ResourceInstance):
         terms = []
 
         for tile in document["tiles"]:
-            for nodeid, nodevalue in tile.data.items():
-                datatype = node_datatypes[nodeid]
-                if (
-                    nodevalue != ""
-                    and nodevalue != []
-                    and nodevalue != {}
-                    and nodevalue is not None
-                ):
-                    s = time()
-                    datatype_instance = datatype_factory.get_instance(datatype)
-                    # timers['timer'] = timers['timer'] + (time()-s)
-
-                    if config is not None and str(tile.nodegroup_id) in config:
-                        if "name" in config[tile.nodegroup_id]:
-                            node = graph_nodes[nodeid]
-                            value = datatype_instance.get_display_value(tile, node)
-                            if document["displayname"] is None:
-                                document["displayname"] = config[tile.nodegroup_id][
-                                    "name"
-                                ]
-                            document["displayname"] = document["displayname"].replace(
-                                "<%s>" % node.name, value
-                            )
-                        if "description" in config[tile.nodegroup_id]:
-                            node = graph_nodes[nodeid]
-                            value = datatype_instance.get_display_value(tile, node)
-                            if document["displaydescription"] is None:
-                                document["displaydescription"] = config[
-                                    tile.nodegroup_id
-                                ]["description"]
-                            document["displaydescription"] = document[
-                                "displaydescription"
-                            ].replace("<%s>" % node.name, value)
-                        if "map_popup" in config[tile.nodegroup_id]:
-                            node = graph_nodes[nodeid]
-                            value = datatype_instance.get_display_value(tile, node)
-                            if document["map_popup"] is None:
-                                document["map_popup"] = config[tile.nodegroup_id][
-                                    "map_popup"
-                                ]
-                            document["map_popup"] = document["map_popup"].replace(
-                                "<%s>" % node.name, value
-                            )
-                    s = time()
-                    datatype_instance.append_to_document(
-                        document, nodevalue, nodeid, tile
-                    )
-                    # timers['timer1'] = timers['timer1'] + (time()-s)
-                    s = time()
-                    node_terms = datatype_instance.get_search_terms(nodevalue, nodeid)
-                    # timers['timer2'] = timers['timer2'] + (time()-s)
-                    s = time()
-                    for index, term in enumerate(node_terms):
-                        terms.append(
-                            {
-                                "_id": str(nodeid) + str(tile.tileid) + str(index),
-                                "_source": {
-                                    "value": term,
-                                    "nodeid": nodeid,
-                                    "nodegroupid": tile.nodegroup_id,
-                                    "tileid": tile.tileid,
-                                    "resourceinstanceid": tile.resourceinstance_id,
-                                    "provisional": False,
-                                },
-                            }
+            Resource.append_tile_to_document(
+                document,
+                terms,
+                tile,
+                datatype_factory,
+                node_datatypes,
+                config=config,
+                graph_nodes=graph_nodes,
+            )
+
+        return document, terms
+
+    @staticmethod
+    def append_tile_to_document(
+        document,
+        terms,
+        tile,
+        datatype_factory,
+        node_datatypes,
+        config=None,
+        graph_nodes=None,
+    ):
+        """
+        Adds the values and search terms of a single tile to a resource document
+        every value added to the document is tagged with the id of the tile it came from
+
+        Arguments:
+        document -- the resource document being built
+        terms -- the list of terms being built
+        tile -- the tile to add
+        datatype_factory -- refernce to the DataTypeFactory instance
+        node_datatypes -- a dictionary of datatypes keyed to node ids
+
+        """
+
+        counts = {field: len(document[field]) for field in INDEXED_VALUE_FIELDS}
+
+        for nodeid, nodevalue in tile.data.items():
+            datatype = node_datatypes[nodeid]
+            if (
+                nodevalue != ""
+                and nodevalue != []
+                and nodevalue != {}
+                and nodevalue is not None
+            ):
+                s = time()
+                datatype_instance = datatype_factory.get_instance(datatype)
+                # timers['timer'] = timers['timer'] + (time()-s)
+
+                if config is not None and str(tile.nodegroup_id) in config:
+                    if "name" in config[tile.nodegroup_id]:
+                        node = graph_nodes[nodeid]
+                        value = datatype_instance.get_display_value(tile, node)
+                        if document["displayname"] is None:
+                            document["displayname"] = config[tile.nodegroup_id][
+                                "name"
+                            ]
+                        document["displayname"] = document["displayname"].replace(
+                            "<%s>" % node.name, value
                         )
-                    # timers['timer3'] = timers['timer3'] + (time()-s)
-
-            if tile.provisionaledits is not None:
-                provisionaledits = tile.provisionaledits
-                if len(provisionaledits) > 0:
-                    if document["provisional_resource"] == "false":
-                        document["provisional_resource"] = "partial"
-                    for user, edit in provisionaledits.items():
-                        if edit["status"] == "review":
-                            for nodeid, nodevalue in edit["value"].items():
-                                datatype = node_datatypes[nodeid]
-                                if (
-                                    nodevalue != ""
-                                    and nodevalue != []
-                                    and nodevalue != {}
-                                    and nodevalue is not None
-                                ):
-                                    datatype_instance = datatype_factory.get_instance(
-                                        datatype
-                                    )
-                                    datatype_instance.append_to_document(
-                                        document, nodevalue, nodeid, tile, True
-                                    )
-                                    node_terms = datatype_instance.get_search_terms(
-                                        nodevalue, nodeid
+                    if "description" in config[tile.nodegroup_id]:
+                        node = graph_nodes[nodeid]
+                        value = datatype_instance.get_display_value(tile, node)
+                        if document["displaydescription"] is None:
+                            document["displaydescription"] = config[
+                                tile.nodegroup_id
+                            ]["description"]
+                        document["displaydescription"] = document[
+                            "displaydescription"
+                        ].replace("<%s>" % node.name, value)
+                    if "map_popup" in config[tile.nodegroup_id]:
+                        node = graph_nodes[nodeid]
+                        value = datatype_instance.get_display_value(tile, node)
+                        if document["map_popup"] is None:
+                            document["map_popup"] = config[tile.nodegroup_id][
+                                "map_popup"
+                            ]
+                        document["map_popup"] = document["map_popup"].replace(
+                            "<%s>" % node.name, value
+                        )
+                s = time()
+                datatype_instance.append_to_document(
+                    document, nodevalue, nodeid, tile
+                )
+                # timers['timer1'] = timers['timer1'] + (time()-s)
+                s = time()
+                node_terms = datatype_instance.get_search_terms(nodevalue, nodeid)
+                # timers['timer2'] = timers['timer2'] + (time()-s)
+                s = time()
+                for index, term in enumerate(node_terms):
+                    terms.append(
+                        {
+                            "_id": str(nodeid) + str(tile.tileid) + str(index),
+                            "_source": {
+                                "value": term,
+                                "nodeid": nodeid,
+                                "nodegroupid": tile.nodegroup_id,
+                                "tileid": tile.tileid,
+                                "resourceinstanceid": tile.resourceinstance_id,
+                                "provisional": False,
+                            },
+                        }
+                    )
+                # timers['timer3'] = timers['timer3'] + (time()-s)
+
+        if tile.provisionaledits is not None:
+            provisionaledits = tile.provisionaledits
+            if len(provisionaledits) > 0:
+                if document["provisional_resource"] == "false":
+                    document["provisional_resource"] = "partial"
+                for user, edit in provisionaledits.items():
+                    if edit["status"] == "review":
+                        for nodeid, nodevalue in edit["value"].items():
+                            datatype = node_datatypes[nodeid]
+                            if (
+                                nodevalue != ""
+                                and nodevalue != []
+                                and nodevalue != {}
+                                and nodevalue is not None
+                            ):
+                                datatype_instance = datatype_factory.get_instance(
+                                    datatype
+                                )
+                                datatype_instance.append_to_document(
+                                    document, nodevalue, nodeid, tile, True
+                                )
+                                node_terms = datatype_instance.get_search_terms(
+                                    nodevalue, nodeid
+                                )
+                                for index, term in enumerate(node_terms):
+                                    terms.append(
+                                        {
+                                            "_id": str(nodeid)
+                                            + str(tile.tileid)
+                                            + str(index),
+                                            "_source": {
+                                                "value": term,
+                                                "nodeid": nodeid,
+                                                "nodegroupid": tile.nodegroup_id,
+                                                "tileid": tile.tileid,
+                                                "resourceinstanceid": tile.resourceinstance_id,
+                                                "provisional": True,
+                                            },
+                                        }
                                     )
-                                    for index, term in enumerate(node_terms):
-                                        terms.append(
-                                            {
-                                                "_id": str(nodeid)
-                                                + str(tile.tileid)
-                                                + str(index),
-                                                "_source": {
-                                                    "value": term,
-                                                    "nodeid": nodeid,
-                                                    "nodegroupid": tile.nodegroup_id,
-                                                    "tileid": tile.tileid,
-                                                    "resourceinstanceid": tile.resourceinstance_id,
-                                                    "provisional": True,
-                                                },
-                                            }
-                                        )
 
-        return document, terms
+        for field, count in counts.items():
+            for value in document[field][count:]:
+                value["tileid"] = tile.tileid
 
     def delete(self, user={}, note=""):
         """
@@ -481,24 +827,36 @@ class Resource(models.ResourceInstance):
 
         if permit_deletion is True:
             se = SearchEngineFactory().create()
-            related_resources = self.get_related_resources(
-                lang="en-US", start=0, limit=1000, page=0
-            )
-            for rr in related_resources["resource_relationships"]:
-                models.ResourceXResource.objects.get(pk=rr["resourcexid"]).delete()
+            # all of the resource's relations are removed from the index and the database in one go each
             query = Query(se)
             bool_query = Bool()
-            bool_query.filter(
-                Terms(field="resourceinstanceid", terms=[self.resourceinstanceid])
-            )
+            bool_query.should(Terms(field="resourceinstanceidfrom", terms=[self.resourceinstanceid]))
+            bool_query.should(Terms(field="resourceinstanceidto", terms=[self.resourceinstanceid]))
             query.add_query(bool_query)
-            results = query.search(index="terms")["hits"]["hits"]
-            for result in results:
-                se.delete(index="terms", id=result["_id"])
-            se.delete(index="resources", id=self.resourceinstanceid)
+            query.delete(index="resource_relations")
+            models.ResourceXResource.objects.filter(
+                Q(resourceinstanceidfrom=self.resourceinstanceid) | Q(resourceinstanceidto=self.resourceinstanceid)
+            ).delete()
+            if settings.INDEXING_QUEUE is False:
+                query = Query(se)
+                bool_query = Bool()
+                bool_query.filter(
+                    Terms(field="resourceinstanceid", terms=[self.resourceinstanceid])
+                )
+                query.add_query(bool_query)
+                query.delete(index="terms")
+                se.delete(index="resources", id=self.resourceinstanceid)
 
             self.save_edit(edit_type="delete", user=user, note=self.displayname)
+            resourceinstanceid = self.resourceinstanceid
+            geometry_extents = {}
+            if mvt.get_tile_cache() is not None:
+                geometry_extents = mvt.get_geometry_extents(resourceinstanceid=resourceinstanceid)
             super(Resource, self).delete()
+            mvt.invalidate_extents(geometry_extents)
+            if settings.INDEXING_QUEUE is True:
+                # queued after the delete so the worker can't index the resource before it's gone
+                queue_resource(resourceinstanceid)
 
         return permit_deletion
 
@@ -539,48 +897,106 @@ class Resource(models.ResourceInstance):
             limit = settings.RELATED_RESOURCES_PER_PAGE
             start = limit * int(page - 1)
 
-        def get_relations(resourceinstanceid, start, limit):
-            query = Query(se, start=start, limit=limit)
-            bool_filter = Bool()
-            bool_filter.should(
-                Terms(field="resourceinstanceidfrom", terms=resourceinstanceid)
-            )
-            bool_filter.should(
-                Terms(field="resourceinstanceidto", terms=resourceinstanceid)
-            )
-            query.add_query(bool_filter)
-            return query.search(index="resource_relations")
-
-        resource_relations = get_relations(self.resourceinstanceid, start, limit)
-        ret["total"] = resource_relations["hits"]["total"]
-        instanceids = set()
+        if settings.RELATED_RESOURCES_FROM_DATABASE:
+            ret["resource_relationships"], ret["total"] = self.get_relations_from_db(start, limit)
+        else:
+            ret["resource_relationships"], ret["total"] = self.get_relations_from_index(se, start, limit)
 
-        for relation in resource_relations["hits"]["hits"]:
+        # each relationship type is labelled once, from values loaded with a single query
+        relationshiptypes = set(relation["relationshiptype"] for relation in ret["resource_relationships"])
+        concept_labels.get_many(relationshiptypes)
+        labels = {}
+        for relationshiptype in relationshiptypes:
             try:
-                preflabel = get_preflabel_from_valueid(
-                    relation["_source"]["relationshiptype"], lang
-                )
-                relation["_source"]["relationshiptype_label"] = preflabel["value"]
+                labels[relationshiptype] = get_preflabel_from_valueid(relationshiptype, lang)["value"]
             except:
-                relation["_source"]["relationshiptype_label"] = relation["_source"][
-                    "relationshiptype"
-                ]
+                labels[relationshiptype] = relationshiptype
 
-            ret["resource_relationships"].append(relation["_source"])
-            instanceids.add(relation["_source"]["resourceinstanceidto"])
-            instanceids.add(relation["_source"]["resourceinstanceidfrom"])
-        if len(instanceids) > 0:
-            instanceids.remove(str(self.resourceinstanceid))
+        instanceids = set()
+        for relation in ret["resource_relationships"]:
+            relation["relationshiptype_label"] = labels[relation["relationshiptype"]]
+            instanceids.add(relation["resourceinstanceidto"])
+            instanceids.add(relation["resourceinstanceidfrom"])
+        instanceids.discard(str(self.resourceinstanceid))
 
         if len(instanceids) > 0:
             related_resources = se.search(index="resources", id=list(instanceids))
             if related_resources:
+                relation_counts = self.get_relation_counts(se, list(instanceids))
                 for resource in related_resources["docs"]:
-                    relations = get_relations(resource["_id"], 0, 0)
-                    resource["_source"]["total_relations"] = relations["hits"]["total"]
+                    resource["_source"]["total_relations"] = {"value": relation_counts.get(resource["_id"], 0), "relation": "eq"}
                     ret["related_resources"].append(resource["_source"])
         return ret
 
+    def get_relations_from_index(self, se, start, limit):
+        """
+        Returns a page of this resource's relations (as dictionaries) and the total number of them from the resource_relations index
+
+        """
+
+        query = Query(se, start=start, limit=limit, track_total_hits=True)
+        bool_filter = Bool()
+        bool_filter.should(Terms(field="resourceinstanceidfrom", terms=self.resourceinstanceid))
+        bool_filter.should(Terms(field="resourceinstanceidto", terms=self.resourceinstanceid))
+        query.add_query(bool_filter)
+        resource_relations = query.search(index="resource_relations")
+        return [relation["_source"] for relation in resource_relations["hits"]["hits"]], resource_relations["hits"]["total"]
+
+    def get_relations_from_db(self, start, limit):
+        """
+        Returns a page of this resource's relations (as dictionaries) and the total number of them from the resource_x_resource table
+
+        """
+
+        relations = models.ResourceXResource.objects.filter(
+            Q(resourceinstanceidfrom=self.resourceinstanceid) | Q(resourceinstanceidto=self.resourceinstanceid)
+        )
+        total = relations.count()
+        page = []
+        for relation in relations.order_by("created", "resourcexid").values()[start : start + limit]:
+            relation["resourcexid"] = str(relation["resourcexid"])
+            relation["resourceinstanceidfrom"] = str(relation.pop("resourceinstanceidfrom_id"))
+            relation["resourceinstanceidto"] = str(relation.pop("resourceinstanceidto_id"))
+            page.append(relation)
+        return page, {"value": total, "relation": "eq"}
+
+    def get_relation_counts(self, se, resourceinstanceids):
+        """
+        Returns the number of relations of each of the given resources, keyed by resourceinstanceid
+
+        The counts come from a single search of the resource_relations index, or from the
+        resource_x_resource table if settings.RELATED_RESOURCES_FROM_DATABASE is True
+
+        """
+
+        counts = {}
+        if settings.RELATED_RESOURCES_FROM_DATABASE:
+            for field in ("resourceinstanceidfrom", "resourceinstanceidto"):
+                rows = (
+                    models.ResourceXResource.objects.filter(**{"%s__in" % field: resourceinstanceids})
+                    .values_list(field)
+                    .annotate(count=Count("resourcexid"))
+                )
+                for resourceinstanceid, count in rows:
+                    counts[str(resourceinstanceid)] = counts.get(str(resourceinstanceid), 0) + count
+            return counts
+
+        query = Query(se, limit=0)
+        bool_filter = Bool()
+        bool_filter.should(Terms(field="resourceinstanceidfrom", terms=resourceinstanceids))
+        bool_filter.should(Terms(field="resourceinstanceidto", terms=resourceinstanceids))
+        query.add_query(bool_filter)
+        for field in ("resourceinstanceidfrom", "resourceinstanceidto"):
+            query.add_aggregation(
+                Aggregation(name=field, type="terms", field=field, size=len(resourceinstanceids), include=resourceinstanceids)
+            )
+        results = query.search(index="resource_relations")
+        if results is not None:
+            for field in ("resourceinstanceidfrom", "resourceinstanceidto"):
+                for bucket in results["aggregations"][field]["buckets"]:
+                    counts[bucket["key"]] = counts.get(bucket["key"], 0) + bucket["doc_count"]
+        return counts
+
     def copy(self):
         """
         Returns a copy of this resource instance includeing a copy of all tiles associated with this resource instance
@@ -663,10 +1079,9 @@ class Resource(models.ResourceInstance):
 
 def parse_node_value(value):
     if is_uuid(value):
-        try:
-            return models.Value.objects.get(pk=value).value
-        except ObjectDoesNotExist:
-            pass
+        label = concept_labels.get(value)
+        if label is not None:
+            return label.value
     return value
 
 
@@ -16,8 +16,13 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import time
+import uuid
 from django.conf import LazySettings
-from django.db import ProgrammingError, OperationalError
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import ProgrammingError, OperationalError, transaction
+from django.dispatch import receiver
 from django.utils.functional import empty
 from arches.app.models import models
 
@@ -35,10 +40,20 @@ class SystemSettings(LazySettings):
         # will list all settings
         print settings
 
+    The settings saved in the database are loaded once per process, and again only when the version
+    in the django cache changes (see invalidate), which is checked at most every VERSION_CHECK_INTERVAL seconds
+
     """
 
     SYSTEM_SETTINGS_RESOURCE_MODEL_ID = 'ff623370-fa12-11e6-b98b-6c4008b05c4c'
     RESOURCE_INSTANCE_ID = 'a106c400-260c-11e7-a604-14109fd34195'
+    VERSION_KEY = 'system_settings_version'
+    VERSION_CHECK_INTERVAL = 1
+
+    # kept on the class because LazySettings passes any attribute set on an instance through to the wrapped settings
+    _loaded_version = None
+    _version_checked = 0
+    _missing = set()
 
     def __init__(self, *args, **kwargs):
         super(SystemSettings, self).__init__(*args, **kwargs)
@@ -61,28 +76,96 @@ class SystemSettings(LazySettings):
         What this means is that update_from_db will only be called once a setting is requested that isn't initially in the settings.py file
         Only then will settings from the database be applied (and potentially overwrite settings found in settings.py)
 
+        Names that still aren't found once the database settings are loaded are remembered, so that probing
+        for an optional setting (eg: with hasattr) doesn't read the database again until the settings change
+
         """
 
         try:
             return super(SystemSettings, self).__getattr__(name)
-        except:
-            self.update_from_db()
-            return super(SystemSettings, self).__getattr__(name) #getattr(self, name, True)
+        except AttributeError:
+            if name.startswith('_'):
+                raise
+        self.refresh()
+        if name in SystemSettings._missing:
+            raise AttributeError(name)
+        try:
+            return super(SystemSettings, self).__getattr__(name)
+        except AttributeError:
+            if SystemSettings._loaded_version is not None:
+                SystemSettings._missing.add(name)
+            raise
+
+    def get_version(self):
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            cache.add(self.VERSION_KEY, str(uuid.uuid4()), None)
+            version = cache.get(self.VERSION_KEY)
+        # without a shared cache (eg: the dummy cache) the settings are only loaded once
+        return version if version is not None else ''
+
+    def refresh(self):
+        """
+        Loads the settings saved in the database if they haven't been loaded in this process yet,
+        or if they've been changed (in any process) since they were loaded
+
+        """
+
+        now = time.time()
+        if SystemSettings._loaded_version is not None and now - SystemSettings._version_checked < self.VERSION_CHECK_INTERVAL:
+            return
+        SystemSettings._version_checked = now
+        version = self.get_version()
+        if version != SystemSettings._loaded_version:
+            try:
+                self.update_from_db(version=version)
+            except (ProgrammingError, OperationalError):
+                # the database hasn't been set up yet (eg: while running migrations)
+                pass
+
+    def invalidate(self):
+        """
+        Makes every process reload the settings saved in the database, once the current transaction (if any) commits
+
+        """
+
+        def expire():
+            version = str(uuid.uuid4())
+            cache.set(self.VERSION_KEY, version, None)
+            SystemSettings._loaded_version = version
+
+        transaction.on_commit(expire)
 
     def update_from_db(self, **kwargs):
         """
         Updates the settings the Arches System Settings graph tile instances stored in the database
 
+        Keyword Arguments:
+        version -- the version of the settings being loaded, read from the django cache if not given
+
         """
 
+        version = kwargs.get('version', None)
+        if version is None:
+            version = self.get_version()
+
         # get all the possible settings defined by the Arches System Settings Graph
-        for node in models.Node.objects.filter(graph_id=self.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
+        nodes = models.Node.objects.filter(graph_id=self.SYSTEM_SETTINGS_RESOURCE_MODEL_ID).select_related('nodegroup')
+        nodes_by_id = {node.nodeid: node for node in nodes}
+        nodes_by_nodegroup = {}
+        child_nodes = {}
+        for node in nodes:
+            nodes_by_nodegroup.setdefault(node.nodegroup_id, []).append(node)
+        for edge in models.Edge.objects.filter(domainnode__graph_id=self.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
+            child_nodes.setdefault(edge.domainnode_id, []).append(nodes_by_id[edge.rangenode_id])
+
+        for node in nodes:
 
             def setup_node(node, parent_node=None):
                 if node.is_collector:
                     if node.nodegroup.cardinality == '1':
                         obj = {}
-                        for decendant_node in self.get_direct_decendent_nodes(node):
+                        for decendant_node in child_nodes.get(node.nodeid, []):
                             obj[decendant_node.name] = setup_node(decendant_node, node)
 
                         setattr(self, node.name, obj)
@@ -97,9 +180,9 @@ class SystemSettings(LazySettings):
             setup_node(node)
 
         # set any values saved in the instance of the Arches System Settings Graph
-        for tile in models.TileModel.objects.filter(resourceinstance__graph_id=self.SYSTEM_SETTINGS_RESOURCE_MODEL_ID):
+        for tile in models.TileModel.objects.filter(resourceinstance__graph_id=self.SYSTEM_SETTINGS_RESOURCE_MODEL_ID).select_related('nodegroup'):
             if tile.nodegroup.cardinality == '1':
-                for node in tile.nodegroup.node_set.all():
+                for node in nodes_by_nodegroup.get(tile.nodegroup_id, []):
                     if node.datatype != 'semantic':
                         try:
                             val = tile.data[str(node.nodeid)]
@@ -110,7 +193,7 @@ class SystemSettings(LazySettings):
             if tile.nodegroup.cardinality == 'n':
                 obj = {}
                 collector_nodename = ''
-                for node in tile.nodegroup.node_set.all():
+                for node in nodes_by_nodegroup.get(tile.nodegroup_id, []):
                     # print "%s: %s" % (node.name,node.is_collector)
                     if node.is_collector:
                         collector_nodename = node.name
@@ -124,6 +207,9 @@ class SystemSettings(LazySettings):
                 val.append(obj)
                 setattr(self, collector_nodename, val)
 
+        SystemSettings._missing.clear()
+        SystemSettings._loaded_version = version
+
         #print self
 
     def get_direct_decendent_nodes(self, node):
@@ -138,3 +224,9 @@ settings = SystemSettings()
 #     settings.update_from_db()
 # except OperationalError, ProgrammingError:
 #     print "Skipping system settings update"
+
+
+@receiver(request_started)
+def refresh_system_settings(sender, **kwargs):
+    # picks up settings saved by other processes, lookups of settings that were already found don't go through __getattr__
+    settings.refresh()
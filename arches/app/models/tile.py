@@ -28,12 +28,12 @@ from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 from arches.app.models import models
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.models.resource import Resource
 from arches.app.models.resource import EditLog
 from arches.app.models.system_settings import settings
+from arches.app.utils import mvt
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
-from arches.app.search.search_engine_factory import SearchEngineFactory
-from arches.app.search.elasticsearch_dsl_builder import Query, Bool, Terms
 from arches.app.datatypes.datatypes import DataTypeFactory
 
 logger = logging.getLogger(__name__)
@@ -233,17 +233,54 @@ class Tile(models.TileModel):
                                 The following value is already saved: ')
                             raise TileValidationError(message + (', ').join(duplicate_values))
 
+    def get_graph_metadata(self):
+        """
+        Returns the cached metadata (nodes, datatypes, cardinality, etc.) of the graph this tile belongs to
+
+        """
+
+        return graph_metadata.get_by_nodegroup(self.nodegroup_id)
+
+    def invalidate_descriptors(self):
+        """
+        Removes the cached descriptors (name, description, map popup) of this tile's resource
+        if this tile's nodegroup participates in any of them
+
+        """
+
+        metadata = self.get_graph_metadata()
+        if metadata is not None:
+            module = importlib.import_module("arches.app.functions.primary_descriptors")
+            PrimaryDescriptorsFunction = getattr(module, "PrimaryDescriptorsFunction")()
+            PrimaryDescriptorsFunction.invalidate_descriptors(metadata.graphid, self.resourceinstance_id, self.nodegroup_id)
+
+    def get_geometry_extents(self):
+        """
+        Returns the bounding boxes of this tile's saved geojson-feature-collection values keyed by nodeid,
+        used to find the cached vector tiles that have to be removed when this tile changes
+
+        """
+
+        metadata = self.get_graph_metadata()
+        if mvt.get_tile_cache() is None or metadata is None or self.tileid is None:
+            return {}
+        nodes = metadata.nodes_by_nodegroup.get(str(self.nodegroup_id), [])
+        if not any(node.datatype == "geojson-feature-collection" for node in nodes):
+            return {}
+        return mvt.get_geometry_extents(tileid=self.tileid)
+
     def check_for_missing_nodes(self, request):
         missing_nodes = []
+        metadata = self.get_graph_metadata()
+        datatype_factory = DataTypeFactory()
         for nodeid, value in self.data.items():
-            datatype_factory = DataTypeFactory()
-            node = models.Node.objects.get(nodeid=nodeid)
+            node = metadata.get_node(nodeid)
             datatype = datatype_factory.get_instance(node.datatype)
             datatype.clean(self, nodeid)
             if request is not None:
                 if self.data[nodeid] is None and node.isrequired is True:
-                    if len(node.cardxnodexwidget_set.all()) > 0:
-                        missing_nodes.append(node.cardxnodexwidget_set.all()[0].label)
+                    if str(node.nodeid) in metadata.widget_labels:
+                        missing_nodes.append(metadata.widget_labels[str(node.nodeid)])
                     else:
                         missing_nodes.append(node.name)
         if missing_nodes != []:
@@ -252,9 +289,10 @@ class Tile(models.TileModel):
             raise TileValidationError(message)
 
     def validate(self, errors=None):
+        metadata = self.get_graph_metadata()
+        datatype_factory = DataTypeFactory()
         for nodeid, value in self.data.items():
-            datatype_factory = DataTypeFactory()
-            node = models.Node.objects.get(nodeid=nodeid)
+            node = metadata.get_node(nodeid)
             datatype = datatype_factory.get_instance(node.datatype)
             error = datatype.validate(value, node=node)
             for error_instance in error:
@@ -280,9 +318,10 @@ class Tile(models.TileModel):
                 models.UserProfile.objects.create(user=request.user)
             user_is_reviewer = request.user.userprofile.is_reviewer()
         tile_data = self.get_tile_data(user_is_reviewer, userid)
+        metadata = self.get_graph_metadata()
+        datatype_factory = DataTypeFactory()
         for nodeid, value in list(tile_data.items()):
-            datatype_factory = DataTypeFactory()
-            node = models.Node.objects.get(nodeid=nodeid)
+            node = metadata.get_node(nodeid)
             datatype = datatype_factory.get_instance(node.datatype)
             if request is not None:
                 datatype.handle_request(self, request, node)
@@ -338,7 +377,10 @@ class Tile(models.TileModel):
         if user is not None:
             self.validate([])
 
+        old_extents = self.get_geometry_extents() if creating_new_tile is False else {}
         super(Tile, self).save(*args, **kwargs)
+        self.invalidate_descriptors()
+        mvt.invalidate_extents(old_extents, self.get_geometry_extents())
         # We have to save the edit log record after calling save so that the
         # resource's displayname changes are avaliable
         if log is True:
@@ -372,7 +414,6 @@ class Tile(models.TileModel):
                 tile.save(*args, request=request, index=index, **kwargs)
 
     def delete(self, *args, **kwargs):
-        se = SearchEngineFactory().create()
         request = kwargs.pop('request', None)
         provisional_edit_log_details = kwargs.pop('provisional_edit_log_details', None)
         for tile in self.tiles:
@@ -384,36 +425,32 @@ class Tile(models.TileModel):
             user = None
 
         if user_is_reviewer is True or self.user_owns_provisional(user):
-            query = Query(se)
-            bool_query = Bool()
-            bool_query.filter(Terms(field='tileid', terms=[self.tileid]))
-            query.add_query(bool_query)
-            results = query.search(index='terms')['hits']['hits']
-
-            for result in results:
-                se.delete(index='terms', id=result['_id'])
-
+            tileid = self.tileid
             self.__preDelete(request)
             self.save_edit(
                 user=request.user,
                 edit_type='tile delete',
                 old_value=self.data,
                 provisional_edit_log_details=provisional_edit_log_details)
+            old_extents = self.get_geometry_extents()
             super(Tile, self).delete(*args, **kwargs)
+            self.invalidate_descriptors()
+            mvt.invalidate_extents(old_extents)
             resource = Resource.objects.get(resourceinstanceid=self.resourceinstance.resourceinstanceid)
-            resource.index()
+            resource.index_tile(tileid)
 
         else:
             self.apply_provisional_edit(user, data={}, action='delete')
             super(Tile, self).save(*args, **kwargs)
+            self.invalidate_descriptors()
 
     def index(self):
         """
-        Indexes all the nessesary documents related to resources to support the map, search, and reports
+        Indexes the changes made to this tile into its resource's search document and the terms index
 
         """
 
-        Resource.objects.get(pk=self.resourceinstance_id).index()
+        Resource.objects.get(pk=self.resourceinstance_id).index_tile(self.tileid, tile=self)
 
     # # flatten out the nested tiles into a single array
     def get_flattened_tiles(self):
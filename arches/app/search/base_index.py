@@ -1,8 +1,9 @@
 from datetime import datetime
 from django.utils.translation import ugettext as _
 from arches.app.models import models
+from arches.app.models.resource import Resource
 from arches.app.models.system_settings import settings
-from arches.app.utils import import_class_from_string
+from arches.app.utils import import_class_from_string, chunks
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Query, Term
 
@@ -96,11 +97,12 @@ class BaseIndex(object):
 
         result_summary = {'database': len(resources), 'indexed': 0}
         with self.se.BulkIndexer(batch_size=settings.BULK_IMPORT_BATCH_SIZE, refresh=True) as indexer:
-            for resource in resources:
-                tiles = list(models.TileModel.objects.filter(resourceinstance=resource))
-                document, doc_id = self.get_documents_to_index(resource, tiles)
-                if document is not None and id is not None:
-                    indexer.add(index=self.index_name, id=doc_id, data=document)
+            for resource_batch in chunks(resources, settings.BULK_IMPORT_BATCH_SIZE):
+                tiles = Resource.get_tiles_by_resource([resource.resourceinstanceid for resource in resource_batch])
+                for resource in resource_batch:
+                    document, doc_id = self.get_documents_to_index(resource, tiles.get(str(resource.resourceinstanceid), []))
+                    if document is not None and id is not None:
+                        indexer.add(index=self.index_name, id=doc_id, data=document)
 
         result_summary['indexed'] = self.se.count(index=self.index_name, body=q.dsl) - count_before
         status = 'Passed' if result_summary['database'] == result_summary['indexed'] else 'Failed'
@@ -66,3 +66,14 @@ class SearchFilterFactory(object):
             return filter_instance
         else:
             return None
+
+    def append_dsl(self, search_results_object, permitted_nodegroups, include_provisional):
+        """
+        Lets each search filter named in the request (and the search results filter) append its dsl to the query
+
+        """
+
+        for filter_type, querystring in list(self.request.GET.items()) + [('search-results', '')]:
+            search_filter = self.get_filter(filter_type)
+            if search_filter:
+                search_filter.append_dsl(search_results_object, permitted_nodegroups, include_provisional)
@@ -1,5 +1,6 @@
 from arches.app.models.system_settings import settings
 from arches.app.search.components.base import BaseSearchFilter
+from arches.app.utils.betterJSONSerializer import JSONDeserializer
 from arches.app.utils.pagination import get_paginator
 
 details = {
@@ -19,9 +20,37 @@ details = {
 class PagingFilter(BaseSearchFilter):
 
     def append_dsl(self, search_results_object, permitted_nodegroups, include_provisional):
+        page = 1 if self.request.GET.get(details['componentname']) == '' else int(self.request.GET.get(details['componentname'], 1))
+        limit = self.get_limit()
+        query = search_results_object['query']
+
+        search_after = self.request.GET.get('search_after', None)
+        if search_after is not None:
+            # cursor paging: the results are sorted on a stable key and each page starts after the last hit
+            # of the previous one (an empty search_after is the first page), so reading deep into the results
+            # costs no more than reading the first page and isn't limited by index.max_result_window
+            query.add_sort('_score', 'desc')
+            query.add_sort('resourceinstanceid', 'asc')
+            query.search_after = JSONDeserializer().deserialize(search_after) if search_after not in ('', '[]') else None
+            query.start = 0
+            query.limit = min(limit, settings.SEARCH_RESULT_LIMIT)
+        else:
+            query.start = limit*int(page-1)
+            query.limit = limit
+
+    def post_search_hook(self, search_results_object, results, permitted_nodegroups):
+        if self.request.GET.get('search_after', None) is not None:
+            ret = self.get_cursor(results)
+        else:
+            ret = self.get_pages(results)
+
+        if details['componentname'] not in search_results_object:
+            search_results_object[details['componentname']] = {}
+        search_results_object[details['componentname']]['paginator'] = ret
+
+    def get_limit(self):
         export = self.request.GET.get('export', None)
         mobile_download = self.request.GET.get('mobiledownload', None)
-        page = 1 if self.request.GET.get(details['componentname']) == '' else int(self.request.GET.get(details['componentname'], 1))
 
         if export is not None:
             limit = settings.SEARCH_EXPORT_ITEMS_PER_PAGE
@@ -29,11 +58,9 @@ class PagingFilter(BaseSearchFilter):
             limit = self.request.GET['resourcecount']
         else:
             limit = settings.SEARCH_ITEMS_PER_PAGE
-        limit = int(self.request.GET.get('limit', limit))
-        search_results_object['query'].start = limit*int(page-1)
-        search_results_object['query'].limit = limit
+        return int(self.request.GET.get('limit', limit))
 
-    def post_search_hook(self, search_results_object, results, permitted_nodegroups):
+    def get_pages(self, results):
         total = results['hits']['total']['value'] if results['hits']['total']['value'] <= settings.SEARCH_RESULT_LIMIT else settings.SEARCH_RESULT_LIMIT
         page = 1 if self.request.GET.get(details['componentname']) == '' else int(self.request.GET.get(details['componentname'], 1))
 
@@ -50,7 +77,17 @@ class PagingFilter(BaseSearchFilter):
         ret['start_index'] = page.start_index()
         ret['end_index'] = page.end_index()
         ret['pages'] = pages
+        return ret
 
-        if details['componentname'] not in search_results_object:
-            search_results_object[details['componentname']] = {}
-        search_results_object[details['componentname']]['paginator'] = ret
+    def get_cursor(self, results):
+        """
+        Returns the paginator of a cursor paged search: pass its search_after value
+        back as the search_after parameter to get the next page
+
+        """
+
+        hits = results['hits']['hits']
+        ret = {}
+        ret['has_next'] = len(hits) > 0 and len(hits) == min(self.get_limit(), settings.SEARCH_RESULT_LIMIT)
+        ret['search_after'] = hits[-1]['sort'] if ret['has_next'] else None
+        return ret
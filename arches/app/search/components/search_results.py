@@ -2,6 +2,7 @@ from arches.app.models import models
 from arches.app.models.system_settings import settings
 from arches.app.search.elasticsearch_dsl_builder import Bool, Terms, NestedAgg, FiltersAgg, GeoHashGridAgg, GeoBoundsAgg
 from arches.app.search.components.base import BaseSearchFilter
+from arches.app.utils.permission_backend import get_nodegroup_ids_by_perm
 
 details = {
     "searchcomponentid": "",
@@ -60,10 +61,11 @@ class SearchResultsFilter(BaseSearchFilter):
                 pass
 
 def get_nodegroups_by_datatype_and_perm(request, datatype, permission):
+    permitted_nodegroups = get_nodegroup_ids_by_perm(request.user, permission)
     nodes = []
-    for node in models.Node.objects.filter(datatype=datatype):
-        if request.user.has_perm(permission, node.nodegroup):
-            nodes.append(str(node.nodegroup_id))
+    for nodegroupid in models.Node.objects.filter(datatype=datatype).values_list('nodegroup_id', flat=True):
+        if str(nodegroupid) in permitted_nodegroups:
+            nodes.append(str(nodegroupid))
     return nodes
 
 def select_geoms_for_results(features, geojson_nodes, user_is_reviewer):
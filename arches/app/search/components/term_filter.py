@@ -1,4 +1,4 @@
-from arches.app.models.concept import Concept
+from arches.app.models.concept_closure import concept_closure
 from arches.app.utils.betterJSONSerializer import JSONDeserializer
 from arches.app.search.elasticsearch_dsl_builder import Bool, Match, Nested, Terms
 from arches.app.search.components.base import BaseSearchFilter
@@ -66,6 +66,5 @@ class TermFilter(BaseSearchFilter):
 
 def _get_child_concepts(conceptid):
     ret = {conceptid}
-    for row in Concept().get_child_concepts(conceptid, ['prefLabel']):
-        ret.add(row[0])
+    ret.update(concept_closure.get_descendants(conceptid))
     return list(ret)
@@ -50,6 +50,7 @@ class Query(Dsl):
         self.se = se
         self.start = kwargs.pop('start', 0)
         self.limit = kwargs.pop('limit', 10)
+        self.search_after = kwargs.pop('search_after', None)
 
         self.dsl = {
             'query': {
@@ -103,9 +104,45 @@ class Query(Dsl):
     def delete(self, index='', **kwargs):
         return self.se.delete(index=index, body=self.dsl, **kwargs)
 
+    def add_sort(self, field, order='asc'):
+        if 'sort' not in self.dsl:
+            self.dsl['sort'] = []
+        self.dsl['sort'].append({field: order})
+
+    def search_all(self, index='', page_size=1000, tiebreaker='resourceinstanceid'):
+        """
+        Yields every hit matching this query, reading them a page at a time with search_after
+        so that each page costs the same however deep into the results it is
+        (from/size gets slower with every page and is capped by index.max_result_window)
+
+        Hits are ordered by this query's sort (relevance if it hasn't got one) and then by the tiebreaker,
+        which should be a unique keyword field of the documents in the index (sorting on _id is deprecated
+        in elasticsearch 7 and loads its fielddata into memory)
+
+        """
+
+        dsl = dict(self.dsl)
+        dsl['sort'] = list(self.dsl.get('sort', [{'_score': 'desc'}])) + [{tiebreaker: 'asc'}]
+        dsl['size'] = page_size
+        dsl['track_total_hits'] = False
+        dsl.pop('from', None)
+        dsl.pop('aggs', None)
+        while True:
+            results = self.se.search(index=index, body=dsl)
+            hits = results['hits']['hits'] if results is not None else []
+            for hit in hits:
+                yield hit
+            if len(hits) < page_size:
+                return
+            dsl['search_after'] = hits[-1]['sort']
+
     def prepare(self):
         self.dsl['from'] = self.start
         self.dsl['size'] = self.limit
+        if self.search_after is not None:
+            # search_after replaces from, the page starts after the hit with these sort values
+            self.dsl['from'] = 0
+            self.dsl['search_after'] = self.search_after
 
 
 class Bool(Dsl):
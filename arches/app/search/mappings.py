@@ -185,7 +185,8 @@ def prepare_search_index(create=False):
                                 }
                             },
                             'nodegroup_id': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     },
                     'ids': {
@@ -193,7 +194,8 @@ def prepare_search_index(create=False):
                         'properties': {
                             'id': {'type': 'keyword'},
                             'nodegroup_id': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     },
                     'domains': {
@@ -208,7 +210,8 @@ def prepare_search_index(create=False):
                             'conceptid': {'type': 'keyword'},
                             'valueid': {'type': 'keyword'},
                             'nodegroup_id': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     },
                     'geometries': {
@@ -230,7 +233,8 @@ def prepare_search_index(create=False):
                                 }
                             },
                             'nodegroup_id': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     },
                     'points': {
@@ -238,7 +242,8 @@ def prepare_search_index(create=False):
                         'properties': {
                             'point': {'type': 'geo_point'},
                             'nodegroup_id': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     },
                     'dates': {
@@ -247,7 +252,8 @@ def prepare_search_index(create=False):
                             'date': {'type': 'float'},
                             'nodegroup_id': {'type': 'keyword'},
                             'nodeid': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     },
                     'numbers': {
@@ -255,7 +261,8 @@ def prepare_search_index(create=False):
                         'properties': {
                             'number': {'type': 'double'},
                             'nodegroup_id': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     },
                     'date_ranges': {
@@ -263,7 +270,8 @@ def prepare_search_index(create=False):
                         'properties': {
                             'date_range': {'type': 'float_range'},
                             'nodegroup_id': {'type': 'keyword'},
-                            'provisional': {'type': 'boolean'}
+                            'provisional': {'type': 'boolean'},
+                            'tileid': {'type': 'keyword'}
                         }
                     }
                 }
@@ -0,0 +1,84 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import hashlib
+from django.core.cache import cache
+from arches.app.models.system_settings import settings
+
+GENERATION_KEY = "search_results_generation"
+
+# results aren't cached until this many seconds after the resources index was last written to,
+# so that results read before Elasticsearch refreshes the index (every second by default) aren't kept
+REFRESH_INTERVAL = 2
+
+
+def get_generation():
+    """
+    Returns the generation of the resources index: the time it was last written to
+
+    """
+
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, str(time.time()), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    """
+    Starts a new generation, so every cached search result is discarded
+
+    """
+
+    cache.set(GENERATION_KEY, str(time.time()), None)
+
+
+def get_cache_key(request, permitted_nodegroups, user_is_reviewer):
+    """
+    Returns the cache key of a search request, or None if its results shouldn't be cached
+
+    The key is made from the current generation, the querystring (in a normalized order)
+    and the nodegroups the user can read, so users with the same permissions share results
+
+    """
+
+    if settings.SEARCH_RESULTS_CACHE_TIMEOUT == 0:
+        return None
+    if request.GET.get("export", None) is not None or request.GET.get("mobiledownload", None) is not None:
+        return None
+
+    generation = get_generation()
+    if time.time() - float(generation) < REFRESH_INTERVAL:
+        return None
+
+    querystring = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    fingerprint = hashlib.sha1(
+        ("%s|%s|%s" % (querystring, sorted(permitted_nodegroups), user_is_reviewer)).encode("utf-8")
+    ).hexdigest()
+    return "search_results_%s_%s" % (generation, fingerprint)
+
+
+def get(key):
+    return cache.get(key) if key is not None else None
+
+
+def set(key, results):
+    if key is not None:
+        cache.set(key, results, settings.SEARCH_RESULTS_CACHE_TIMEOUT)
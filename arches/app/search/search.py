@@ -20,8 +20,9 @@ import urllib.request, urllib.parse, urllib.error
 import uuid
 import logging
 from datetime import datetime
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch, NotFoundError, helpers
 from arches.app.models.system_settings import settings
+from arches.app.search import results_cache
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 
 
@@ -56,6 +57,15 @@ class SearchEngine(object):
         else:
             return dict(kwargs, index=index)
 
+    def _index_written(self, index=None):
+        """
+        Discards the cached search results if the resources index was (or, when the index isn't known, may have been) written to
+
+        """
+
+        if index is None or 'resources' in [idx.strip() for idx in index.split(',')]:
+            results_cache.invalidate()
+
     def delete(self, **kwargs):
         """
         Deletes a document from the index
@@ -64,41 +74,65 @@ class SearchEngine(object):
 
         """
 
-        kwargs = self._add_prefix(**kwargs)
-        body = kwargs.pop('body', None)
-        if body != None:
-            try:
-                data = []
-                refresh = kwargs.pop('refresh', False)
-                for hit in helpers.scan(self.es, query=body, **kwargs):
-                    hit['_op_type'] = 'delete'
-                    data.append(hit)
-
-                return helpers.bulk(self.es, data, refresh=refresh, **kwargs)
-            except Exception as detail:
-                try:
-                    # ignore 404 errors (index_not_found_exception)
-                    if detail.status_code == 404:
-                        pass
-                except:
-                    self.logger.warning('%s: WARNING: failed to delete document by query: %s \nException detail: %s\n' % (datetime.now(), body, detail))
-                    raise detail
+        if kwargs.get('body', None) != None:
+            return self.delete_by_query(**kwargs)
         else:
+            index = kwargs.get('index', None)
+            kwargs = self._add_prefix(**kwargs)
             try:
-                return self.es.delete(ignore=[404], **kwargs)
+                ret = self.es.delete(ignore=[404], **kwargs)
+                self._index_written(index)
+                return ret
             except Exception as detail:
-                self.logger.warning('%s: WARNING: failed to delete document: %s \nException detail: %s\n' % (datetime.now(), body, detail))
+                self.logger.warning('%s: WARNING: failed to delete document: %s \nException detail: %s\n' % (datetime.now(), kwargs.get('id'), detail))
                 raise detail
 
+    def delete_by_query(self, **kwargs):
+        """
+        Deletes every document matching a query dsl body in a single request,
+        the matching documents are deleted by Elasticsearch rather than fetched and deleted one by one
+
+        Pass refresh=True to make the deletions visible to search before returning
+
+        """
+
+        index = kwargs.get('index', None)
+        kwargs = self._add_prefix(**kwargs)
+        body = kwargs.pop('body', None)
+
+        # need to only pass in the query key as other keys (eg: _source, from, size) are not allowed
+        if body and 'query' in body:
+            body = {'query': body['query']}
+
+        try:
+            ret = self.es.delete_by_query(body=body, conflicts='proceed', ignore=[404], **kwargs)
+            self._index_written(index)
+            return ret
+        except Exception as detail:
+            self.logger.warning('%s: WARNING: failed to delete document by query: %s \nException detail: %s\n' % (datetime.now(), body, detail))
+            raise detail
+
     def delete_index(self, **kwargs):
         """
         Deletes an entire index
 
         """
 
+        index = kwargs.get('index', None)
         kwargs = self._add_prefix(**kwargs)
         print('deleting index : %s' % kwargs.get('index'))
-        return self.es.indices.delete(ignore=[400, 404], **kwargs)
+        ret = self.es.indices.delete(ignore=[400, 404], **kwargs)
+        self._index_written(index)
+        return ret
+
+    def refresh(self, **kwargs):
+        """
+        Refreshes an index so that recently indexed documents are visible to search
+
+        """
+
+        kwargs = self._add_prefix(**kwargs)
+        return self.es.indices.refresh(ignore=[404], **kwargs)
 
     def search(self, **kwargs):
         """
@@ -161,9 +195,11 @@ class SearchEngine(object):
         print('creating index : %s' % (index))
 
     def create_index(self, **kwargs):
+        index = kwargs.get('index', None)
         kwargs = self._add_prefix(**kwargs)
         kwargs['include_type_name'] = True
         self.es.indices.create(ignore=400, **kwargs)
+        self._index_written(index)
         print('creating index : %s' % kwargs.get('index', ''))
 
     def index_data(self, index=None, body=None, idfield=None, id=None, **kwargs):
@@ -177,6 +213,7 @@ class SearchEngine(object):
 
         """
 
+        unprefixed_index = index
         index = self._add_prefix(index)
         if not isinstance(body, list):
             body = [body]
@@ -193,10 +230,87 @@ class SearchEngine(object):
             except Exception as detail:
                 self.logger.warning('%s: WARNING: failed to index document: %s \nException detail: %s\n' % (datetime.now(), document, detail))
                 raise detail
+        self._index_written(unprefixed_index)
+
+
+    def update_data(self, index=None, id=None, body=None, **kwargs):
+        """
+        Partially updates a single document in Elasticsearch
+        The body is an update request (eg: {"script": {...}} or {"doc": {...}})
+
+        Returns the update response or None if the document doesn't exist
+
+        """
+
+        unprefixed_index = index
+        index = self._add_prefix(index)
+        try:
+            ret = self.es.update(index=index, doc_type='_doc', id=id, body=body, **kwargs)
+            self._index_written(unprefixed_index)
+            return ret
+        except NotFoundError:
+            return None
+        except Exception as detail:
+            self.logger.warning('%s: WARNING: failed to update document: %s \nException detail: %s\n' % (datetime.now(), id, detail))
+            raise detail
 
 
     def bulk_index(self, data, **kwargs):
-        return helpers.bulk(self.es, data, **kwargs)
+        ret = helpers.bulk(self.es, data, **kwargs)
+        self._index_written()
+        return ret
+
+    def streaming_bulk_index(self, data, chunk_size=500, errors=None, **kwargs):
+        """
+        Indexes a list or generator of bulk items (see create_bulk_item) in requests
+        of chunk_size items, without holding all of the items in memory at once
+
+        Returns the number of items indexed
+
+        Keyword Arguments:
+        errors -- a list that the responses of any items that failed are appended to
+
+        """
+
+        count = 0
+        try:
+            for success, info in helpers.streaming_bulk(self.es, data, chunk_size=chunk_size, raise_on_error=False, **kwargs):
+                if success:
+                    count += 1
+                else:
+                    self.logger.warning('%s: WARNING: failed to index document: %s\n' % (datetime.now(), info))
+                    if errors is not None:
+                        errors.append(info)
+        finally:
+            self._index_written()
+        return count
+
+    def parallel_bulk_index(self, data, thread_count=4, chunk_size=500, errors=None, **kwargs):
+        """
+        Indexes a list or generator of bulk items (see create_bulk_item) keeping
+        several bulk requests in flight at once
+
+        Returns the number of items indexed
+
+        Keyword Arguments:
+        errors -- a list that the responses of any items that failed are appended to
+
+        """
+
+        count = 0
+        try:
+            for success, info in helpers.parallel_bulk(
+                self.es, data, thread_count=thread_count, chunk_size=chunk_size, raise_on_error=False, **kwargs
+            ):
+                if success:
+                    count += 1
+                else:
+                    self.logger.warning('%s: WARNING: failed to index document: %s\n' % (datetime.now(), info))
+                    if errors is not None:
+                        errors.append(info)
+        finally:
+            self._index_written()
+        return count
 
     def create_bulk_item(self, op_type='index', index=None, id=None, data=None):
         return {
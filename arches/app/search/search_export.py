@@ -0,0 +1,185 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import datetime
+from io import StringIO
+from arches.app.datatypes.datatypes import DataTypeFactory
+from arches.app.models import models
+from arches.app.models.concept_labels import concept_labels
+from arches.app.models.graph_metadata import graph_metadata
+from arches.app.models.system_settings import settings
+from arches.app.search.search_engine_factory import SearchEngineFactory
+from arches.app.search.elasticsearch_dsl_builder import Query
+from arches.app.search.components.base import SearchFilterFactory
+from arches.app.utils.betterJSONSerializer import JSONSerializer
+from arches.app.utils.permission_backend import get_nodegroup_ids_by_perm
+
+CONTENT_TYPES = {"csv": "text/csv", "geojson": "application/geo+json"}
+
+CSV_HEADER = ["ResourceID", "ResourceModelID", "TileID", "ParentTileID", "NodeGroupID", "NodeID", "Node", "Value"]
+
+
+class SearchResultsExporter(object):
+    """
+    Exports every resource that matches a search request, a chunk of resources at a time,
+    so the memory it needs doesn't grow with the number of resources exported
+
+    The ids of the matching resources are read from the search index with search_after (see Query.search_all)
+    and the tiles of each chunk of settings.SEARCH_EXPORT_CHUNK_SIZE resources are loaded with a single query
+
+    Formats:
+    csv -- a row for each value of each tile the user can read (one file for resources of any resource model)
+    geojson -- a feature collection with a feature for each resource that has geometries
+
+    """
+
+    def __init__(self, search_request, format="csv"):
+        from arches.app.views.search import get_provisional_type  # avoid a circular import
+
+        self.request = search_request
+        self.format = format
+        self.content_type = CONTENT_TYPES[format]
+        self.file_name = "search_results_{0}.{1}".format(datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"), format)
+        self.permitted_nodegroups = list(get_nodegroup_ids_by_perm(search_request.user, "models.read_nodegroup"))
+        self.include_provisional = get_provisional_type(search_request)
+        self.datatype_factory = DataTypeFactory()
+
+    def export(self):
+        """
+        Returns a generator of the exported text, one chunk of resources at a time
+
+        """
+
+        if self.format == "geojson":
+            return self.get_geojson()
+        return self.get_csv()
+
+    def get_hits(self):
+        """
+        Runs the search filters of the request and yields the source of every resource that matches
+
+        """
+
+        se = SearchEngineFactory().create()
+        search_results_object = {"query": Query(se)}
+        SearchFilterFactory(self.request).append_dsl(search_results_object, self.permitted_nodegroups, self.include_provisional)
+        query = search_results_object["query"]
+        query.include("resourceinstanceid")
+        query.include("graph_id")
+        query.include("displayname")
+        for hit in query.search_all(index="resources", page_size=settings.SEARCH_EXPORT_CHUNK_SIZE, tiebreaker="resourceinstanceid"):
+            yield hit["_source"]
+
+    def get_resources(self):
+        """
+        Yields a (resource source, list of tiles) pair for every resource that matches the search
+
+        """
+
+        chunk = []
+        for resource in self.get_hits():
+            chunk.append(resource)
+            if len(chunk) == settings.SEARCH_EXPORT_CHUNK_SIZE:
+                yield from self.get_chunk_tiles(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            yield from self.get_chunk_tiles(chunk)
+
+    def get_chunk_tiles(self, resources):
+        tiles = {}
+        valueids = set()
+        concept_nodes = {}
+        for tile in models.TileModel.objects.filter(
+            resourceinstance_id__in=[resource["resourceinstanceid"] for resource in resources], nodegroup_id__in=self.permitted_nodegroups
+        ).order_by("resourceinstance_id", "parenttile_id", "sortorder"):
+            tiles.setdefault(str(tile.resourceinstance_id), []).append(tile)
+            if tile.nodegroup_id not in concept_nodes:
+                node_datatypes = graph_metadata.get_by_nodegroup(tile.nodegroup_id).node_datatypes
+                concept_nodes[tile.nodegroup_id] = {
+                    nodeid for nodeid, datatype in node_datatypes.items() if datatype in ("concept", "concept-list")
+                }
+            for nodeid in concept_nodes[tile.nodegroup_id].intersection(tile.data):
+                value = tile.data[nodeid]
+                if value:
+                    valueids.update(value if isinstance(value, list) else [value])
+        # the labels of the chunk's concept values are loaded with one query
+        concept_labels.get_many(valueids)
+        for resource in resources:
+            yield resource, tiles.get(resource["resourceinstanceid"], [])
+
+    def get_csv(self):
+        output = StringIO()
+        writer = csv.writer(output)
+
+        def flush():
+            text = output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            return text
+
+        writer.writerow(CSV_HEADER)
+        yield flush()
+        for resource, tiles in self.get_resources():
+            metadata = graph_metadata.get(resource["graph_id"])
+            for tile in tiles:
+                for nodeid, value in tile.data.items():
+                    if value is None or value == "" or nodeid not in metadata.nodes:
+                        continue
+                    node = metadata.nodes[nodeid]
+                    value = self.datatype_factory.get_instance(node.datatype).transform_export_values(
+                        value, concept_export_value_type="label", node=nodeid
+                    )
+                    writer.writerow(
+                        [
+                            resource["resourceinstanceid"],
+                            resource["graph_id"],
+                            tile.tileid,
+                            tile.parenttile_id if tile.parenttile_id is not None else "",
+                            tile.nodegroup_id,
+                            nodeid,
+                            node.name,
+                            value,
+                        ]
+                    )
+            yield flush()
+
+    def get_geojson(self):
+        yield '{"type": "FeatureCollection", "features": ['
+        separator = ""
+        for resource, tiles in self.get_resources():
+            metadata = graph_metadata.get(resource["graph_id"])
+            geometries = []
+            for tile in tiles:
+                for nodeid, value in tile.data.items():
+                    if value is not None and metadata.node_datatypes.get(nodeid) == "geojson-feature-collection":
+                        geometries += [feature["geometry"] for feature in value.get("features", [])]
+            if len(geometries) > 0:
+                feature = {
+                    "type": "Feature",
+                    "id": resource["resourceinstanceid"],
+                    "geometry": {"type": "GeometryCollection", "geometries": geometries},
+                    "properties": {
+                        "resourceinstanceid": resource["resourceinstanceid"],
+                        "graph_id": resource["graph_id"],
+                        "displayname": resource.get("displayname", ""),
+                    },
+                }
+                yield separator + JSONSerializer().serialize(feature)
+                separator = ", "
+        yield "]}"
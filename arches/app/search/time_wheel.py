@@ -1,5 +1,5 @@
 import math
-from arches.app.utils.permission_backend import get_nodegroups_by_perm
+from arches.app.utils.permission_backend import get_nodegroup_ids_by_perm
 from arches.app.search.elasticsearch_dsl_builder import Bool, Match, Query, Nested, Term, Terms, GeoShape, Range, MinAgg, MaxAgg, RangeAgg, Aggregation, GeoHashGridAgg, GeoBoundsAgg, FiltersAgg, NestedAgg
 from arches.app.utils.date_utils import ExtendedDateFormat
 from arches.app.search.search_engine_factory import SearchEngineFactory
@@ -131,7 +131,7 @@ class TimeWheel(object):
         return results
 
     def get_permitted_nodegroups(self, user):
-        return [str(nodegroup.pk) for nodegroup in get_nodegroups_by_perm(user, 'models.read_nodegroup')]
+        return list(get_nodegroup_ids_by_perm(user, 'models.read_nodegroup'))
 
 
 class d3Item(object):
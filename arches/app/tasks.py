@@ -7,3 +7,11 @@ from django.core import management
 def sync(surveyid, userid):
     management.call_command('mobile', operation='sync_survey', id=surveyid, user=userid)
     return 'sync complete'
+
+
+@shared_task
+def process_index_queue():
+    from arches.app.utils.index_queue import process_queue  # avoid a circular import
+    count = process_queue()
+    return 'indexed %s queued resources' % count
+
@@ -1,4 +1,5 @@
 from importlib import import_module
+from itertools import islice
 
 def dictfetchall(cursor):
     "Returns all rows from a cursor as a dict"
@@ -12,4 +13,13 @@ def import_class_from_string(dotted_path):
     module_path, _, class_name = dotted_path.rpartition('.')
     mod = import_module(module_path)
     klass = getattr(mod, class_name)
-    return klass
\ No newline at end of file
+    return klass
+
+def chunks(iterable, size):
+    "Yields successive lists of at most size items from any iterable"
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, int(size)))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,213 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import datetime
+from io import StringIO
+from django.db import connection, transaction
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.utils.betterJSONSerializer import JSONSerializer
+
+# characters that have to be escaped in the text format of COPY
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def load_resources(resources):
+    """
+    Writes resources, their (already flattened) tiles and the edit log records for them
+    to the database with COPY FROM STDIN instead of the ORM
+
+    Nothing is indexed, reindex the resources once the load is complete
+    (eg: "python manage.py es index_resources --use_multiprocessing")
+
+    Arguments:
+    resources -- a list of Resource instances, each with its tiles in resource.tiles
+
+    """
+
+    from arches.app.models.resource import Resource  # avoid a circular import
+
+    tiles = []
+    edits = []
+    timestamp = datetime.datetime.now()
+    descriptors = {}
+    if not settings.STREAMLINE_IMPORT:
+        descriptors = Resource.get_descriptors_in_bulk(
+            resources, tiles={str(resource.resourceinstanceid): resource.tiles for resource in resources}
+        )
+
+    for resource in resources:
+        tiles.extend(resource.tiles)
+        edits.append(
+            models.EditLog(
+                resourceclassid=resource.graph_id,
+                resourceinstanceid=resource.resourceinstanceid,
+                edittype="create",
+                note="",
+                userid="",
+                user_email="",
+                user_firstname="",
+                user_lastname="",
+                timestamp=timestamp,
+            )
+        )
+        if not settings.STREAMLINE_IMPORT:
+            displayname = descriptors[str(resource.resourceinstanceid)]["name"]
+            for tile in resource.tiles:
+                edits.append(
+                    models.EditLog(
+                        resourceclassid=resource.graph_id,
+                        resourceinstanceid=resource.resourceinstanceid,
+                        nodegroupid=tile.nodegroup_id,
+                        tileinstanceid=tile.tileid,
+                        resourcedisplayname=displayname,
+                        newvalue=tile.data,
+                        edittype="tile create",
+                        userid="",
+                        user_email="",
+                        user_firstname="",
+                        user_lastname="",
+                        user_username="",
+                        timestamp=timestamp,
+                    )
+                )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if settings.BULK_IMPORT_COPY_STAGING:
+            merge_into_table(cursor, models.ResourceInstance, resources)
+            merge_into_table(cursor, models.TileModel, tiles)
+            merge_edit_log(cursor, edits)
+        else:
+            copy_into_table(cursor, models.ResourceInstance, resources)
+            copy_into_table(cursor, models.TileModel, tiles)
+            copy_into_table(cursor, models.EditLog, edits)
+
+
+def copy_into_table(cursor, model, instances, table=None):
+    """
+    Writes model instances straight into a table (by default the model's own table) with COPY FROM STDIN
+
+    """
+
+    if len(instances) == 0:
+        return
+    fields = model._meta.concrete_fields
+    table = model._meta.db_table if table is None else table
+    cursor.copy_expert(
+        "COPY %s (%s) FROM STDIN" % (table, ", ".join('"%s"' % field.column for field in fields)),
+        get_copy_data(fields, instances),
+    )
+
+
+def copy_into_staging_table(cursor, model, instances):
+    """
+    Writes model instances into a temporary staging table with COPY FROM STDIN, returns the name of the table
+
+    The table is only visible to this connection and is dropped when the transaction ends,
+    so it doesn't outlive a load that fails part way through (must be called inside a transaction)
+
+    """
+
+    table = model._meta.db_table
+    staging_table = "%s_staging" % table
+    cursor.execute("DROP TABLE IF EXISTS %s" % staging_table)
+    cursor.execute("CREATE TEMP TABLE %s (LIKE %s INCLUDING DEFAULTS) ON COMMIT DROP" % (staging_table, table))
+    copy_into_table(cursor, model, instances, table=staging_table)
+    return staging_table
+
+
+def merge_into_table(cursor, model, instances):
+    """
+    Writes model instances into a staging table (see copy_into_staging_table)
+    and then merges them into the model's table with a single INSERT ... ON CONFLICT,
+    rows that already exist (eg: from a previous, partially completed load) are updated
+
+    """
+
+    if len(instances) == 0:
+        return
+    table = model._meta.db_table
+    fields = model._meta.concrete_fields
+    columns = ['"%s"' % field.column for field in fields]
+    pk = '"%s"' % model._meta.pk.column
+
+    staging_table = copy_into_staging_table(cursor, model, instances)
+    cursor.execute(
+        "INSERT INTO %s (%s) SELECT %s FROM %s ON CONFLICT (%s) DO UPDATE SET %s"
+        % (
+            table,
+            ", ".join(columns),
+            ", ".join(columns),
+            staging_table,
+            pk,
+            ", ".join("%s = EXCLUDED.%s" % (column, column) for column in columns if column != pk),
+        )
+    )
+    cursor.execute("DROP TABLE %s" % staging_table)
+
+
+def merge_edit_log(cursor, edits):
+    """
+    Writes edit log records into a staging table (see copy_into_staging_table) and then copies the ones
+    that aren't already in the edit log, so that rerunning a load doesn't duplicate the history of the
+    resources and tiles it had already created
+
+    """
+
+    if len(edits) == 0:
+        return
+    columns = ", ".join('"%s"' % field.column for field in models.EditLog._meta.concrete_fields)
+    staging_table = copy_into_staging_table(cursor, models.EditLog, edits)
+    cursor.execute(
+        """INSERT INTO edit_log (%(columns)s)
+        SELECT %(columns)s FROM %(staging_table)s s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM edit_log e
+            WHERE e.resourceinstanceid = s.resourceinstanceid
+                AND e.edittype = s.edittype
+                AND e.tileinstanceid IS NOT DISTINCT FROM s.tileinstanceid
+        )"""
+        % {"columns": columns, "staging_table": staging_table}
+    )
+    cursor.execute("DROP TABLE %s" % staging_table)
+
+
+def get_copy_data(fields, instances):
+    """
+    Returns the values of the given fields of each instance as a file of rows in the text format of COPY
+
+    """
+
+    data = StringIO()
+    for instance in instances:
+        data.write("\t".join(format_copy_value(field.pre_save(instance, True)) for field in fields))
+        data.write("\n")
+    data.seek(0)
+    return data
+
+
+def format_copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = JSONSerializer().serialize(value)
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
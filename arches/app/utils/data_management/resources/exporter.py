@@ -33,6 +33,15 @@ class ResourceExporter(object):
         resources = self.writer.write_resources(graph_id=graph_id, resourceinstanceids=resourceinstanceids)
         return resources
 
+    def export_to_dir(self, dest_dir, graph_id=None, resourceinstanceids=None):
+        """
+        Writes the export files straight to a directory rather than returning buffers of their contents,
+        returns the names of the files written
+
+        """
+
+        return self.writer.write_resources_to_dir(dest_dir, graph_id=graph_id, resourceinstanceids=resourceinstanceids)
+
     def zip_response(self, files_for_export, zip_file_name=None, file_type=None):
         '''
         Given a list of export file names, zips up all the files with those names and returns and http response.
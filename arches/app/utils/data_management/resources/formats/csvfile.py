@@ -14,6 +14,7 @@ from .format import Reader
 from elasticsearch import TransportError
 from arches.app.models.tile import Tile
 from arches.app.models.concept import Concept
+from arches.app.models.concept_labels import concept_labels
 from arches.app.models.models import (
     Node,
     NodeGroup,
@@ -24,6 +25,7 @@ from arches.app.models.models import (
 )
 from arches.app.utils.data_management.resource_graphs import exporter as GraphExporter
 from arches.app.models.resource import Resource
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.models.system_settings import settings
 from arches.app.datatypes.datatypes import DataTypeFactory
 from django.db import transaction
@@ -85,12 +87,7 @@ class CsvWriter(Writer):
     def __init__(self, **kwargs):
         super(CsvWriter, self).__init__(**kwargs)
         self.datatype_factory = DataTypeFactory()
-        self.node_datatypes = {
-            str(nodeid): datatype
-            for nodeid, datatype in Node.objects.values_list(
-                "nodeid", "datatype"
-            ).filter(~Q(datatype="semantic"), graph__isresource=True)
-        }
+        self.node_datatypes = {}
         self.single_file = kwargs.pop("single_file", False)
         self.resource_export_configs = self.read_export_configs(
             kwargs.pop("configs", None)
@@ -123,14 +120,25 @@ class CsvWriter(Writer):
         return value
 
     def write_resources(self, graph_id=None, resourceinstanceids=None, **kwargs):
+        csvs_for_export = []
+
+        def open_file(name):
+            dest = StringIO()
+            csvs_for_export.append({"name": name, "outputfile": dest})
+            return dest
+
+        self.write_files(open_file, graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+        return csvs_for_export
+
+    def write_files(self, open_file, graph_id=None, resourceinstanceids=None, **kwargs):
         # use the graph id from the mapping file, not the one passed in to the method
         graph_id = self.resource_export_configs[0]["resource_model_id"]
-        super(CsvWriter, self).write_resources(
+        tiles = self.get_tile_queryset(
             graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs
         )
+        self.node_datatypes = graph_metadata.get(self.graph_id).node_datatypes
+        concept_labels.load_nodes(graph_metadata.get(self.graph_id).nodes.values())
 
-        csv_records = []
-        other_group_records = []
         mapping = {}
         concept_export_value_lookup = {}
         for resource_export_config in self.resource_export_configs:
@@ -142,122 +150,103 @@ class CsvWriter(Writer):
                         "concept_export_value"
                     ]
         csv_header = ["ResourceID"] + list(mapping.values())
-        csvs_for_export = []
+        csv_name = os.path.join("{0}.{1}".format(self.file_name, "csv"))
+
+        csvwriter = csv.DictWriter(open_file(csv_name), delimiter=",", fieldnames=csv_header)
+        csvwriter.writeheader()
+        if self.single_file is not True:
+            groupwriter = csv.DictWriter(
+                open_file(csv_name.split(".")[0] + "_groups." + csv_name.split(".")[1]),
+                delimiter=",",
+                fieldnames=csv_header,
+            )
+            groupwriter.writeheader()
+        else:
+            groupwriter = csvwriter
 
-        for resourceinstanceid, tiles in self.resourceinstances.items():
-            csv_record = {}
-            csv_record["ResourceID"] = resourceinstanceid
-            csv_record["populated_node_groups"] = []
+        # each resource's rows are written as soon as its tiles have been read
+        for resourceinstanceid, resource_tiles in self.iter_tiles_by_resource(tiles):
+            csv_record, other_group_records = self.get_resource_records(
+                resourceinstanceid, resource_tiles, mapping, concept_export_value_lookup
+            )
+            if csv_record != {"ResourceID": resourceinstanceid}:
+                del csv_record["populated_node_groups"]
+                csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
+            for other_group_record in other_group_records:
+                groupwriter.writerow({k: str(v) for k, v in list(other_group_record.items())})
 
-            # parents = [p for p in tiles if p.parenttile_id is None]
-            # children = [c for c in tiles if c.parenttile_id is not None]
-            # tiles = parents + sorted(children, key=lambda k: k.parenttile_id)
-            try:
-                tiles = sorted(tiles, key=lambda k: k.parenttile_id)
-            except Exception as e:
-                print(e)
-
-            for tile in tiles:
-                other_group_record = {}
-                other_group_record["ResourceID"] = resourceinstanceid
-                if tile.data != {}:
-                    for k in list(tile.data.keys()):
-                        if tile.data[k] != "" and k in mapping and tile.data[k] != None:
-                            if (
-                                mapping[k] not in csv_record
-                                and tile.nodegroup_id
-                                not in csv_record["populated_node_groups"]
-                            ):
-                                concept_export_value_type = None
-                                if k in concept_export_value_lookup:
-                                    concept_export_value_type = concept_export_value_lookup[
-                                        k
-                                    ]
-                                if tile.data[k] != None:
-                                    value = self.transform_value_for_export(
-                                        self.node_datatypes[k],
-                                        tile.data[k],
-                                        concept_export_value_type,
-                                        k,
-                                    )
-                                    csv_record[mapping[k]] = value
-                                del tile.data[k]
-                            else:
-                                concept_export_value_type = None
-                                if k in concept_export_value_lookup:
-                                    concept_export_value_type = concept_export_value_lookup[
-                                        k
-                                    ]
+        if self.graph_id != None:
+            self.write_resource_relations(open_file, file_name=self.file_name)
+
+    def get_resource_records(self, resourceinstanceid, tiles, mapping, concept_export_value_lookup):
+        """
+        Returns the record of a resource and the records of its other groups of tiles
+
+        """
+
+        csv_record = {}
+        csv_record["ResourceID"] = resourceinstanceid
+        csv_record["populated_node_groups"] = []
+        other_group_records = []
+
+        # parents = [p for p in tiles if p.parenttile_id is None]
+        # children = [c for c in tiles if c.parenttile_id is not None]
+        # tiles = parents + sorted(children, key=lambda k: k.parenttile_id)
+        try:
+            tiles = sorted(tiles, key=lambda k: k.parenttile_id)
+        except Exception as e:
+            print(e)
+
+        for tile in tiles:
+            other_group_record = {}
+            other_group_record["ResourceID"] = resourceinstanceid
+            if tile.data != {}:
+                for k in list(tile.data.keys()):
+                    if tile.data[k] != "" and k in mapping and tile.data[k] != None:
+                        if (
+                            mapping[k] not in csv_record
+                            and tile.nodegroup_id
+                            not in csv_record["populated_node_groups"]
+                        ):
+                            concept_export_value_type = None
+                            if k in concept_export_value_lookup:
+                                concept_export_value_type = concept_export_value_lookup[
+                                    k
+                                ]
+                            if tile.data[k] != None:
                                 value = self.transform_value_for_export(
                                     self.node_datatypes[k],
                                     tile.data[k],
                                     concept_export_value_type,
                                     k,
                                 )
-                                other_group_record[mapping[k]] = value
-                        else:
+                                csv_record[mapping[k]] = value
                             del tile.data[k]
+                        else:
+                            concept_export_value_type = None
+                            if k in concept_export_value_lookup:
+                                concept_export_value_type = concept_export_value_lookup[
+                                    k
+                                ]
+                            value = self.transform_value_for_export(
+                                self.node_datatypes[k],
+                                tile.data[k],
+                                concept_export_value_type,
+                                k,
+                            )
+                            other_group_record[mapping[k]] = value
+                    else:
+                        del tile.data[k]
 
-                    csv_record["populated_node_groups"].append(tile.nodegroup_id)
-
-                if other_group_record != {"ResourceID": resourceinstanceid}:
-                    other_group_records.append(other_group_record)
-
-            if csv_record != {"ResourceID": resourceinstanceid}:
-                csv_records.append(csv_record)
-
-        csv_name = os.path.join("{0}.{1}".format(self.file_name, "csv"))
-
-        if self.single_file is not True:
-            dest = StringIO()
-            csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-            csvwriter.writeheader()
-            csvs_for_export.append({"name": csv_name, "outputfile": dest})
-            for csv_record in csv_records:
-                if "populated_node_groups" in csv_record:
-                    del csv_record["populated_node_groups"]
-                csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
-
-            dest = StringIO()
-            csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-            csvwriter.writeheader()
-            csvs_for_export.append(
-                {
-                    "name": csv_name.split(".")[0]
-                    + "_groups."
-                    + csv_name.split(".")[1],
-                    "outputfile": dest,
-                }
-            )
-            for csv_record in other_group_records:
-                if "populated_node_groups" in csv_record:
-                    del csv_record["populated_node_groups"]
-                csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
-        elif self.single_file == True:
-            all_records = csv_records + other_group_records
-            all_records = sorted(all_records, key=lambda k: k["ResourceID"])
-            dest = StringIO()
-            csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-            csvwriter.writeheader()
-            csvs_for_export.append({"name": csv_name, "outputfile": dest})
-            for csv_record in all_records:
-                if "populated_node_groups" in csv_record:
-                    del csv_record["populated_node_groups"]
-                csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
-
-        if self.graph_id != None:
-            csvs_for_export = csvs_for_export + self.write_resource_relations(
-                file_name=self.file_name
-            )
+                csv_record["populated_node_groups"].append(tile.nodegroup_id)
 
-        return csvs_for_export
+            if other_group_record != {"ResourceID": resourceinstanceid}:
+                other_group_records.append(other_group_record)
 
-    def write_resource_relations(self, file_name):
-        resourceids = list(self.resourceinstances.keys())
-        relations_file = []
+        return csv_record, other_group_records
 
+    def write_resource_relations(self, open_file, file_name):
         if self.graph_id != settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID:
-            dest = StringIO()
             csv_header = [
                 "resourcexid",
                 "resourceinstanceidfrom",
@@ -267,16 +256,17 @@ class CsvWriter(Writer):
                 "dateended",
                 "notes",
             ]
-            csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-            csvwriter.writeheader()
             csv_name = os.path.join("{0}.{1}".format(file_name, "relations"))
-            relations_file.append({"name": csv_name, "outputfile": dest})
+            csvwriter = csv.DictWriter(open_file(csv_name), delimiter=",", fieldnames=csv_header)
+            csvwriter.writeheader()
 
+            # the relations of the exported resources are selected in the database rather than from a list of their ids
+            resources = self.tiles.values("resourceinstance_id")
             relations = ResourceXResource.objects.filter(
-                Q(resourceinstanceidfrom__in=resourceids)
-                | Q(resourceinstanceidto__in=resourceids)
+                Q(resourceinstanceidfrom__in=resources)
+                | Q(resourceinstanceidto__in=resources)
             ).values(*csv_header)
-            for relation in relations:
+            for relation in relations.iterator(chunk_size=settings.EXPORT_TILE_CHUNK_SIZE):
                 relation["datestarted"] = (
                     relation["datestarted"] if relation["datestarted"] != None else ""
                 )
@@ -288,19 +278,12 @@ class CsvWriter(Writer):
                 )
                 csvwriter.writerow({k: str(v) for k, v in list(relation.items())})
 
-        return relations_file
-
 
 class TileCsvWriter(Writer):
     def __init__(self, **kwargs):
         super(TileCsvWriter, self).__init__(**kwargs)
         self.datatype_factory = DataTypeFactory()
-        self.node_datatypes = {
-            str(nodeid): datatype
-            for nodeid, datatype in Node.objects.values_list(
-                "nodeid", "datatype"
-            ).filter(~Q(datatype="semantic"), graph__isresource=True)
-        }
+        self.node_datatypes = {}
 
     def transform_value_for_export(
         self, datatype, value, concept_export_value_type, node
@@ -312,18 +295,28 @@ class TileCsvWriter(Writer):
         return value
 
     def write_resources(self, graph_id=None, resourceinstanceids=None, **kwargs):
-        super(TileCsvWriter, self).write_resources(
+        csvs_for_export = []
+
+        def open_file(name):
+            dest = StringIO()
+            csvs_for_export.append({"name": name, "outputfile": dest})
+            return dest
+
+        self.write_files(open_file, graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+        return csvs_for_export
+
+    def write_files(self, open_file, graph_id=None, resourceinstanceids=None, **kwargs):
+        # the resource is read with each tile for its legacyid
+        tiles = self.get_tile_queryset(
             graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs
-        )
+        ).select_related("resourceinstance")
+        self.node_datatypes = graph_metadata.get(self.graph_id).node_datatypes
+        concept_labels.load_nodes(graph_metadata.get(self.graph_id).nodes.values())
 
-        csv_records = []
-        other_group_records = []
         concept_export_value_lookup = {}
-        csv_header = ["ResourceID"]
         mapping = {}
-        nodes = Node.objects.filter(graph_id=self.graph_id)
-        for node in nodes:
-            mapping[str(node.nodeid)] = node.name
+        for nodeid, node in graph_metadata.get(self.graph_id).nodes.items():
+            mapping[nodeid] = node.name
         csv_header = [
             "ResourceID",
             "ResourceLegacyID",
@@ -332,11 +325,15 @@ class TileCsvWriter(Writer):
             "ParentTileID",
             "NodeGroupID",
         ] + list(mapping.values())
-        csvs_for_export = []
 
-        for resourceinstanceid, tiles in self.resourceinstances.items():
-            tiles = sorted(tiles, key=lambda k: k.parenttile_id)
-            for tile in tiles:
+        csv_name = os.path.join("{0}.{1}".format(self.file_name, "csv"))
+        csvwriter = csv.DictWriter(open_file(csv_name), delimiter=",", fieldnames=csv_header)
+        csvwriter.writeheader()
+
+        # each resource's rows are written as soon as its tiles have been read
+        for resourceinstanceid, resource_tiles in self.iter_tiles_by_resource(tiles):
+            resource_tiles = sorted(resource_tiles, key=lambda k: k.parenttile_id)
+            for tile in resource_tiles:
                 csv_record = {}
                 csv_record["ResourceID"] = resourceinstanceid
                 csv_record["ResourceModelID"] = self.graph_id
@@ -344,9 +341,7 @@ class TileCsvWriter(Writer):
                 csv_record["ParentTileID"] = str(tile.parenttile_id)
                 csv_record["NodeGroupID"] = str(tile.nodegroup_id)
                 for k in list(tile.data.keys()):
-                    resource_instance = ResourceInstance.objects.get(
-                        resourceinstanceid=resourceinstanceid
-                    )
+                    resource_instance = tile.resourceinstance
                     csv_record["ResourceLegacyID"] = (
                         str(resource_instance.legacyid)
                         if resource_instance.legacyid is not None
@@ -369,26 +364,15 @@ class TileCsvWriter(Writer):
                         del tile.data[k]
 
                 if csv_record != {"ResourceID": resourceinstanceid}:
-                    csv_records.append(csv_record)
-
-        dest = StringIO()
-        csvwriter = csv.DictWriter(dest, delimiter=",", fieldnames=csv_header)
-        csvwriter.writeheader()
-        all_records = sorted(csv_records, key=lambda k: k["ResourceID"])
-        for csv_record in all_records:
-            if "populated_node_groups" in csv_record:
-                del csv_record["populated_node_groups"]
-            csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
-
-        csv_name = os.path.join("{0}.{1}".format(self.file_name, "csv"))
-        csvs_for_export.append({"name": csv_name, "outputfile": dest})
-        if self.graph_id != None:
-            csvs_for_export = csvs_for_export
-
-        return csvs_for_export
+                    csvwriter.writerow({k: str(v) for k, v in list(csv_record.items())})
 
 
 class CsvReader(Reader):
+    def __init__(self):
+        super(CsvReader, self).__init__()
+        self.resources_saved = 0
+        self.tiles_saved = 0
+
     def save_resource(
         self,
         populated_tiles,
@@ -416,6 +400,8 @@ class CsvReader(Reader):
             # if bulk saving then append the resources to a list otherwise just save the resource
             if bulk:
                 resources.append(newresourceinstance)
+                self.resources_saved += 1
+                self.tiles_saved += len(newresourceinstance.get_flattened_tiles())
                 if len(resources) >= settings.BULK_IMPORT_BATCH_SIZE:
                     Resource.bulk_save(
                         resources=resources,
@@ -426,6 +412,8 @@ class CsvReader(Reader):
             else:
                 try:
                     newresourceinstance.save()
+                    self.resources_saved += 1
+                    self.tiles_saved += len(newresourceinstance.get_flattened_tiles())
                 except TransportError as e:
                     cause = json.dumps(e.info["error"]["caused_by"], indent=1)
                     msg = (
@@ -557,9 +545,15 @@ class CsvReader(Reader):
             with transaction.atomic():
                 save_count = 0
                 try:
+                    # business_data can be any iterable of rows (eg: a RowReader that streams
+                    # them from disk), so only the first row is read here
+                    first_row = next(iter(business_data))
                     resourceinstanceid = process_resourceid(
-                        business_data[0]["ResourceID"], overwrite
+                        first_row["ResourceID"], overwrite
                     )
+                except StopIteration:
+                    print("No business data to import")
+                    return
                 except KeyError:
                     print("*" * 80)
                     print(
@@ -614,7 +608,7 @@ class CsvReader(Reader):
                     required_nodes[str(node[0])] = node[1]
 
                 # This code can probably be moved into it's own module.
-                resourceids = []
+                resourceids = set()
                 non_contiguous_resource_ids = []
                 previous_row_for_validation = None
 
@@ -626,7 +620,7 @@ class CsvReader(Reader):
                     ):
                         non_contiguous_resource_ids.append(row["ResourceID"])
                     else:
-                        resourceids.append(row["ResourceID"])
+                        resourceids.add(row["ResourceID"])
                     previous_row_for_validation = row["ResourceID"]
 
                     if create_concepts == True:
@@ -1038,7 +1032,7 @@ class CsvReader(Reader):
                         resourceinstanceid = process_resourceid(
                             row["ResourceID"], overwrite
                         )
-                        populated_nodegroups[resourceinstanceid] = []
+                        populated_nodegroups = {resourceinstanceid: []}
 
                     source_data = column_names_to_targetids(row, mapping, row_number)
 
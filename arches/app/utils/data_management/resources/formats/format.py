@@ -2,13 +2,15 @@ import os
 import uuid
 import shutil
 import datetime
+from contextlib import ExitStack
+from itertools import groupby
 from arches.app.models.concept import Concept
 from arches.app.models import models
 from arches.app.models.models import ResourceXResource
 from arches.app.models.resource import Resource
 from arches.app.models.system_settings import settings
 from arches.app.utils.betterJSONSerializer import JSONSerializer
-from arches.app.utils.permission_backend import get_nodegroups_by_perm
+from arches.app.utils.permission_backend import get_nodegroup_ids_by_perm
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.gis.geos import GeometryCollection
 from django.contrib.gis.geos import MultiPoint
@@ -251,6 +253,36 @@ class Writer(object):
 
         pass
 
+    def write_resources_to_dir(self, dest_dir, graph_id=None, resourceinstanceids=None, **kwargs):
+        """
+        Writes the export files straight to a directory, returns the names of the files written
+
+        """
+
+        names = []
+        with ExitStack() as stack:
+
+            def open_file(name):
+                names.append(name)
+                return stack.enter_context(open(os.path.join(dest_dir, name), "w", newline=""))
+
+            self.write_files(open_file, graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+        return names
+
+    def write_files(self, open_file, graph_id=None, resourceinstanceids=None, **kwargs):
+        """
+        Writes each export file to the file object returned by open_file(file name)
+
+        Writers that can stream their output override this so that they only hold the tiles of
+        one resource in memory at a time (see iter_tiles_by_resource), by default the buffers
+        returned by write_resources are copied
+
+        """
+
+        for f in self.write_resources(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs):
+            f["outputfile"].seek(0)
+            shutil.copyfileobj(f["outputfile"], open_file(f["name"]), 16 * 1024)
+
     def get_tiles(self, graph_id=None, resourceinstanceids=None, **kwargs):
         """
         Returns a dictionary of tiles keyed by their resourceinstanceid
@@ -262,13 +294,26 @@ class Writer(object):
 
         """
 
+        for tile in self.get_tile_queryset(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs):
+            try:
+                self.resourceinstances[tile.resourceinstance_id].append(tile)
+            except:
+                self.resourceinstances[tile.resourceinstance_id] = []
+                self.resourceinstances[tile.resourceinstance_id].append(tile)
+
+        return self.resourceinstances
+
+    def get_tile_queryset(self, graph_id=None, resourceinstanceids=None, **kwargs):
+        """
+        Returns a queryset of the tiles to export (the ones the user, if any, can read)
+        and sets the graph and file name of the export
+
+        """
+
         user = kwargs.get("user", None)
         permitted_nodegroups = []
         if user:
-            permitted_nodegroups = [
-                str(nodegroup.pk)
-                for nodegroup in get_nodegroups_by_perm(user, "models.read_nodegroup")
-            ]
+            permitted_nodegroups = list(get_nodegroup_ids_by_perm(user, "models.read_nodegroup"))
 
         if (graph_id is None or graph_id is False) and resourceinstanceids is None:
             raise MissingGraphException(
@@ -300,14 +345,20 @@ class Writer(object):
         self.file_prefix = self.graph_model.name.replace(" ", "_")
         self.file_name = "{0}_{1}".format(self.file_prefix, iso_date)
 
-        for tile in self.tiles:
-            try:
-                self.resourceinstances[tile.resourceinstance_id].append(tile)
-            except:
-                self.resourceinstances[tile.resourceinstance_id] = []
-                self.resourceinstances[tile.resourceinstance_id].append(tile)
+        return self.tiles
 
-        return self.resourceinstances
+    def iter_tiles_by_resource(self, tiles):
+        """
+        Yields a (resourceinstanceid, list of tiles) pair for each resource in a tile queryset
+
+        The tiles are read in resource order with a server side cursor, so only the tiles
+        of one resource are held in memory at a time
+
+        """
+
+        tiles = tiles.order_by("resourceinstance_id").iterator(chunk_size=settings.EXPORT_TILE_CHUNK_SIZE)
+        for resourceinstanceid, resource_tiles in groupby(tiles, key=lambda tile: tile.resourceinstance_id):
+            yield resourceinstanceid, list(resource_tiles)
 
     def get_field_map_values(self, resource, template_record, field_map):
         """
@@ -8,6 +8,7 @@ from io import StringIO
 from django.urls import reverse
 from .format import Writer, Reader
 from arches.app.models import models
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.models.resource import Resource
 from arches.app.models.graph import Graph as GraphProxy
 from arches.app.models.tile import Tile
@@ -23,12 +24,28 @@ from pyld.jsonld import compact, frame, from_rdf, to_rdf, expand
 
 class RdfWriter(Writer):
 
+    # line based formats that are written one resource at a time rather than from a graph of every resource
+    streamed_formats = ('nt', 'nquads')
+
     def __init__(self, **kwargs):
         self.format = kwargs.pop('format', 'xml')
         self.logger = logging.getLogger(__name__)
+        self.graph_cache = {}
+        self.dt_factory = DataTypeFactory()
         super(RdfWriter, self).__init__(**kwargs)
 
     def write_resources(self, graph_id=None, resourceinstanceids=None, **kwargs):
+        if self.format in self.streamed_formats:
+            files_for_export = []
+
+            def open_file(name):
+                dest = StringIO()
+                files_for_export.append({'name': name, 'outputfile': dest})
+                return dest
+
+            self.write_files(open_file, graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+            return files_for_export
+
         super(RdfWriter, self).write_resources(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
 
         dest = StringIO()
@@ -38,125 +55,165 @@ class RdfWriter(Writer):
         full_file_name = os.path.join('{0}.{1}'.format(self.file_name, 'rdf'))
         return [{'name': full_file_name, 'outputfile': dest}]
 
+    def write_files(self, open_file, graph_id=None, resourceinstanceids=None, **kwargs):
+        """
+        N-Triples and N-Quads are written one resource at a time, each resource's triples are serialized
+        as soon as its tiles have been read (in N-Quads each resource's triples are in a graph named by its uri)
+
+        """
+
+        if self.format not in self.streamed_formats:
+            return super(RdfWriter, self).write_files(open_file, graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+
+        tiles = self.get_tile_queryset(graph_id=graph_id, resourceinstanceids=resourceinstanceids, **kwargs)
+        archesproject = Namespace(settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT)
+        dest = open_file(os.path.join('{0}.{1}'.format(self.file_name, 'rdf')))
+        for resourceinstanceid, resource_tiles in self.iter_tiles_by_resource(tiles):
+            g = Graph()
+            if self.format == 'nquads':
+                resource_uri = archesproject[reverse('resources', args=[resourceinstanceid]).lstrip('/')]
+                self.add_resource_to_graph(g.get_context(resource_uri), resourceinstanceid, resource_tiles)
+            else:
+                self.add_resource_to_graph(g, resourceinstanceid, resource_tiles)
+            dest.write(g.serialize(format=self.format).decode('utf-8'))
+
+    def get_graph_parts(self, graphid):
+        """
+        Returns the edges of a graph grouped by the nodegroup they belong to
+
+        The nodes of the graph come from graph_metadata and its edges are read with a single query,
+        each edge is given its domain and range node objects so writing the triples of a tile
+        doesn't go back to the database
+
+        """
+
+        graphid = str(graphid)
+        if graphid not in self.graph_cache:
+            metadata = graph_metadata.get(graphid)
+            graph_parts = {
+                'rootedges': [],
+                'subgraphs': {},
+                'nodedatatypes': metadata.node_datatypes,
+            }
+            edges_by_domainnode = {}
+            inedges = {}
+            for edge in models.Edge.objects.filter(domainnode__graph_id=graphid):
+                edge.domainnode = metadata.get_node(edge.domainnode_id)
+                edge.rangenode = metadata.get_node(edge.rangenode_id)
+                edges_by_domainnode.setdefault(str(edge.domainnode_id), []).append(edge)
+                inedges[str(edge.rangenode_id)] = edge
+
+            def get_nodegroup_edges_by_collector_node(node):
+                edges = []
+                nodegroupid = node.nodegroup_id
+
+                def getchildedges(node):
+                    for edge in edges_by_domainnode.get(str(node.nodeid), []):
+                        if nodegroupid == edge.rangenode.nodegroup_id:
+                            edges.append(edge)
+                            getchildedges(edge.rangenode)
+
+                getchildedges(node)
+                return edges
+
+            for node in metadata.nodes.values():
+                if node.istopnode:
+                    for edge in get_nodegroup_edges_by_collector_node(node):
+                        if edge.rangenode.nodegroup_id is None:
+                            graph_parts['rootedges'].append(edge)
+            for nodegroupid in metadata.nodegroups:
+                inedge = inedges[nodegroupid]
+                graph_parts['subgraphs'][nodegroupid] = {
+                    'edges': get_nodegroup_edges_by_collector_node(metadata.get_node(nodegroupid)),
+                    'inedge': inedge,
+                    'parentnode_nodegroup': inedge.domainnode.nodegroup_id,
+                }
+            self.graph_cache[graphid] = graph_parts
+
+        return self.graph_cache[graphid]
+
+    def add_edge_to_graph(self, graph, domainnode, rangenode, edge, tile, graph_info):
+        pkg = {}
+        pkg['d_datatype'] = graph_info['nodedatatypes'].get(str(edge.domainnode_id))
+        pkg['r_datatype'] = graph_info['nodedatatypes'].get(str(edge.rangenode_id))
+        pkg['d_uri'] = domainnode
+        pkg['r_uri'] = rangenode
+        pkg['range_tile_data'] = None
+        pkg['domain_tile_data'] = None
+        if tile is not None and str(edge.rangenode_id) in tile.data:
+            pkg['range_tile_data'] = tile.data[str(edge.rangenode_id)]
+        if tile is not None and str(edge.domainnode_id) in tile.data:
+            pkg['domain_tile_data'] = tile.data[str(edge.domainnode_id)]
+
+        # Don't add the type if the domain datatype is a literal
+        dom_dt = self.dt_factory.get_instance(pkg['d_datatype'])
+        if dom_dt.is_a_literal_in_rdf():
+            # Return to not process any range data of an edge where
+            # the domain will be a Literal in the RDF
+            return
+
+        # Domain node is not a literal value in the RDF representation, so will have a type:
+        graph.add((domainnode, RDF.type, URIRef(edge.domainnode.ontologyclass)))
+
+        # Use the range node's datatype.to_rdf() method to generate an RDF representation of it
+        # and add its triples to the core graph
+        dt = self.dt_factory.get_instance(pkg['r_datatype'])
+        graph += dt.to_rdf(pkg, edge)
+
+    def add_resource_to_graph(self, graph, resourceinstanceid, tiles):
+        """
+        Adds the triples of a resource instance (given its tiles) to an rdflib graph
+
+        """
+
+        archesproject = Namespace(settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT)
+        graph_info = self.get_graph_parts(self.graph_id)
+
+        # add the edges for the group of nodes that include the root (this group of nodes has no nodegroup)
+        for edge in graph_info['rootedges']:
+            domainnode = archesproject[str(edge.domainnode_id)]
+            rangenode = archesproject[str(edge.rangenode_id)]
+            self.add_edge_to_graph(graph, domainnode, rangenode, edge, None, graph_info)
+
+        for tile in tiles:
+            subgraph = graph_info['subgraphs'][str(tile.nodegroup_id)]
+
+            # add all the edges for a given tile/nodegroup
+            for edge in subgraph['edges']:
+                domainnode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.domainnode_id))]
+                rangenode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.rangenode_id))]
+                self.add_edge_to_graph(graph, domainnode, rangenode, edge, tile, graph_info)
+
+            # add the edge from the parent node to this tile's root node
+            # where the tile has no parent tile, which means the domain node has no tile_id
+            if subgraph['parentnode_nodegroup'] is None:
+                edge = subgraph['inedge']
+                if edge.domainnode.istopnode:
+                    domainnode = archesproject[reverse('resources', args=[resourceinstanceid]).lstrip('/')]
+                else:
+                    domainnode = archesproject[str(edge.domainnode_id)]
+                rangenode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.rangenode_id))]
+                self.add_edge_to_graph(graph, domainnode, rangenode, edge, tile, graph_info)
+
+            # add the edge from the parent node to this tile's root node
+            # where the tile has a parent tile
+            if subgraph['parentnode_nodegroup'] is not None:
+                edge = subgraph['inedge']
+                domainnode = archesproject["tile/%s/node/%s" % (str(tile.parenttile_id), str(edge.domainnode_id))]
+                rangenode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.rangenode_id))]
+                self.add_edge_to_graph(graph, domainnode, rangenode, edge, tile, graph_info)
+
     def get_rdf_graph(self):
         archesproject = Namespace(settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT)
         graph_uri = URIRef(archesproject[reverse('graph', args=[self.graph_id]).lstrip('/')])
         self.logger.debug("Using `{0}` for Arches URI namespace".format(settings.ARCHES_NAMESPACE_FOR_DATA_EXPORT))
         self.logger.debug("Using `{0}` for Graph URI".format(graph_uri))
 
-        dt_factory = DataTypeFactory()
         g = Graph()
         g.bind('archesproject', archesproject, False)
-        graph_cache = {}
-
-        def get_nodegroup_edges_by_collector_node(node):
-            edges = []
-            nodegroup = node.nodegroup
-
-            def getchildedges(node):
-                for edge in models.Edge.objects.filter(domainnode=node):
-                    if nodegroup == edge.rangenode.nodegroup:
-                        edges.append(edge)
-                        getchildedges(edge.rangenode)
-
-            getchildedges(node)
-            return edges
-
-        def get_graph_parts(graphid):
-            if graphid not in graph_cache:
-                graph_cache[graphid] = {
-                    'rootedges': [],
-                    'subgraphs': {},
-                    'nodedatatypes': {},
-                }
-                graph = models.GraphModel.objects.get(pk=graphid)
-                nodegroups = set()
-                for node in graph.node_set.all():
-                    graph_cache[graphid]['nodedatatypes'][str(node.nodeid)] = node.datatype
-                    if node.nodegroup:
-                        nodegroups.add(node.nodegroup)
-                    if node.istopnode:
-                        for edge in get_nodegroup_edges_by_collector_node(node):
-                            if edge.rangenode.nodegroup is None:
-                                graph_cache[graphid]['rootedges'].append(edge)
-                for nodegroup in nodegroups:
-                    graph_cache[graphid]['subgraphs'][nodegroup] = {
-                        'edges': [],
-                        'inedge': None,
-                        'parentnode_nodegroup': None
-                    }
-                    graph_cache[graphid]['subgraphs'][nodegroup][
-                        'inedge'] = models.Edge.objects.get(rangenode_id=nodegroup.pk)
-                    graph_cache[graphid]['subgraphs'][nodegroup]['parentnode_nodegroup'] = graph_cache[
-                        graphid]['subgraphs'][nodegroup]['inedge'].domainnode.nodegroup
-                    graph_cache[graphid]['subgraphs'][nodegroup][
-                        'edges'] = get_nodegroup_edges_by_collector_node(models.Node.objects.get(pk=nodegroup.pk))
-
-            return graph_cache[graphid]
-
-        def add_edge_to_graph(graph, domainnode, rangenode, edge, tile, graph_info):
-            pkg = {}
-            pkg['d_datatype'] = graph_info['nodedatatypes'].get(str(edge.domainnode.pk))
-            pkg['r_datatype'] = graph_info['nodedatatypes'].get(str(edge.rangenode.pk))
-            pkg['d_uri'] = domainnode
-            pkg['r_uri'] = rangenode
-            pkg['range_tile_data'] = None
-            pkg['domain_tile_data'] = None
-            if str(edge.rangenode_id) in tile.data:
-                pkg['range_tile_data'] = tile.data[str(edge.rangenode_id)]
-            if str(edge.domainnode_id) in tile.data:
-                pkg['domain_tile_data'] = tile.data[str(edge.domainnode_id)]
-
-            # Don't add the type if the domain datatype is a literal
-            dom_dt = dt_factory.get_instance(pkg['d_datatype'])
-            if dom_dt.is_a_literal_in_rdf():
-                # Return to not process any range data of an edge where
-                # the domain will be a Literal in the RDF
-                return
-
-            # Domain node is not a literal value in the RDF representation, so will have a type:
-            graph.add((domainnode, RDF.type, URIRef(edge.domainnode.ontologyclass)))
-
-            # Use the range node's datatype.to_rdf() method to generate an RDF representation of it
-            # and add its triples to the core graph
-            dt = dt_factory.get_instance(pkg['r_datatype'])
-            graph += dt.to_rdf(pkg, edge)
-
 
         for resourceinstanceid, tiles in self.resourceinstances.items():
-            graph_info = get_graph_parts(self.graph_id)
-
-            # add the edges for the group of nodes that include the root (this group of nodes has no nodegroup)
-            for edge in graph_cache[self.graph_id]['rootedges']:
-                domainnode = archesproject[str(edge.domainnode.pk)]
-                rangenode = archesproject[str(edge.rangenode.pk)]
-                add_edge_to_graph(g, domainnode, rangenode, edge, None, graph_info)
-
-            for tile in tiles:
-                # add all the edges for a given tile/nodegroup
-                for edge in graph_info['subgraphs'][tile.nodegroup]['edges']:
-                    domainnode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.domainnode.pk))]
-                    rangenode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.rangenode.pk))]
-                    add_edge_to_graph(g, domainnode, rangenode, edge, tile, graph_info)
-
-                # add the edge from the parent node to this tile's root node
-                # where the tile has no parent tile, which means the domain node has no tile_id
-                if graph_info['subgraphs'][tile.nodegroup]['parentnode_nodegroup'] is None:
-                    edge = graph_info['subgraphs'][tile.nodegroup]['inedge']
-                    if edge.domainnode.istopnode:
-                        domainnode = archesproject[reverse('resources', args=[resourceinstanceid]).lstrip('/')]
-                    else:
-                        domainnode = archesproject[str(edge.domainnode.pk)]
-                    rangenode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.rangenode.pk))]
-                    add_edge_to_graph(g, domainnode, rangenode, edge, tile, graph_info)
-
-                # add the edge from the parent node to this tile's root node
-                # where the tile has a parent tile
-                if graph_info['subgraphs'][tile.nodegroup]['parentnode_nodegroup'] is not None:
-                    edge = graph_info['subgraphs'][tile.nodegroup]['inedge']
-                    domainnode = archesproject["tile/%s/node/%s" % (str(tile.parenttile.pk), str(edge.domainnode.pk))]
-                    rangenode = archesproject["tile/%s/node/%s" % (str(tile.pk), str(edge.rangenode.pk))]
-                    add_edge_to_graph(g, domainnode, rangenode, edge, tile, graph_info)
+            self.add_resource_to_graph(g, resourceinstanceid, tiles)
         return g
 
 
@@ -7,7 +7,9 @@ import importlib
 import datetime
 from io import StringIO
 from time import time
+from collections import deque
 from copy import deepcopy
+from itertools import groupby
 from optparse import make_option
 from os.path import isfile, join
 from multiprocessing import Pool, TimeoutError, cpu_count
@@ -43,6 +45,7 @@ from arches.management.commands import utils
 from arches.setup import unzip_file
 from .formats.csvfile import CsvReader
 from .formats.archesfile import ArchesFileReader
+from .formats.format import ResourceImportReporter
 
 
 
@@ -57,6 +60,78 @@ def import_one_resource(line):
     reader.import_business_data({"resources": [archesresource]})
 
 
+def import_csv_rows(rows, mapping, overwrite):
+    """this function imports the csv rows of a group of whole resources and must be outside
+    of the BusinessDataImporter class in order for it to be called with multiprocessing"""
+
+    connections.close_all()
+    reader = CsvReader()
+    try:
+        reader.import_business_data(business_data=rows, mapping=mapping, overwrite=overwrite, bulk=True)
+    except SystemExit:
+        # CsvReader exits on fatal errors, which would otherwise kill the worker process and leave the pool waiting
+        reader.errors.append({'type': 'ERROR', 'message': 'The import of the resources starting with ResourceID {0} was stopped, see the preceding messages'.format(rows[0]['ResourceID'])})
+    return reader.errors, reader.resources_saved, reader.tiles_saved
+
+
+def imap_bounded(pool, func, tasks, max_pending):
+    """
+    Like Pool.imap, calls func with each tuple of arguments in tasks and yields the results in order,
+    but never reads more than max_pending tasks ahead of the results (Pool.imap reads every task
+    into its queue as fast as it can, which for a large file means holding the whole file in memory)
+
+    """
+
+    pending = deque()
+    for args in tasks:
+        pending.append(pool.apply_async(func, args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+
+def group_rows_by_resource(rows, batch_size):
+    """
+    Splits csv rows (which must be sorted by ResourceID) into lists holding
+    the rows of up to batch_size whole resources
+
+    """
+
+    batch = []
+    resource_count = 0
+    for resourceid, resource_rows in groupby(rows, key=lambda row: row['ResourceID']):
+        batch.extend(resource_rows)
+        resource_count += 1
+        if resource_count >= batch_size:
+            yield batch
+            batch = []
+            resource_count = 0
+    if len(batch) > 0:
+        yield batch
+
+
+class RowReader(object):
+    """
+    Wraps a function that yields rows of business data so that the rows can be read
+    more than once without holding them all in memory, each iteration calls the function again
+
+    """
+
+    def __init__(self, read_rows, *args):
+        self.read_rows = read_rows
+        self.args = args
+
+    def __iter__(self):
+        return iter(self.read_rows(*self.args))
+
+
+def read_csv_rows(path):
+    with open(path, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
 class BusinessDataImporter(object):
 
     def __init__(self, file=None, mapping_file=None, relations_file=None):
@@ -123,8 +198,7 @@ class BusinessDataImporter(object):
                             if 'business_data' in list(archesfile.keys()):
                                 self.business_data = archesfile['business_data']
                     elif self.file_format == 'csv':
-                        data = csv.DictReader(open(file[0], encoding='utf-8'))
-                        self.business_data = list(data)
+                        self.business_data = RowReader(read_csv_rows, file[0])
                     elif self.file_format == 'zip':
                         shp_zipfile = os.path.basename(path)
                         shp_zipfile_name = os.path.splitext(shp_zipfile)[0]
@@ -172,21 +246,29 @@ class BusinessDataImporter(object):
                 reader.import_business_data(business_data, mapping)
             elif file_format == 'jsonl':
                 with open(self.file[0], 'rU') as openf:
-                    lines = openf.readlines()
                     if use_multiprocessing is True:
+                        connections.close_all()
                         pool = Pool(cpu_count())
-                        pool.map(import_one_resource, lines)
+                        for result in imap_bounded(pool, import_one_resource, ((line,) for line in openf), cpu_count() * 100):
+                            pass
+                        pool.close()
+                        pool.join()
                         connections.close_all()
                         reader = ArchesFileReader()
                     else:
                         reader = ArchesFileReader()
-                        for line in lines:
+                        for line in openf:
                             archesresource = JSONDeserializer().deserialize(line)
                             reader.import_business_data({"resources": [archesresource]})
             elif file_format == 'csv' or file_format == 'shp' or file_format == 'zip':
                 if mapping != None:
-                    reader = CsvReader()
-                    reader.import_business_data(business_data=business_data, mapping=mapping, overwrite=overwrite, bulk=bulk, create_concepts=create_concepts, create_collections=create_collections)
+                    if use_multiprocessing is True and create_concepts is True:
+                        print('Concepts can\'t be created while importing with multiprocessing, importing in a single process')
+                    if use_multiprocessing is True and create_concepts is not True:
+                        reader = self.import_csv_with_multiprocessing(business_data, mapping, overwrite)
+                    else:
+                        reader = CsvReader()
+                        reader.import_business_data(business_data=business_data, mapping=mapping, overwrite=overwrite, bulk=bulk, create_concepts=create_concepts, create_collections=create_collections)
                 else:
                     print('*'*80)
                     print('ERROR: No mapping file detected. Please indicate one with the \'-c\' paramater or place one in the same directory as your business data.')
@@ -205,13 +287,64 @@ class BusinessDataImporter(object):
                 datatype_instance = datatype_factory.get_instance(datatype.datatype)
                 datatype_instance.after_update_all()
 
+    def import_csv_with_multiprocessing(self, business_data, mapping, overwrite, max_subprocesses=0):
+        """
+        Imports csv business data in several processes at once, each process transforms, validates
+        and bulk saves (to the database and Elasticsearch) the rows of BULK_IMPORT_BATCH_SIZE resources
+        at a time. Returns a CsvReader holding the errors reported by all of the processes
+
+        """
+
+        reader = CsvReader()
+
+        # the rows are sent to the processes one resource at a time, so they have to be contiguous
+        resourceids = set()
+        previous_resourceid = None
+        for row in business_data:
+            if 'ResourceID' not in row:
+                print('*'*80)
+                print('ERROR: No column \'ResourceID\' found in business data file. Please add a \'ResourceID\' column with a unique resource identifier.')
+                print('*'*80)
+                sys.exit()
+            if row['ResourceID'] != previous_resourceid:
+                if row['ResourceID'] in resourceids:
+                    print('*'*80)
+                    print('ResourceID: ' + row['ResourceID'])
+                    print('ERROR: The preceding ResourceID is non-contiguous in your csv file. Please sort your csv file by ResourceID and try import again.')
+                    print('*'*80)
+                    sys.exit()
+                resourceids.add(row['ResourceID'])
+                previous_resourceid = row['ResourceID']
+
+        reporter = ResourceImportReporter({'resources': resourceids})
+        del resourceids
+
+        process_count = cpu_count() if max_subprocesses == 0 else max_subprocesses
+        tasks = ((rows, mapping, overwrite) for rows in group_rows_by_resource(business_data, settings.BULK_IMPORT_BATCH_SIZE))
+        connections.close_all()
+        pool = Pool(process_count)
+        try:
+            for errors, resources_saved, tiles_saved in imap_bounded(pool, import_csv_rows, tasks, process_count * 2):
+                reader.errors += errors
+                reporter.update_tiles(tiles_saved)
+                reporter.update_tiles_saved(tiles_saved)
+                reporter.update_resources_saved(resources_saved)
+        finally:
+            pool.close()
+            pool.join()
+            connections.close_all()
+
+        reporter.report_results()
+        return reader
+
     def shape_to_csv(self, shp_path):
-        csv_records = []
+        return RowReader(self.read_shape_rows, shp_path)
+
+    def read_shape_rows(self, shp_path):
         ds = DataSource(shp_path)
         layer = ds[0]
         field_names = layer.fields
         for feat in layer:
             csv_record = dict((f, feat.get(f)) for f in field_names)
             csv_record['geom'] = feat.geom.wkt
-            csv_records.append(csv_record)
-        return csv_records
+            yield csv_record
@@ -1,18 +1,22 @@
-from django.db import connection
+import os
+import json
+from multiprocessing import Pool, cpu_count
+from django.db import connection, connections
 from django.db.models import Q
 from arches.app.models import models
 from arches.app.models.models import Value
 from arches.app.models.resource import Resource
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.models.system_settings import settings
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Query, Term
 from arches.app.search.base_index import get_index
 from arches.app.datatypes.datatypes import DataTypeFactory
-from arches.app.utils import import_class_from_string
+from arches.app.utils import import_class_from_string, chunks
 from datetime import datetime
 
 
-def index_db(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
+def index_db(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE, use_multiprocessing=False, max_subprocesses=0, resume=False):
     """
     Deletes any existing indicies from elasticsearch and then indexes all
     concepts and resources from the database
@@ -20,15 +24,18 @@ def index_db(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
     Keyword Arguments:
     clear_index -- set to True to remove all the resources and concepts from the index before the reindexing operation
     batch_size -- the number of records to index as a group, the larger the number to more memory required
+    use_multiprocessing -- set to True to index resources in parallel using a pool of processes
+    max_subprocesses -- the number of processes to use when use_multiprocessing is True, 0 (default) uses one per cpu
+    resume -- set to True to continue an interrupted multiprocessing run from its last checkpoint
 
     """
 
     index_concepts(clear_index=clear_index, batch_size=batch_size)
-    index_resources(clear_index=clear_index, batch_size=batch_size)
+    index_resources(clear_index=clear_index, batch_size=batch_size, use_multiprocessing=use_multiprocessing, max_subprocesses=max_subprocesses, resume=resume)
     index_resource_relations(clear_index=clear_index, batch_size=batch_size)
 
 
-def index_resources(clear_index=True, index_name=None, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
+def index_resources(clear_index=True, index_name=None, batch_size=settings.BULK_IMPORT_BATCH_SIZE, use_multiprocessing=False, max_subprocesses=0, resume=False):
     """
     Indexes all resources from the database
 
@@ -36,19 +43,24 @@ def index_resources(clear_index=True, index_name=None, batch_size=settings.BULK_
     clear_index -- set to True to remove all the resources from the index before the reindexing operation
     index_name -- only applies to custom indexes and if given will try and just refresh the data in that index
     batch_size -- the number of records to index as a group, the larger the number to more memory required
+    use_multiprocessing -- set to True to index resources in parallel using a pool of processes
+    max_subprocesses -- the number of processes to use when use_multiprocessing is True, 0 (default) uses one per cpu
+    resume -- set to True to continue an interrupted multiprocessing run from its last checkpoint
 
     """
 
     se = SearchEngineFactory().create()
-    if clear_index and index_name is None:
+    if clear_index and index_name is None and resume is False:
         q = Query(se=se)
         q.delete(index='terms')
 
     resource_types = models.GraphModel.objects.filter(isresource=True).exclude(graphid=settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID).values_list('graphid', flat=True)
-    index_resources_by_type(resource_types, clear_index=clear_index, index_name=index_name, batch_size=batch_size)
+    index_resources_by_type(resource_types, clear_index=clear_index, index_name=index_name, batch_size=batch_size,
+        use_multiprocessing=use_multiprocessing, max_subprocesses=max_subprocesses, resume=resume)
 
 
-def index_resources_by_type(resource_types, clear_index=True, index_name=None, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
+def index_resources_by_type(resource_types, clear_index=True, index_name=None, batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+        use_multiprocessing=False, max_subprocesses=0, resume=False):
     """
     Indexes all resources of a given type(s)
 
@@ -59,17 +71,28 @@ def index_resources_by_type(resource_types, clear_index=True, index_name=None, b
     clear_index -- set to True to remove all the resources of the types passed in from the index before the reindexing operation
     index_name -- only applies to custom indexes and if given will try and just refresh the data in that index
     batch_size -- the number of records to index as a group, the larger the number to more memory required
+    use_multiprocessing -- set to True to split each resource type into id ranges of "batch_size" resources and index them in parallel
+    max_subprocesses -- the number of processes to use when use_multiprocessing is True, 0 (default) uses one per cpu
+    resume -- set to True to skip the resource types and id ranges already indexed by an interrupted multiprocessing run
+
+    The checkpoints of a multiprocessing run (see _write_checkpoint) are only removed once every resource type
+    has been indexed, so resuming skips the types that completed before the run was interrupted
 
     """
     
     status = ''
     se = SearchEngineFactory().create()
     datatype_factory = DataTypeFactory()
-    node_datatypes = {str(nodeid): datatype for nodeid, datatype in models.Node.objects.values_list('nodeid', 'datatype')}
 
     status = ''
+    if use_multiprocessing and index_name is None and resume is False:
+        # checkpoints left by an earlier interrupted run don't apply to a new one
+        for resource_type in resource_types:
+            _clear_checkpoint(resource_type)
+
     for resource_type in resource_types:
         start = datetime.now()
+        node_datatypes = graph_metadata.get(resource_type).node_datatypes
         resources = Resource.objects.filter(graph_id=str(resource_type))
         graph_name = models.GraphModel.objects.get(graphid=str(resource_type)).name
         print("Indexing resource type '{0}'".format(graph_name))
@@ -78,18 +101,27 @@ def index_resources_by_type(resource_types, clear_index=True, index_name=None, b
             q = Query(se=se)
             term = Term(field='graph_id', term=str(resource_type))
             q.add_query(term)
-            if clear_index:
+            checkpoint = _read_checkpoint(resource_type) if use_multiprocessing and resume else None
+            if checkpoint is not None and checkpoint['completed']:
+                print("Skipping resource type '{0}', it was indexed before the run was interrupted".format(graph_name))
+                continue
+            if clear_index and checkpoint is None:
                 q.delete(index='resources', refresh=True)
 
-            with se.BulkIndexer(batch_size=batch_size, refresh=True) as doc_indexer:
-                with se.BulkIndexer(batch_size=batch_size, refresh=True) as term_indexer:
-                    for resource in resources:
-                        document, terms = resource.get_documents_to_index(fetchTiles=True, datatype_factory=datatype_factory, node_datatypes=node_datatypes)
-                        doc_indexer.add(index='resources', id=document['resourceinstanceid'], data=document)
-                        for term in terms:
-                            term_indexer.add(index='terms', id=term['_id'], data=term['_source'])
-
-            result_summary = {'database': len(resources), 'indexed': se.count(index='resources', body=q.dsl)}
+            if use_multiprocessing:
+                _index_resources_by_partition(resource_type, batch_size=batch_size, max_subprocesses=max_subprocesses,
+                    checkpoint=checkpoint['start'] if checkpoint is not None else None)
+            else:
+                with se.BulkIndexer(batch_size=batch_size, refresh=True) as doc_indexer:
+                    with se.BulkIndexer(batch_size=batch_size, refresh=True) as term_indexer:
+                        for resource_batch in chunks(resources.iterator(), batch_size):
+                            documents, terms = Resource.get_documents_to_index_in_bulk(resource_batch, datatype_factory=datatype_factory, node_datatypes=node_datatypes)
+                            for document in documents:
+                                doc_indexer.add(index='resources', id=document['resourceinstanceid'], data=document)
+                            for term in terms:
+                                term_indexer.add(index='terms', id=term['_id'], data=term['_source'])
+
+            result_summary = {'database': resources.count(), 'indexed': se.count(index='resources', body=q.dsl)}
             status = 'Passed' if result_summary['database'] == result_summary['indexed'] else 'Failed'
             print("Status: {0}, Resource Type: {1}, In Database: {2}, Indexed: {3}, Took: {4} seconds".format(status, graph_name, result_summary['database'], result_summary['indexed'], (datetime.now()-start).seconds))
 
@@ -97,13 +129,151 @@ def index_resources_by_type(resource_types, clear_index=True, index_name=None, b
                 es_index = import_class_from_string(index['module'])(index['name'])
                 es_index.bulk_index(resources=resources, resource_type=resource_type, graph_name=graph_name, clear_index=clear_index)
 
+            if use_multiprocessing:
+                _write_checkpoint(resource_type, None, completed=True)
+
         else:
             es_index = get_index(index_name)
             es_index.bulk_index(resources=resources, resource_type=resource_type, graph_name=graph_name, clear_index=clear_index)
 
+    if use_multiprocessing and index_name is None:
+        for resource_type in resource_types:
+            _clear_checkpoint(resource_type)
+
     return status
 
 
+def _index_resources_by_partition(resource_type, batch_size=settings.BULK_IMPORT_BATCH_SIZE, max_subprocesses=0, checkpoint=None):
+    """
+    Splits the resources of a single resource type into ranges of "batch_size" resource ids
+    and indexes each range in a pool of processes
+
+    The first id of the next unindexed range is written to a checkpoint file as
+    ranges complete (in order) so that an interrupted run can be resumed, once every
+    range is indexed the caller marks the resource type as completed
+
+    Arguments:
+    resource_type -- the graph id of the resource type to index
+
+    Keyword Arguments:
+    batch_size -- the number of resources in each partition
+    max_subprocesses -- the number of processes to use, 0 (default) uses one per cpu
+    checkpoint -- a resourceinstanceid to start indexing from, used when resuming an interrupted run
+
+    """
+
+    partitions = _get_resource_partitions(resource_type, batch_size, start=checkpoint)
+    if checkpoint is not None:
+        print("Resuming from resource {0}, {1} partition(s) remaining".format(checkpoint, len(partitions)))
+
+    # each process must open its own database connection
+    connections.close_all()
+    process_count = int(max_subprocesses) if int(max_subprocesses) > 0 else cpu_count()
+    pool = Pool(processes=process_count)
+    try:
+        # imap returns results in partition order, so the checkpoint only ever
+        # advances past ranges that have been fully indexed
+        total = 0
+        for partition, (indexed, failed) in zip(partitions, pool.imap(_index_resource_partition, partitions)):
+            total += indexed
+            print("    Indexed {0} resources".format(total))
+            if failed > 0:
+                print("    {0} documents of the resources from {1} failed to index (see the log)".format(failed, partition[1]))
+            next_start = partition[2]
+            if next_start is not None:
+                _write_checkpoint(resource_type, next_start)
+    except BaseException:
+        # stop the partitions that are still queued rather than waiting for them while the checkpoint can't advance
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    se = SearchEngineFactory().create()
+    se.refresh(index='resources,terms')
+
+
+def _get_resource_partitions(resource_type, batch_size, start=None):
+    """
+    Returns a list of (graphid, first resourceinstanceid, first resourceinstanceid of the next partition or None) tuples
+
+    """
+
+    resourceids = models.ResourceInstance.objects.filter(graph_id=resource_type).order_by('resourceinstanceid')
+    if start is not None:
+        resourceids = resourceids.filter(resourceinstanceid__gte=start)
+
+    boundaries = []
+    for i, resourceid in enumerate(resourceids.values_list('resourceinstanceid', flat=True).iterator()):
+        if i % int(batch_size) == 0:
+            boundaries.append(str(resourceid))
+
+    return [(str(resource_type), boundary, boundaries[i + 1] if i + 1 < len(boundaries) else None) for i, boundary in enumerate(boundaries)]
+
+
+def _index_resource_partition(partition):
+    """
+    Indexes one range of resources, this function must be outside of any
+    class in order for it to be called with multiprocessing
+
+    Returns the number of resources in the range and the number of documents that Elasticsearch rejected
+
+    Arguments:
+    partition -- a tuple of (graphid, first resourceinstanceid, first resourceinstanceid of the next partition or None)
+
+    """
+
+    resource_type, start, end = partition
+    se = SearchEngineFactory().create()
+    datatype_factory = DataTypeFactory()
+    node_datatypes = graph_metadata.get(resource_type).node_datatypes
+
+    resources = Resource.objects.filter(graph_id=resource_type, resourceinstanceid__gte=start)
+    if end is not None:
+        resources = resources.filter(resourceinstanceid__lt=end)
+    documents, terms = Resource.get_documents_to_index_in_bulk(resources, datatype_factory=datatype_factory, node_datatypes=node_datatypes)
+
+    def get_bulk_items():
+        for document in documents:
+            yield se.create_bulk_item(index='resources', id=document['resourceinstanceid'], data=document)
+        for term in terms:
+            yield se.create_bulk_item(index='terms', id=term['_id'], data=term['_source'])
+
+    errors = []
+    se.parallel_bulk_index(get_bulk_items(), errors=errors)
+    return len(documents), len(errors)
+
+
+def _get_checkpoint_path(resource_type):
+    return os.path.join(settings.REINDEX_CHECKPOINT_DIR, 'reindex_{0}.checkpoint'.format(resource_type))
+
+
+def _read_checkpoint(resource_type):
+    """
+    Returns the checkpoint of a resource type as a dictionary of the id to resume indexing from ('start')
+    and whether the resource type has been completely indexed ('completed'), or None if there isn't one
+
+    """
+
+    try:
+        with open(_get_checkpoint_path(resource_type), 'r') as f:
+            checkpoint = json.load(f)
+        return {'start': checkpoint['start'], 'completed': checkpoint.get('completed', False)}
+    except (IOError, ValueError, KeyError):
+        return None
+
+
+def _write_checkpoint(resource_type, start, completed=False):
+    with open(_get_checkpoint_path(resource_type), 'w') as f:
+        json.dump({'graphid': str(resource_type), 'start': start, 'completed': completed, 'timestamp': datetime.now().isoformat()}, f)
+
+
+def _clear_checkpoint(resource_type):
+    if os.path.exists(_get_checkpoint_path(resource_type)):
+        os.remove(_get_checkpoint_path(resource_type))
+
+
 def index_resource_relations(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE):
     """
     Indexes all resource to resource relation records
@@ -185,26 +355,17 @@ def index_concepts(clear_index=True, batch_size=settings.BULK_IMPORT_BATCH_SIZE)
 
         for conceptValue in models.Relation.objects.filter(relationtype='hasTopConcept'):
             topConcept = conceptValue.conceptto_id
+            # the top concept and the concepts below it (from the concept_closure table), nearest first
             sql = """
-                WITH RECURSIVE children_inclusive AS (
-                    SELECT d.conceptidfrom, d.conceptidto, c.*, 1 AS depth          ---|NonRecursive Part
-                        FROM relations d
-                        JOIN values c ON(c.conceptid = d.conceptidto)
-                        JOIN values c2 ON(c2.conceptid = d.conceptidfrom)
-                        WHERE d.conceptidto = '{0}'
-                        and c2.valuetype = 'prefLabel'
-                        and c.valuetype in ({1})
-                        and (d.relationtype = 'narrower' or d.relationtype = 'hasTopConcept')
-                        UNION
-                    SELECT d.conceptidfrom, d.conceptidto, v.*, depth+1             ---|RecursivePart
-                        FROM relations  d
-                        JOIN children_inclusive b ON(b.conceptidto = d.conceptidfrom)
-                        JOIN values v ON(v.conceptid = d.conceptidto)
-                        JOIN values v2 ON(v2.conceptid = d.conceptidfrom)
-                        WHERE  v2.valuetype = 'prefLabel'
-                        and v.valuetype in ({1})
-                        and (d.relationtype = 'narrower' or d.relationtype = 'hasTopConcept')
-                ) SELECT valueid, value, conceptid, languageid, valuetype FROM children_inclusive ORDER BY depth;
+                SELECT v.valueid, v.value, v.conceptid, v.languageid, v.valuetype
+                FROM values v
+                    JOIN (
+                        SELECT '{0}'::uuid AS conceptid, 0 AS depth
+                        UNION ALL
+                        SELECT descendantid, depth FROM concept_closure WHERE ancestorid = '{0}' AND relationtype = 'narrower'
+                    ) c ON(c.conceptid = v.conceptid)
+                WHERE v.valuetype in ({1})
+                ORDER BY c.depth;
             """.format(topConcept, valueTypes)
 
             cursor.execute(sql)
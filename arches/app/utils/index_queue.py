@@ -0,0 +1,156 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+from arches.app import tasks
+from arches.app.models import models
+from arches.app.models.graph_metadata import graph_metadata
+from arches.app.models.system_settings import settings
+from arches.app.search.search_engine_factory import SearchEngineFactory
+from arches.app.search.elasticsearch_dsl_builder import Query, Bool, Terms
+
+logger = logging.getLogger(__name__)
+
+
+def queue_resource(resourceinstanceid):
+    """
+    Adds a resource to the indexing queue, it will be indexed (or removed from the index
+    if it no longer exists) the next time the queue is processed
+
+    The entry is written in the current transaction, so a save that is rolled back is never indexed
+
+    Arguments:
+    resourceinstanceid -- the id of the saved or deleted resource
+
+    """
+
+    models.IndexQueue.objects.create(resourceinstanceid=resourceinstanceid)
+    transaction.on_commit(_schedule_processing)
+
+
+def _schedule_processing():
+    try:
+        tasks.process_index_queue.apply_async(retry=False)
+    except Exception:
+        logger.warning(_("Unable to start a celery task to index the queued resources, they will be indexed the next time the queue is processed"))
+
+
+def process_queue(batch_size=None):
+    """
+    Indexes the queued resources in batches until the queue is empty, all the entries
+    for a resource are handled with a single reindex of that resource
+
+    Each batch of entries is claimed in a short transaction and then indexed outside of it, so several workers
+    can process the queue at once.  Entries are only deleted once their resources have been indexed, the entries of
+    any resources that fail (or of a worker that stops) are left claimed and are retried once the claim is more than
+    INDEXING_QUEUE_CLAIM_TIMEOUT seconds old
+
+    Returns the number of resources indexed or removed from the index
+
+    Keyword Arguments:
+    batch_size -- the number of resources to index in each batch, defaults to settings.INDEXING_QUEUE_BATCH_SIZE
+
+    """
+
+    batch_size = settings.INDEXING_QUEUE_BATCH_SIZE if batch_size is None else batch_size
+    count = 0
+    while True:
+        with transaction.atomic():
+            expired = timezone.now() - timedelta(seconds=settings.INDEXING_QUEUE_CLAIM_TIMEOUT)
+            queued = models.IndexQueue.objects.select_for_update(skip_locked=True).filter(Q(claimed__isnull=True) | Q(claimed__lt=expired))
+            resourceids = set(queued.order_by("indexqueueid").values_list("resourceinstanceid", flat=True)[:batch_size])
+            if len(resourceids) == 0:
+                break
+            entryids = list(queued.filter(resourceinstanceid__in=resourceids).values_list("indexqueueid", flat=True))
+            models.IndexQueue.objects.filter(indexqueueid__in=entryids).update(claimed=timezone.now())
+
+        failed = _index_resources(resourceids)
+        if len(failed) > 0:
+            logger.warning(_("Unable to index %s queued resources, they will be retried") % len(failed))
+        models.IndexQueue.objects.filter(indexqueueid__in=entryids).exclude(resourceinstanceid__in=failed).delete()
+        count += len(resourceids) - len(failed)
+    return count
+
+
+def _index_resources(resourceids):
+    """
+    Reindexes the given resources, removing any that no longer exist from the index
+
+    Returns the set of ids of the resources that any of the bulk items failed for
+
+    """
+
+    from arches.app.models.resource import Resource  # avoid a circular import
+
+    se = SearchEngineFactory().create()
+    resources = list(Resource.objects.filter(resourceinstanceid__in=resourceids))
+    deleted = set(resourceids) - set(resource.resourceinstanceid for resource in resources)
+    resources = [resource for resource in resources if str(resource.graph_id) != str(settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID)]
+
+    query = Query(se)
+    bool_query = Bool()
+    bool_query.filter(Terms(field="resourceinstanceid", terms=list(resourceids)))
+    query.add_query(bool_query)
+    query.delete(index="terms")
+
+    documents, terms = Resource.get_documents_to_index_in_bulk(resources)
+    item_resources = {}
+
+    def get_bulk_items():
+        for document in documents:
+            document["root_ontology_class"] = graph_metadata.get(document["graph_id"]).root_ontology_class
+            item_resources[str(document["resourceinstanceid"])] = document["resourceinstanceid"]
+            yield se.create_bulk_item(index="resources", id=document["resourceinstanceid"], data=document)
+        for term in terms:
+            item_resources[str(term["_id"])] = term["_source"]["resourceinstanceid"]
+            yield se.create_bulk_item(index="terms", id=term["_id"], data=term["_source"])
+        for resourceid in deleted:
+            item_resources[str(resourceid)] = resourceid
+            yield se.create_bulk_item(op_type="delete", index="resources", id=str(resourceid))
+
+    errors = []
+    se.streaming_bulk_index(get_bulk_items(), errors=errors)
+
+    failed = set()
+    for error in errors:
+        op_type, item = list(error.items())[0]
+        # a deleted resource may never have been indexed
+        if op_type == "delete" and item.get("status") == 404:
+            continue
+        failed.add(str(item_resources.get(str(item.get("_id")), item.get("_id"))))
+    return failed
+
+
+def get_queue_status():
+    """
+    Returns a dictionary describing the indexing queue:
+    the number of entries, the number of distinct resources they're for,
+    the time the oldest entry was queued and how long it has been waiting
+
+    """
+
+    status = models.IndexQueue.objects.aggregate(
+        entries=Count("indexqueueid"), resources=Count("resourceinstanceid", distinct=True), oldest=Min("created")
+    )
+    status["lag"] = timezone.now() - status["oldest"] if status["oldest"] is not None else None
+    return status
@@ -0,0 +1,301 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+import uuid
+from django.core.cache import caches
+from django.db import connection, transaction
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+
+EARTHCIRCUM = 40075016.6856
+PIXELSPERTILE = 256
+MVTEXTENT = 4096  # the default extent and buffer of ST_AsMVTGeom
+MVTBUFFER = 256
+MAXEXTENT = EARTHCIRCUM / 2
+
+
+def render_tile(node, zoom, x, y):
+    """
+    Renders a vector tile (in the mapbox vector tile format) of the geometries of a geojson-feature-collection node,
+    returns an empty bytes object if there are no geometries in the tile
+
+    Geometries are read from the geojson_geometries table (kept up to date by a trigger on tiles)
+    and limited by its spatial index to those within the tile plus the buffer that ST_AsMVTGeom keeps
+
+    """
+
+    zoom, x, y = int(zoom), int(x), int(y)
+    nodeid = str(node.nodeid)
+    config = node.config
+    buffer = get_tile_buffer(config, zoom)
+    with connection.cursor() as cursor:
+        # TODO: when we upgrade to PostGIS 3, we can get feature state
+        # working by adding the feature_id_name arg:
+        # https://github.com/postgis/postgis/pull/303
+        if zoom <= int(config['clusterMaxZoom']):
+            # clusters are precomputed for each zoom level in the geojson_geometry_clusters table,
+            # cells with too few geometries to be clustered are drawn as the geometries they list
+            cursor.execute("""SELECT ST_AsMVT(tile, %s) FROM (
+                SELECT NULL AS resourceinstanceid,
+                    row_number() over () AS id,
+                    c.total,
+                    ST_AsMVTGeom(
+                        c.geom,
+                        TileBBox(%s, %s, %s, 3857)
+                    ) AS geom,
+                    ST_AsGeoJSON(ST_Transform(c.extent, 4326)) AS extent
+                FROM geojson_geometry_clusters c
+                WHERE c.nodeid = %s
+                    AND c.zoom = %s
+                    AND c.members IS NULL
+                    AND c.geom && ST_Expand(TileBBox(%s, %s, %s, 3857), %s)
+                UNION ALL
+                SELECT g.resourceinstanceid::text,
+                    row_number() over () AS id,
+                    1 AS total,
+                    ST_AsMVTGeom(
+                        g.geom,
+                        TileBBox(%s, %s, %s, 3857)
+                    ) AS geom,
+                    '' AS extent
+                FROM geojson_geometry_clusters c
+                    JOIN geojson_geometries g ON g.id = ANY(c.members)
+                WHERE c.nodeid = %s
+                    AND c.zoom = %s
+                    AND c.members IS NOT NULL
+                    AND c.extent && ST_Expand(TileBBox(%s, %s, %s, 3857), %s)
+                    AND g.geom && ST_Expand(TileBBox(%s, %s, %s, 3857), %s)
+            ) AS tile;""",
+            [nodeid, zoom, x, y, nodeid, zoom, zoom, x, y, buffer, zoom, x, y, nodeid, zoom, zoom, x, y, buffer, zoom, x, y, buffer])
+        else:
+            cursor.execute("""SELECT ST_AsMVT(tile, %s) FROM (SELECT g.tileid,
+               row_number() over () as id,
+               g.resourceinstanceid,
+               g.nodeid,
+               ST_AsMVTGeom(
+                   g.geom,
+                   TileBBox(%s, %s, %s, 3857)
+               ) AS geom,
+               1 AS total
+            FROM geojson_geometries g
+            WHERE g.nodeid = %s
+                AND g.geom && ST_Expand(TileBBox(%s, %s, %s, 3857), %s)) AS tile;""",
+            [nodeid, zoom, x, y, nodeid, zoom, x, y, buffer])
+        return bytes(cursor.fetchone()[0])
+
+
+def get_tile(node, zoom, x, y):
+    """
+    Returns a vector tile of the geometries of a geojson-feature-collection node from the tile cache
+    (see settings.MVT_CACHE), rendering and caching it if it isn't there
+
+    """
+
+    tile_cache = get_tile_cache()
+    zoom, x, y = int(zoom), int(x), int(y)
+    if tile_cache is None or zoom > settings.MVT_CACHE_MAX_ZOOM:
+        return render_tile(node, zoom, x, y)
+
+    key = get_tile_key(node.nodeid, get_generation(tile_cache, node.nodeid, zoom), zoom, x, y)
+    tile = tile_cache.get(key)
+    if tile is None:
+        tile = render_tile(node, zoom, x, y)
+        tile_cache.set(key, tile, settings.MVT_CACHE_TIMEOUT)
+    return tile
+
+
+def get_tile_cache():
+    """
+    Returns the django cache used to store rendered vector tiles, or None if they aren't cached
+
+    """
+
+    return caches[settings.MVT_CACHE] if settings.MVT_CACHE is not None else None
+
+
+def get_generation(tile_cache, nodeid, zoom):
+    """
+    Returns the current generation of the cached vector tiles of a node at a zoom level
+
+    Tile keys include the generation, so writing a new generation invalidates every cached tile
+    of that node and zoom level without having to find their keys
+
+    """
+
+    key = get_generation_key(nodeid, zoom)
+    generation = tile_cache.get(key)
+    if generation is None:
+        tile_cache.add(key, str(uuid.uuid4()), None)
+        generation = tile_cache.get(key)
+    return generation
+
+
+def get_generation_key(nodeid, zoom):
+    return "mvt_generation_%s_%s" % (nodeid, zoom)
+
+
+def get_tile_key(nodeid, generation, zoom, x, y):
+    return "mvt_%s_%s_%s_%s_%s" % (nodeid, generation, zoom, x, y)
+
+
+def get_tile_buffer(config, zoom):
+    """
+    Returns the distance (in meters) around a tile whose geometries can appear in that tile:
+    the buffer kept by ST_AsMVTGeom or, at zoom levels that are clustered, the cluster distance if that's larger
+
+    """
+
+    buffer = EARTHCIRCUM / (1 << zoom) * MVTBUFFER / MVTEXTENT
+    if zoom <= int(config['clusterMaxZoom']):
+        arc = EARTHCIRCUM / ((1 << zoom) * PIXELSPERTILE)
+        buffer = max(buffer, arc * int(config['clusterDistance']))
+    return buffer
+
+
+def get_tile_range(bbox, zoom, buffer=0):
+    """
+    Returns the range of tile columns and rows (min x, min y, max x, max y) at the given zoom level
+    that cover a web mercator bounding box (min x, min y, max x, max y) expanded by buffer meters
+
+    """
+
+    count = 1 << zoom
+    size = EARTHCIRCUM / count
+
+    def clamp(value):
+        return min(max(int(math.floor(value)), 0), count - 1)
+
+    return (
+        clamp((bbox[0] - buffer + MAXEXTENT) / size),
+        clamp((MAXEXTENT - (bbox[3] + buffer)) / size),
+        clamp((bbox[2] + buffer + MAXEXTENT) / size),
+        clamp((MAXEXTENT - (bbox[1] - buffer)) / size),
+    )
+
+
+def get_geometry_extents(tileid=None, resourceinstanceid=None):
+    """
+    Returns the web mercator bounding box (min x, min y, max x, max y) of the geometries
+    of a tile or of all the tiles of a resource as a dictionary keyed by nodeid
+
+    """
+
+    column, value = ("tileid", tileid) if tileid is not None else ("resourceinstanceid", resourceinstanceid)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT nodeid, ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+            FROM (
+                SELECT nodeid, ST_Extent(geom) AS extent
+                FROM geojson_geometries
+                WHERE {0} = %s
+                GROUP BY nodeid
+            ) extents""".format(column),
+            [value],
+        )
+        return {str(row[0]): row[1:] for row in cursor.fetchall()}
+
+
+def invalidate_extents(*extents):
+    """
+    Removes the cached vector tiles covering the given geometry extents
+    (dictionaries of bounding boxes keyed by nodeid, see get_geometry_extents),
+    once the current transaction (if any) commits
+
+    """
+
+    bboxes = {}
+    for extent in extents:
+        for nodeid, bbox in extent.items():
+            bboxes.setdefault(nodeid, []).append(bbox)
+    if get_tile_cache() is None or len(bboxes) == 0:
+        return
+
+    def expire():
+        for node in models.Node.objects.filter(nodeid__in=list(bboxes.keys())):
+            for bbox in bboxes[str(node.nodeid)]:
+                invalidate_tiles(node, bbox)
+
+    transaction.on_commit(expire)
+
+
+def invalidate_tiles(node, bbox):
+    """
+    Removes the cached vector tiles of a geojson-feature-collection node that cover a web mercator bounding box at every cached zoom level
+
+    At zoom levels where the bounding box covers more than settings.MVT_CACHE_MAX_INVALIDATED_TILES tiles
+    a new generation is written instead, which drops every cached tile of the node at that zoom level
+
+    """
+
+    tile_cache = get_tile_cache()
+    if tile_cache is None:
+        return
+
+    for zoom in range(settings.MVT_CACHE_MAX_ZOOM + 1):
+        min_x, min_y, max_x, max_y = get_tile_range(bbox, zoom, get_tile_buffer(node.config, zoom))
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > settings.MVT_CACHE_MAX_INVALIDATED_TILES:
+            tile_cache.set(get_generation_key(node.nodeid, zoom), str(uuid.uuid4()), None)
+        else:
+            generation = get_generation(tile_cache, node.nodeid, zoom)
+            tile_cache.delete_many(
+                [
+                    get_tile_key(node.nodeid, generation, zoom, x, y)
+                    for x in range(min_x, max_x + 1)
+                    for y in range(min_y, max_y + 1)
+                ]
+            )
+
+
+def clear_tiles(nodeid):
+    """
+    Removes every cached vector tile of a node
+
+    """
+
+    tile_cache = get_tile_cache()
+    if tile_cache is not None:
+        tile_cache.set_many({get_generation_key(nodeid, zoom): str(uuid.uuid4()) for zoom in range(settings.MVT_CACHE_MAX_ZOOM + 1)}, None)
+
+
+def seed_tiles(node, zooms):
+    """
+    Renders and caches the vector tiles of a node that cover the extent of its geometries at the given zoom levels,
+    yields the zoom level, column, row and size of each tile as it's cached
+
+    """
+
+    tile_cache = get_tile_cache()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+            FROM (SELECT ST_Extent(geom) AS extent FROM geojson_geometries WHERE nodeid = %s) extents""",
+            [node.nodeid],
+        )
+        bbox = cursor.fetchone()
+    if tile_cache is None or bbox[0] is None:
+        return
+
+    for zoom in zooms:
+        min_x, min_y, max_x, max_y = get_tile_range(bbox, zoom, get_tile_buffer(node.config, zoom))
+        generation = get_generation(tile_cache, node.nodeid, zoom)
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                tile = render_tile(node, zoom, x, y)
+                tile_cache.set(get_tile_key(node.nodeid, generation, zoom, x, y), tile, settings.MVT_CACHE_TIMEOUT)
+                yield zoom, x, y, len(tile)
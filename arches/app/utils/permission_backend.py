@@ -1,11 +1,40 @@
-from arches.app.models.models import Node
+import time
+import uuid
+import logging
+from collections import namedtuple
+from arches.app.models.graph_metadata import graph_metadata
+from arches.app.models.models import GraphModel, NodeGroup
 from arches.app.models.system_settings import settings
 from guardian.backends import check_support
 from guardian.backends import ObjectPermissionBackend
 from guardian.core import ObjectPermissionChecker
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from guardian.shortcuts import get_perms, get_objects_for_user
 from guardian.exceptions import WrongAppError
 from django.contrib.auth.models import User, Group, Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+PERMISSIONS_GENERATION_KEY = "permissions_generation"
+# the permissions generation is read from the django cache at most every GENERATION_CHECK_INTERVAL seconds
+GENERATION_CHECK_INTERVAL = 1
+_generation = {"value": None, "checked": 0}
+
+logger = logging.getLogger(__name__)
+
+# the ids of the nodegroups a user can read, write and delete and of the resource models those nodegroups
+# belong to (as frozensets of strings), and the number of seconds it took to compute them
+NodegroupPermissions = namedtuple(
+    "NodegroupPermissions", ["readable", "writable", "deletable", "readable_graphs", "writable_graphs", "deletable_graphs", "build_time"]
+)
+
+NODEGROUP_PERMISSIONS = {
+    "models.read_nodegroup": "readable",
+    "models.write_nodegroup": "writable",
+    "models.delete_nodegroup": "deletable",
+}
 
 
 class PermissionBackend(ObjectPermissionBackend):
@@ -96,15 +125,128 @@ def get_nodegroups_by_perm(user, perms, any_perm=True):
 
     """
 
-    A = set(get_objects_for_user(user, [
-        'models.read_nodegroup',
-        'models.write_nodegroup',
-        'models.delete_nodegroup',
-        'models.no_access_to_nodegroup'
-    ], accept_global_perms=False, any_perm=True))
-    B = set(get_objects_for_user(user, perms, accept_global_perms=False, any_perm=any_perm))
-    C = set(get_objects_for_user(user, perms, accept_global_perms=True, any_perm=any_perm))
-    return list(C - A | B)
+    return list(NodeGroup.objects.filter(pk__in=get_nodegroup_ids_by_perm(user, perms, any_perm=any_perm)))
+
+
+def get_nodegroup_ids_by_perm(user, perms, any_perm=True):
+    """
+    returns a frozenset of the ids (as strings) of the node groups that a user has the given permission on,
+    read from the user's permission snapshot (see get_nodegroup_permissions) if the permissions are
+    any of read_nodegroup, write_nodegroup and delete_nodegroup
+
+    Arguments:
+    user -- the user to check
+    perms -- the permssion string eg: "read_nodegroup" or list of strings
+    any_perm -- True to check ANY perm in "perms" or False to check ALL perms
+
+    """
+
+    perms = [perms] if isinstance(perms, str) else perms
+    perms = [perm if "." in perm else "models.%s" % perm for perm in perms]
+    if len(perms) == 0 or any(perm not in NODEGROUP_PERMISSIONS for perm in perms):
+        return frozenset(str(nodegroupid) for nodegroupid in query_nodegroup_ids_by_perm(user, perms, any_perm))
+
+    snapshot = get_nodegroup_permissions(user)
+    nodegroupids = [getattr(snapshot, NODEGROUP_PERMISSIONS[perm]) for perm in perms]
+    return frozenset.union(*nodegroupids) if any_perm else frozenset.intersection(*nodegroupids)
+
+
+def query_nodegroup_ids_by_perm(user, perms, any_perm=True):
+    """
+    returns a set of the ids of the node groups that a user has the given permission on, read from the database
+
+    Permissions explicitly given to the user (or their groups) on a nodegroup take
+    precedence over those given to their groups on every nodegroup
+
+    """
+
+    def get_ids(perms, accept_global_perms, any_perm):
+        return set(
+            get_objects_for_user(user, perms, accept_global_perms=accept_global_perms, any_perm=any_perm).values_list("pk", flat=True)
+        )
+
+    A = get_ids(
+        ["models.read_nodegroup", "models.write_nodegroup", "models.delete_nodegroup", "models.no_access_to_nodegroup"],
+        accept_global_perms=False,
+        any_perm=True,
+    )
+    B = get_ids(perms, accept_global_perms=False, any_perm=any_perm)
+    C = get_ids(perms, accept_global_perms=True, any_perm=any_perm)
+    return C - A | B
+
+
+def get_nodegroup_permissions(user):
+    """
+    returns a snapshot of the node groups (and resource models) a user can read, write and delete (a NodegroupPermissions)
+
+    The snapshot is computed once and kept in the django cache under the current permissions generation,
+    which is replaced whenever object permissions, group memberships or nodegroups change,
+    and the current version of the map of nodegroups to resource models (see graph_metadata.get_resource_nodegroups),
+    so users get a new snapshot the next time they ask for one
+
+    Arguments:
+    user -- the user to check
+
+    """
+
+    generation = (get_permissions_generation(), graph_metadata.get_resource_nodegroups_version())
+    snapshot = getattr(user, "_nodegroup_permissions", None)
+    if snapshot is not None and snapshot[0] == generation:
+        return snapshot[1]
+
+    key = "nodegroup_permissions_%s_%s_%s" % (generation[0], generation[1], user.pk if user.pk is not None else "anonymous")
+    permissions = cache.get(key) if settings.PERMISSIONS_CACHE_TIMEOUT != 0 else None
+    if permissions is None:
+        start = time.time()
+        resource_nodegroups = graph_metadata.get_resource_nodegroups()
+        nodegroupids = [
+            frozenset(str(nodegroupid) for nodegroupid in query_nodegroup_ids_by_perm(user, [perm]))
+            for perm in ("models.read_nodegroup", "models.write_nodegroup", "models.delete_nodegroup")
+        ]
+        graphids = [
+            frozenset(resource_nodegroups[nodegroupid] for nodegroupid in nodegroups if nodegroupid in resource_nodegroups)
+            for nodegroups in nodegroupids
+        ]
+        permissions = NodegroupPermissions(*nodegroupids, *graphids, build_time=time.time() - start)
+        logger.debug("Computed the nodegroup permissions of %s in %.1f ms" % (user, permissions.build_time * 1000))
+        if settings.PERMISSIONS_CACHE_TIMEOUT != 0:
+            cache.set(key, permissions, settings.PERMISSIONS_CACHE_TIMEOUT)
+    else:
+        logger.debug("Read the nodegroup permissions of %s from the cache, saving %.1f ms" % (user, permissions.build_time * 1000))
+    # the snapshot is also kept on the user object, so it's only read from the cache once per request
+    user._nodegroup_permissions = (generation, permissions)
+    return permissions
+
+
+def get_permissions_generation():
+    now = time.time()
+    if now - _generation["checked"] < GENERATION_CHECK_INTERVAL:
+        return _generation["value"]
+    generation = cache.get(PERMISSIONS_GENERATION_KEY)
+    if generation is None:
+        cache.add(PERMISSIONS_GENERATION_KEY, str(uuid.uuid4()), None)
+        generation = cache.get(PERMISSIONS_GENERATION_KEY)
+    _generation.update(value=generation, checked=now)
+    return generation
+
+
+def invalidate_permissions():
+    """
+    Starts a new permissions generation, so every user's permission snapshot is computed again
+
+    A new generation is started straight away (so the current transaction doesn't read a stale snapshot)
+    and again once the transaction commits (so other processes don't keep one read before the commit),
+    other processes see it within GENERATION_CHECK_INTERVAL seconds
+
+    """
+
+    def expire():
+        generation = str(uuid.uuid4())
+        cache.set(PERMISSIONS_GENERATION_KEY, generation, None)
+        _generation.update(value=generation, checked=time.time())
+
+    expire()
+    transaction.on_commit(expire)
 
 
 def get_editable_resource_types(user):
@@ -141,12 +283,42 @@ def get_resource_types_by_perm(user, perms):
 
     """
 
-    graphs = set()
-    nodegroups = get_nodegroups_by_perm(user, perms)
-    for node in Node.objects.filter(nodegroup__in=nodegroups).select_related('graph'):
-        if node.graph.isresource and str(node.graph_id) != settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID:
-            graphs.add(node.graph)
-    return list(graphs)
+    return list(GraphModel.objects.filter(pk__in=get_resource_type_ids_by_perm(user, perms)))
+
+
+def get_resource_type_ids_by_perm(user, perms):
+    """
+    returns a frozenset of the ids (as strings) of the resource models that a user has any of the given permissions on
+    (on at least one of their nodegroups), read from the user's permission snapshot
+
+    Arguments:
+    user -- the user to check
+    perms -- the permssion string eg: "read_nodegroup" or list of strings
+
+    """
+
+    perms = [perms] if isinstance(perms, str) else perms
+    perms = [perm if "." in perm else "models.%s" % perm for perm in perms]
+    if any(perm not in NODEGROUP_PERMISSIONS for perm in perms):
+        resource_nodegroups = graph_metadata.get_resource_nodegroups()
+        nodegroupids = get_nodegroup_ids_by_perm(user, perms)
+        return frozenset(resource_nodegroups[nodegroupid] for nodegroupid in nodegroupids if nodegroupid in resource_nodegroups)
+
+    snapshot = get_nodegroup_permissions(user)
+    return frozenset().union(*[getattr(snapshot, "%s_graphs" % NODEGROUP_PERMISSIONS[perm]) for perm in perms])
+
+
+def user_has_resource_perm(user, perms):
+    """
+    returns True if a user has any of the given permissions on a nodegroup of any resource model
+
+    Arguments:
+    user -- the user to check
+    perms -- the permssion string eg: "read_nodegroup" or list of strings
+
+    """
+
+    return len(get_resource_type_ids_by_perm(user, perms)) > 0
 
 
 def user_can_read_resources(user):
@@ -156,7 +328,7 @@ def user_can_read_resources(user):
     """
 
     if user.is_authenticated:
-        return user.is_superuser or len(get_resource_types_by_perm(user, ['models.read_nodegroup'])) > 0
+        return user.is_superuser or user_has_resource_perm(user, ['models.read_nodegroup'])
     return False
 
 
@@ -168,7 +340,7 @@ def user_can_edit_resources(user):
 
     if user.is_authenticated:
         return user.is_superuser or \
-            len(get_editable_resource_types(user)) > 0 or \
+            user_has_resource_perm(user, ['models.write_nodegroup', 'models.delete_nodegroup']) or \
             user.groups.filter(name__in=settings.RESOURCE_EDITOR_GROUPS).exists()
     return False
 
@@ -182,3 +354,27 @@ def user_can_read_concepts(user):
     if user.is_authenticated:
         return user.groups.filter(name='RDM Administrator').exists()
     return False
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+def invalidate_permissions_on_change(sender, **kwargs):
+    invalidate_permissions()
+
+
+@receiver(post_save, sender=NodeGroup)
+@receiver(post_delete, sender=NodeGroup)
+def invalidate_permissions_on_nodegroup_change(sender, created=True, **kwargs):
+    # users can read new nodegroups through the permissions of their groups
+    if created:
+        invalidate_permissions()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_permissions_on_membership_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_permissions()
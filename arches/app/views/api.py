@@ -1,10 +1,10 @@
+import itertools
 import json
 import logging
 import os
 import re
 import sys
 import uuid
-import importlib
 import arches.app.tasks as tasks
 import arches.app.utils.task_management as task_management
 from io import StringIO
@@ -12,9 +12,10 @@ from django.shortcuts import render
 from django.views.generic import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.db import transaction, connection
+from django.db import transaction
 from django.db.models import Q
-from django.http import Http404, HttpResponse
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.http.request import QueryDict
 from django.core import management
 from django.urls import reverse
@@ -28,6 +29,7 @@ from arches.app.models.graph import Graph
 from arches.app.models.mobile_survey import MobileSurvey
 from arches.app.models.resource import Resource
 from arches.app.models.system_settings import settings
+from arches.app.utils import mvt
 from arches.app.utils.skos import SKOSWriter
 from arches.app.utils.response import JSONResponse
 from arches.app.utils.decorators import can_read_resource_instance, can_edit_resource_instance, can_read_concept
@@ -221,6 +223,9 @@ class Surveys(APIBase):
 
 
 class GeoJSON(APIBase):
+    # the number of tiles read at a time, the property tiles and names of their resources are read in bulk
+    batch_size = 500
+
     def set_precision(self, coordinates, precision):
         result = []
         try:
@@ -230,20 +235,27 @@ class GeoJSON(APIBase):
                 result.append(self.set_precision(coordinate, precision))
         return result
 
-    def get_name(self, resource):
-        module = importlib.import_module(
-            'arches.app.functions.primary_descriptors')
-        PrimaryDescriptorsFunction = getattr(
-            module, 'PrimaryDescriptorsFunction')()
-        functionConfig = models.FunctionXGraph.objects.filter(
-            graph_id=resource.graph_id, function__functiontype='primarydescriptors')
-        if len(functionConfig) == 1:
-            return PrimaryDescriptorsFunction.get_primary_descriptor_from_nodes(
-                resource,
-                functionConfig[0].config['name']
-            )
-        else:
-            return _('Unnamed Resource')
+    def get_batches(self, tiles):
+        iterator = tiles.iterator(chunk_size=self.batch_size)
+        while True:
+            batch = list(itertools.islice(iterator, self.batch_size))
+            if len(batch) == 0:
+                return
+            yield batch
+
+    def get_names(self, resourceids):
+        names = {}
+        resources = Resource.objects.filter(resourceinstanceid__in=resourceids)
+        for resourceid, descriptors in Resource.get_descriptors_in_bulk(resources).items():
+            names[resourceid] = descriptors['name'] if descriptors['name'] != 'undefined' else _('Unnamed Resource')
+        return names
+
+    def get_property_tiles(self, nodegroups, resourceids):
+        property_tiles = {}
+        tiles = models.TileModel.objects.filter(nodegroup_id__in=nodegroups, resourceinstance_id__in=resourceids)
+        for tile in tiles.order_by('sortorder'):
+            property_tiles.setdefault(str(tile.resourceinstance_id), []).append(tile)
+        return property_tiles
 
     def get(self, request):
         datatype_factory = DataTypeFactory()
@@ -260,6 +272,17 @@ class GeoJSON(APIBase):
         indent = request.GET.get('indent', None)
         if indent is not None:
             indent = int(indent)
+        bbox = request.GET.get('bbox', None)
+        try:
+            limit = request.GET.get('limit', None)
+            limit = int(limit) if limit is not None else None
+            offset = int(request.GET.get('offset', 0))
+            if bbox is not None:
+                bbox = Polygon.from_bbox([float(coordinate) for coordinate in bbox.split(',')])
+                bbox.srid = 4326
+        except ValueError:
+            message = _('limit and offset must be integers and bbox must be "min x,min y,max x,max y" in WGS 84')
+            return JSONResponse({"error": message}, indent=indent, status=400)
         if isinstance(nodegroups, str):
             nodegroups = nodegroups.split(',')
         if hasattr(request.user, 'userprofile') is not True:
@@ -273,9 +296,6 @@ class GeoJSON(APIBase):
         if nodeid is not None:
             nodes = nodes.filter(nodeid=nodeid)
         nodes = nodes.order_by('sortorder')
-        features = []
-        i = 1
-        property_tiles = models.TileModel.objects.filter(nodegroup_id__in=nodegroups).order_by('sortorder')
         property_node_map = {}
         property_nodes = models.Node.objects.filter(nodegroup_id__in=nodegroups).order_by('sortorder')
         for node in property_nodes:
@@ -288,38 +308,70 @@ class GeoJSON(APIBase):
                 )
             else:
                 property_node_map[str(node.nodeid)]['name'] = node.fieldname
-        for node in nodes:
-            tiles = models.TileModel.objects.filter(nodegroup=node.nodegroup).order_by('sortorder')
-            if resourceid is not None:
-                tiles = tiles.filter(resourceinstance_id__in=resourceid.split(','))
-            if tileid is not None:
-                tiles = tiles.filter(tileid=tileid)
-            for tile in tiles:
-                data = tile.data
-                try:
-                    for feature_index, feature in enumerate(data[str(node.pk)]['features']):
-                        if len(nodegroups) > 0:
-                            for pt in property_tiles.filter(resourceinstance_id=tile.resourceinstance_id):
-                                for key in pt.data:
-                                    field_name = key if use_uuid_names else property_node_map[key]['name']
-                                    if pt.data[key] is not None:
-                                        if use_display_values:
-                                            property_node = property_node_map[key]['node']
-                                            datatype = datatype_factory.get_instance(property_node.datatype)
-                                            value = datatype.get_display_value(pt, property_node)
-                                        else:
-                                            value = pt.data[key]
-                                        try:
-                                            feature['properties'][field_name].append(value)
-                                        except KeyError:
-                                            feature['properties'][field_name] = value
-                                        except AttributeError:
-                                            feature['properties'][field_name] = [
-                                                feature['properties'][field_name],
-                                                value
-                                            ]
+
+        def get_features():
+            # features are numbered across the whole collection, so ids are stable between pages
+            if limit is not None and limit <= 0:
+                return
+            i = 1
+            count = 0
+            for node in nodes:
+                tiles = models.TileModel.objects.filter(nodegroup_id=node.nodegroup_id).order_by('sortorder', 'tileid')
+                if resourceid is not None:
+                    tiles = tiles.filter(resourceinstance_id__in=resourceid.split(','))
+                if tileid is not None:
+                    tiles = tiles.filter(tileid=tileid)
+                if bbox is not None:
+                    geometries = models.GeoJSONGeometry.objects.filter(node_id=node.nodeid, geom__bboverlaps=bbox)
+                    tiles = tiles.filter(tileid__in=geometries.values('tile_id'))
+                for batch in self.get_batches(tiles):
+                    selected = []
+                    for tile in batch:
+                        try:
+                            tile_features = tile.data[str(node.pk)]['features']
+                        except (KeyError, TypeError):
+                            continue
+                        for feature in tile_features:
+                            if bbox is not None and not GEOSGeometry(json.dumps(feature['geometry']), srid=4326).intersects(bbox):
+                                continue
+                            if i > offset:
+                                selected.append((i, tile, feature))
+                                count += 1
+                            i += 1
+                            if limit is not None and count >= limit:
+                                break
+                        if limit is not None and count >= limit:
+                            break
+
+                    resourceids = set(str(tile.resourceinstance_id) for feature_id, tile, feature in selected)
+                    property_tiles = {}
+                    names = {}
+                    if len(nodegroups) > 0 and len(resourceids) > 0:
+                        property_tiles = self.get_property_tiles(nodegroups, resourceids)
+                    if include_primary_name and len(resourceids) > 0:
+                        names = self.get_names(resourceids)
+                    for feature_id, tile, feature in selected:
+                        for pt in property_tiles.get(str(tile.resourceinstance_id), []):
+                            for key in pt.data:
+                                field_name = key if use_uuid_names else property_node_map[key]['name']
+                                if pt.data[key] is not None:
+                                    if use_display_values:
+                                        property_node = property_node_map[key]['node']
+                                        datatype = datatype_factory.get_instance(property_node.datatype)
+                                        value = datatype.get_display_value(pt, property_node)
+                                    else:
+                                        value = pt.data[key]
+                                    try:
+                                        feature['properties'][field_name].append(value)
+                                    except KeyError:
+                                        feature['properties'][field_name] = value
+                                    except AttributeError:
+                                        feature['properties'][field_name] = [
+                                            feature['properties'][field_name],
+                                            value
+                                        ]
                         if include_primary_name:
-                            feature['properties']['primary_name'] = self.get_name(tile.resourceinstance)
+                            feature['properties']['primary_name'] = names.get(str(tile.resourceinstance_id), _('Unnamed Resource'))
                         feature['properties']['resourceinstanceid'] = tile.resourceinstance_id
                         feature['properties']['tileid'] = tile.pk
                         if nodeid is None:
@@ -330,23 +382,25 @@ class GeoJSON(APIBase):
                                     tile.pk,
                                     node.pk
                                 )
-                        feature['id'] = i
+                        feature['id'] = feature_id
                         coordinates = self.set_precision(feature['geometry']['coordinates'], precision)
                         feature['geometry']['coordinates'] = coordinates
-                        i += 1
-                        features.append(feature)
-                except KeyError:
-                    pass
-                except TypeError as e:
-                    print(e)
-                    print(tile.data)
+                        yield feature
 
-        response = JSONResponse({'type': 'FeatureCollection', 'features': features}, indent=indent)
-        return response
+                    if limit is not None and count >= limit:
+                        return
+
+        def stream():
+            # the collection is written out a feature at a time rather than being built in memory
+            serializer = JSONSerializer()
+            yield '{"type": "FeatureCollection", "features": ['
+            for index, feature in enumerate(get_features()):
+                yield ("," if index > 0 else "") + serializer.serialize(feature, indent=indent)
+            yield ']}'
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
 
 
-EARTHCIRCUM = 40075016.6856
-PIXELSPERTILE = 256
 class MVT(APIBase):
     def get(self, request, nodeid, zoom, x, y):
         if hasattr(request.user, 'userprofile') is not True:
@@ -356,102 +410,11 @@ class MVT(APIBase):
             node = models.Node.objects.get(nodeid=nodeid, nodegroup_id__in=viewable_nodegroups)
         except models.Node.DoesNotExist:
             raise Http404()
-        config = node.config
-        with connection.cursor() as cursor:
-            # TODO: when we upgrade to PostGIS 3, we can get feature state
-            # working by adding the feature_id_name arg:
-            # https://github.com/postgis/postgis/pull/303
-            if int(zoom) <= int(config['clusterMaxZoom']):
-                arc = EARTHCIRCUM / ((1 << int(zoom)) * PIXELSPERTILE)
-                distance = arc * int(config['clusterDistance'])
-                min_points = int(config['clusterMinPoints'])
-                cursor.execute("""WITH clusters(tileid, resourceinstanceid, nodeid, geom, cid)
-                AS (
-                    SELECT m.*,
-                    ST_ClusterDBSCAN(geom, eps := %s, minpoints := %s) over () AS cid
-                    FROM (
-                        SELECT t.tileid,
-                            t.resourceinstanceid,
-                            n.nodeid,
-                            ST_Transform(ST_SetSRID(
-                                st_geomfromgeojson(
-                                    (
-                                        json_array_elements(
-                                            t.tiledata::json ->
-                                            n.nodeid::text ->
-                                        'features') -> 'geometry'
-                                    )::text
-                                ),
-                                4326
-                            ), 3857) AS geom
-                        FROM tiles t
-                            LEFT JOIN nodes n ON t.nodegroupid = n.nodegroupid
-                        WHERE n.nodeid = %s
-                    ) m
-                )
-
-                SELECT ST_AsMVT(
-                    tile,
-                    %s
-                ) FROM (
-                    SELECT resourceinstanceid::text,
-                        row_number() over () as id,
-                        1 as total,
-                        ST_AsMVTGeom(
-                            geom,
-                            TileBBox(%s, %s, %s, 3857)
-                        ) AS geom,
-                        '' AS extent
-                    FROM clusters
-                    WHERE cid is NULL
-                    UNION
-                    SELECT NULL as resourceinstanceid,
-                        row_number() over () as id,
-                        count(*) as total,
-                        ST_AsMVTGeom(
-                            ST_Centroid(
-                                ST_Collect(geom)
-                            ),
-                            TileBBox(%s, %s, %s, 3857)
-                        ) AS geom,
-                        ST_AsGeoJSON(
-                            ST_Transform(
-                                ST_SetSRID(
-                                    ST_Extent(geom), 3857
-                                ), 4326
-                            )
-                        ) AS extent
-                    FROM clusters
-                    WHERE cid IS NOT NULL
-                    GROUP BY cid
-                ) as tile;""",
-                [distance, min_points, nodeid, nodeid, zoom, x, y, zoom, x, y])
-            else:
-                cursor.execute("""SELECT ST_AsMVT(tile, %s) FROM (SELECT t.tileid,
-                   row_number() over () as id,
-                   t.resourceinstanceid,
-                   n.nodeid,
-                   ST_AsMVTGeom(
-                       ST_Transform(ST_SetSRID(
-                           st_geomfromgeojson(
-                               (
-                                   json_array_elements(
-                                       t.tiledata::json ->
-                                       n.nodeid::text ->
-                                   'features') -> 'geometry'
-                               )::text
-                           ),
-                           4326
-                       ), 3857),
-                       TileBBox(%s, %s, %s, 3857)
-                   ) AS geom,
-                   1 AS total
-                FROM tiles t
-                    LEFT JOIN nodes n ON t.nodegroupid = n.nodegroupid
-                WHERE n.nodeid = %s) AS tile;""", [nodeid, zoom, x, y, nodeid])
-            tile = bytes(cursor.fetchone()[0])
-            if not len(tile):
-                raise Http404()
+        # the contents of a tile don't depend on the user, only whether they can read the node,
+        # so it's safe to share cached tiles between everyone who gets this far
+        tile = mvt.get_tile(node, zoom, x, y)
+        if not len(tile):
+            raise Http404()
         return HttpResponse(tile, content_type="application/x-protobuf")
 
 
@@ -27,6 +27,7 @@ from django.utils.translation import ugettext as _
 from arches.app.models import models
 from arches.app.models.system_settings import settings
 from arches.app.models.concept import Concept, ConceptValue, CORE_CONCEPTS, get_preflabel_from_valueid
+from arches.app.models.concept_closure import concept_closure
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Bool, Match, Query, Nested, Terms, GeoShape, Range, SimpleQueryString
 from arches.app.utils.decorators import group_required
@@ -350,7 +351,7 @@ def search(request):
 
     ids = []
     if removechildren != None:
-        ids =  [concept[0] for concept in Concept().get_child_concepts(removechildren, columns="conceptidto::text")]
+        ids = list(concept_closure.get_descendants(removechildren))
         ids.append(removechildren)
 
     newresults = []
@@ -21,20 +21,22 @@ from datetime import datetime
 from django.shortcuts import render
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.cache import cache
-from django.http import HttpResponseNotFound
+from django.http import HttpResponseNotFound, StreamingHttpResponse
 from django.utils.translation import ugettext as _
 from arches.app.models import models
-from arches.app.models.concept import Concept
+from arches.app.models.concept_closure import concept_closure
 from arches.app.models.system_settings import settings
 from arches.app.utils.response import JSONResponse
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
+from arches.app.search import results_cache
+from arches.app.search.search_export import SearchResultsExporter, CONTENT_TYPES
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Bool, Match, Query, Terms, MaxAgg, Aggregation
 from arches.app.search.time_wheel import TimeWheel
 from arches.app.search.components.base import SearchFilterFactory
 from arches.app.views.base import MapBaseManagerView
 from arches.app.views.concept import get_preflabel_from_conceptid
-from arches.app.utils.permission_backend import get_nodegroups_by_perm
+from arches.app.utils.permission_backend import get_nodegroup_ids_by_perm
 from io import StringIO
 
 
@@ -163,20 +165,28 @@ def get_resource_model_label(result):
 
 
 def search_results(request):
+    include_provisional = get_provisional_type(request)
+    permitted_nodegroups = get_permitted_nodegroups(request.user)
+    user_is_reviewer = request.user.groups.filter(name='Resource Reviewer').exists()
+
+    # identical searches by users with the same permissions are answered from the cache
+    # until the resources index is next written to
+    cache_key = results_cache.get_cache_key(request, permitted_nodegroups, user_is_reviewer)
+    ret = results_cache.get(cache_key)
+    if ret is not None:
+        ret['reviewer'] = user_is_reviewer
+        ret['timestamp'] = datetime.now()
+        return JSONResponse(ret)
+
     se = SearchEngineFactory().create()
     search_results_object = {
-        'query': Query(se)
+        # track the exact total so that it can be read from the search response rather than a separate count
+        'query': Query(se, track_total_hits=True)
     }
 
-    include_provisional = get_provisional_type(request)
-    permitted_nodegroups = get_permitted_nodegroups(request.user)
-
     search_filter_factory = SearchFilterFactory(request)
     try:
-        for filter_type, querystring in list(request.GET.items()) + [('search-results', '')]:
-            search_filter = search_filter_factory.get_filter(filter_type)
-            if search_filter:
-                search_filter.append_dsl(search_results_object, permitted_nodegroups, include_provisional)
+        search_filter_factory.append_dsl(search_results_object, permitted_nodegroups, include_provisional)
     except Exception as err:
         return JSONResponse(err, status=500)
 
@@ -208,15 +218,33 @@ def search_results(request):
         for key, value in list(search_results_object.items()):
             ret[key] = value
 
-        ret['reviewer'] = request.user.groups.filter(name='Resource Reviewer').exists()
+        ret['total_results'] = results['hits']['total']['value']
+        results_cache.set(cache_key, ret)
+
+        ret['reviewer'] = user_is_reviewer
         ret['timestamp'] = datetime.now()
-        ret['total_results'] = dsl.count(index='resources')
 
         return JSONResponse(ret)
     else:
         return HttpResponseNotFound(_("There was an error retrieving the search results"))
 
 
+def export_results(request):
+    """
+    Streams every resource that matches a search (the same querystring as search_results) as csv or geojson
+
+    """
+
+    format = request.GET.get('format', 'csv')
+    if format not in CONTENT_TYPES:
+        return JSONResponse({'error': _('Unsupported export format: {0}').format(format)}, status=400)
+
+    exporter = SearchResultsExporter(request, format)
+    response = StreamingHttpResponse(exporter.export(), content_type=exporter.content_type)
+    response['Content-Disposition'] = 'attachment; filename=' + exporter.file_name
+    return response
+
+
 def get_provisional_type(request):
     """
     Parses the provisional filter data to determine if a search results will
@@ -247,7 +275,7 @@ def get_provisional_type(request):
 
 
 def get_permitted_nodegroups(user):
-    return [str(nodegroup.pk) for nodegroup in get_nodegroups_by_perm(user, 'models.read_nodegroup')]
+    return list(get_nodegroup_ids_by_perm(user, 'models.read_nodegroup'))
 
 
 def buffer(request):
@@ -281,8 +309,7 @@ def _buffer(geojson, width=0, unit='ft'):
 
 def _get_child_concepts(conceptid):
     ret = {conceptid}
-    for row in Concept().get_child_concepts(conceptid, ['prefLabel']):
-        ret.add(row[0])
+    ret.update(concept_closure.get_descendants(conceptid))
     return list(ret)
 
 
@@ -306,3 +306,4 @@ uuid.get_or_create = get
 def update_system_settings_cache(tile):
     if str(tile.resourceinstance_id) == settings.RESOURCE_INSTANCE_ID:
         settings.update_from_db()
+        settings.invalidate()
@@ -0,0 +1,47 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand
+from arches.app.models import models
+from arches.app.models.concept_closure import concept_closure
+
+
+class Command(BaseCommand):
+    """
+    Commands for managing the concept_closure table that holds the concept hierarchies
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "operation",
+            nargs="?",
+            choices=["rebuild_closure"],
+            default="rebuild_closure",
+            help="Operation Type; "
+            + "'rebuild_closure'=Rebuilds the concept_closure table from the relations table, run this after "
+            + "changing relations without going through the ORM (eg: with sql) (default)",
+        )
+
+    def handle(self, *args, **options):
+        if options["operation"] == "rebuild_closure":
+            self.rebuild_closure()
+
+    def rebuild_closure(self):
+        concept_closure.rebuild()
+        self.stdout.write("Loaded %s concept pairs" % models.ConceptClosure.objects.count())
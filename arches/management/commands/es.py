@@ -59,6 +59,15 @@ class Command(BaseCommand):
         parser.add_argument('-n', '--name ', action='store', dest='name', default=None,
             help='Name of the custom index')
 
+        parser.add_argument('--use_multiprocessing', action='store_true', dest='use_multiprocessing',
+            help='Index resources in parallel, each process indexing "batch_size" resources at a time')
+
+        parser.add_argument('--max_subprocesses', action='store', dest='max_subprocesses', type=int, default=0,
+            help='The number of processes to use with --use_multiprocessing, defaults to the number of cpus')
+
+        parser.add_argument('--resume', action='store_true', dest='resume',
+            help='Continue an interrupted --use_multiprocessing run from the last indexed batch of resources')
+
 
     def handle(self, *args, **options):
         if options['operation'] == 'setup_indexes':
@@ -77,13 +86,15 @@ class Command(BaseCommand):
             if options['name'] is not None:
                 index_database.index_resources(clear_index=options['clear_index'], index_name=options['name'], batch_size=options['batch_size'])
             else:
-                index_database.index_db(clear_index=options['clear_index'], batch_size=options['batch_size'])
+                index_database.index_db(clear_index=options['clear_index'], batch_size=options['batch_size'],
+                    use_multiprocessing=options['use_multiprocessing'], max_subprocesses=options['max_subprocesses'], resume=options['resume'])
 
         if options['operation'] == 'index_concepts':
             index_database.index_concepts(clear_index=options['clear_index'], batch_size=options['batch_size'])
 
         if options['operation'] == 'index_resources':
-            index_database.index_resources(clear_index=options['clear_index'], batch_size=options['batch_size'])
+            index_database.index_resources(clear_index=options['clear_index'], batch_size=options['batch_size'],
+                use_multiprocessing=options['use_multiprocessing'], max_subprocesses=options['max_subprocesses'], resume=options['resume'])
 
         if options['operation'] == 'index_resource_relations':
             index_database.index_resource_relations(clear_index=options['clear_index'], batch_size=options['batch_size'])
@@ -0,0 +1,60 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from arches.app.models import models
+
+
+class Command(BaseCommand):
+    """
+    Commands for managing the geojson_geometries and geojson_geometry_clusters tables that back the vector tile (MVT) api
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "operation",
+            nargs="?",
+            choices=["backfill"],
+            default="backfill",
+            help="Operation Type; "
+            + "'backfill'=Rebuilds the geometries (and their clusters) from the geojson-feature-collection values "
+            + "of the existing tiles, run this after changing a node's cluster settings (default)",
+        )
+
+        parser.add_argument(
+            "-n",
+            "--node",
+            action="store",
+            dest="nodeid",
+            default=None,
+            help="The id of a geojson-feature-collection node, only the geometries and clusters of that node will be rebuilt",
+        )
+
+    def handle(self, *args, **options):
+        if options["operation"] == "backfill":
+            self.backfill(nodeid=options["nodeid"])
+
+    def backfill(self, nodeid=None):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT __arches_refresh_geojson_geometries(%s)", [nodeid])
+        geometries = models.GeoJSONGeometry.objects.all()
+        if nodeid is not None:
+            geometries = geometries.filter(node_id=nodeid)
+        self.stdout.write("Loaded %s geometries" % geometries.count())
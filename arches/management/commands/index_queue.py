@@ -0,0 +1,66 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand
+from arches.app.utils import index_queue
+
+
+class Command(BaseCommand):
+    """
+    Commands for managing the queue of resources waiting to be indexed (see settings.INDEXING_QUEUE)
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "operation",
+            nargs="?",
+            choices=["status", "process"],
+            default="status",
+            help="Operation Type; "
+            + "'status'=Reports the number of queued resources and how long the oldest has been waiting (default) "
+            + "'process'=Indexes all of the queued resources in this process, without a celery worker",
+        )
+
+        parser.add_argument(
+            "-b",
+            "--batch_size",
+            action="store",
+            dest="batch_size",
+            type=int,
+            default=None,
+            help="The number of resources to index as a group when processing the queue",
+        )
+
+    def handle(self, *args, **options):
+        if options["operation"] == "status":
+            self.status()
+
+        if options["operation"] == "process":
+            self.process(batch_size=options["batch_size"])
+
+    def status(self):
+        status = index_queue.get_queue_status()
+        self.stdout.write("Queued entries: %s" % status["entries"])
+        self.stdout.write("Queued resources: %s" % status["resources"])
+        if status["oldest"] is not None:
+            self.stdout.write("Oldest entry: %s (waiting %s)" % (status["oldest"], status["lag"]))
+
+    def process(self, batch_size=None):
+        count = index_queue.process_queue(batch_size=batch_size)
+        self.stdout.write("Indexed %s queued resources" % count)
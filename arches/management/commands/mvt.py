@@ -0,0 +1,90 @@
+"""
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.utils import mvt
+
+
+class Command(BaseCommand):
+    """
+    Commands for managing the cache of vector tiles rendered by the "mvt" api (see settings.MVT_CACHE)
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "operation",
+            nargs="?",
+            choices=["seed", "clear"],
+            help="Operation Type; "
+            + "'seed'=Renders and caches the tiles of a node that cover its geometries at the given zoom levels "
+            + "'clear'=Removes every cached tile of a node (or of every geojson-feature-collection node)",
+        )
+
+        parser.add_argument(
+            "-n", "--node", action="store", dest="nodeid", default=None, help="The id of a geojson-feature-collection node",
+        )
+
+        parser.add_argument(
+            "--min_zoom", action="store", dest="min_zoom", type=int, default=0, help="The lowest zoom level to seed",
+        )
+
+        parser.add_argument(
+            "--max_zoom", action="store", dest="max_zoom", type=int, default=None, help="The highest zoom level to seed",
+        )
+
+    def handle(self, *args, **options):
+        if mvt.get_tile_cache() is None:
+            raise CommandError("Vector tiles aren't cached, set MVT_CACHE to the name of a cache")
+
+        if options["operation"] == "seed":
+            self.seed(options["nodeid"], options["min_zoom"], options["max_zoom"])
+
+        if options["operation"] == "clear":
+            self.clear(options["nodeid"])
+
+    def get_nodes(self, nodeid=None):
+        nodes = models.Node.objects.filter(datatype="geojson-feature-collection")
+        if nodeid is not None:
+            nodes = nodes.filter(nodeid=nodeid)
+            if len(nodes) == 0:
+                raise CommandError("%s is not the id of a geojson-feature-collection node" % nodeid)
+        return nodes
+
+    def seed(self, nodeid, min_zoom=0, max_zoom=None):
+        if nodeid is None:
+            raise CommandError("Use -n to choose the node to seed")
+        node = self.get_nodes(nodeid)[0]
+        max_zoom = int(node.config["clusterMaxZoom"]) if max_zoom is None else max_zoom
+        if max_zoom > settings.MVT_CACHE_MAX_ZOOM:
+            raise CommandError("Tiles above zoom level %s (MVT_CACHE_MAX_ZOOM) aren't cached" % settings.MVT_CACHE_MAX_ZOOM)
+
+        tiles = {}
+        for zoom, x, y, size in mvt.seed_tiles(node, range(min_zoom, max_zoom + 1)):
+            if zoom not in tiles:
+                tiles[zoom] = 0
+                self.stdout.write("Seeding zoom level %s" % zoom)
+            tiles[zoom] += 1
+        self.stdout.write("Cached %s tiles" % sum(tiles.values()))
+
+    def clear(self, nodeid=None):
+        for node in self.get_nodes(nodeid):
+            mvt.clear_tiles(node.nodeid)
+            self.stdout.write("Cleared the cached tiles of %s" % node.name)
@@ -1190,8 +1190,9 @@ class Command(BaseCommand):
 
         if data_dest != "":
             try:
-                data = resource_exporter.export(
-                    graph_id=graph, resourceinstanceids=None
+                # csv exports are streamed into the files one resource at a time
+                resource_exporter.export_to_dir(
+                    data_dest, graph_id=graph, resourceinstanceids=None
                 )
             except MissingGraphException as e:
 
@@ -1202,14 +1203,6 @@ class Command(BaseCommand):
                 )
 
                 sys.exit()
-
-            for file in data:
-                with open(os.path.join(data_dest, file["name"]), "w") as f:
-                    bufsize = 16 * 1024
-                    file["outputfile"].seek(0)
-                    shutil.copyfileobj(file["outputfile"], f, bufsize)
-                # with open(os.path.join(data_dest, file['name']), 'wb') as f:
-                #     f.write(file['outputfile'].getvalue())
         else:
             utils.print_message(
                 "No destination directory specified. Please rerun this command with the '-d' parameter populated."
@@ -1245,21 +1238,22 @@ class Command(BaseCommand):
 WARNING: Support for loading JSONL files is still experimental. Be aware that
 the format of logging and console messages has not been updated."""
             )
-            if use_multiprocessing is True:
-                print(
-                    """
+        if use_multiprocessing is True and data_source.endswith((".jsonl", ".csv", ".shp", ".zip")):
+            print(
+                """
 WARNING: Support for multiprocessing files is still experimental. While using
 multiprocessing to import resources, you will not be able to use ctrl+c (etc.)
 to cancel the operation. You will need to manually kill all of the processes
 with or just close the terminal. Also, be aware that print statements
-will be very jumbled."""
-                )
-                if not force:
-                    confirm = input("continue? Y/n ")
-                    if len(confirm) > 0 and not confirm.lower().startswith("y"):
-                        exit()
-        if use_multiprocessing is True and not data_source.endswith(".jsonl"):
-            print("Multiprocessing is only supported with JSONL import files.")
+will be very jumbled. CSV files are imported in batches of BULK_IMPORT_BATCH_SIZE
+resources, each in its own transaction, so a failed import may be partially saved."""
+            )
+            if not force:
+                confirm = input("continue? Y/n ")
+                if len(confirm) > 0 and not confirm.lower().startswith("y"):
+                    exit()
+        elif use_multiprocessing is True:
+            print("Multiprocessing is only supported with JSONL and CSV import files.")
 
         if overwrite == "":
             utils.print_message(
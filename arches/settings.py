@@ -93,6 +93,7 @@ RESOURCE_FORMATERS = {
     "json-ld": "arches.app.utils.data_management.resources.formats.rdffile.JsonLdWriter",
     "n3": "arches.app.utils.data_management.resources.formats.rdffile.RdfWriter",
     "nt": "arches.app.utils.data_management.resources.formats.rdffile.RdfWriter",
+    "nquads": "arches.app.utils.data_management.resources.formats.rdffile.RdfWriter",
     "trix": "arches.app.utils.data_management.resources.formats.rdffile.RdfWriter",
 }
 
@@ -383,6 +384,27 @@ PROFILE_LOG_BASE = os.path.join(ROOT_DIR, "logs")
 
 BULK_IMPORT_BATCH_SIZE = 2000
 
+# set to True to have bulk imports write resources, tiles and edit log records with postgres COPY
+# rather than the django ORM, much faster for large initial loads but nothing is indexed, so run
+# "python manage.py es index_resources --use_multiprocessing" once the load is complete
+BULK_IMPORT_USE_COPY = False
+# set to True to COPY into temporary staging tables and merge into the resource, tile and edit log tables
+# from there, updating (or for the edit log skipping) any rows that already exist (eg: when rerunning a partially completed load)
+BULK_IMPORT_COPY_STAGING = False
+
+# directory where a multiprocessing reindex (see "es index_resources --use_multiprocessing")
+# records its progress so that an interrupted run can be continued with "--resume"
+REINDEX_CHECKPOINT_DIR = os.path.join(ROOT_DIR, "logs")
+
+# set to True to add resources to a queue (the index_queue table) when they're saved or deleted
+# rather than indexing them during the request, the queue is indexed by a celery worker
+# in batches of INDEXING_QUEUE_BATCH_SIZE resources (see "python manage.py index_queue")
+INDEXING_QUEUE = False
+INDEXING_QUEUE_BATCH_SIZE = 500
+# queued resources that a worker claimed but didn't index (because indexing failed or the worker stopped)
+# are retried once they've been claimed for this many seconds
+INDEXING_QUEUE_CLAIM_TIMEOUT = 600
+
 SYSTEM_SETTINGS_LOCAL_PATH = os.path.join(
     ROOT_DIR, "db", "system_settings", "Arches_System_Settings_Local.json"
 )
@@ -453,6 +475,41 @@ TIMEWHEEL_DATE_TIERS = None
 # Identify the usernames and duration (seconds) for which you want to cache the timewheel
 CACHE_BY_USER = {"anonymous": 3600 * 24}
 
+# the number of seconds that search results are cached for (keyed by the query and the user's permissions),
+# or 0 to not cache them.  The cache is cleared whenever the search index is written to
+SEARCH_RESULTS_CACHE_TIMEOUT = 600
+
+# the number of seconds that a snapshot of the nodegroups each user can read, write and delete is cached for,
+# or 0 to not cache them.  Snapshots are discarded whenever permissions, group memberships or nodegroups change
+PERMISSIONS_CACHE_TIMEOUT = 3600
+
+# the number of resources whose tiles are loaded at a time when search results are exported by the "export_results" view
+SEARCH_EXPORT_CHUNK_SIZE = 500
+
+# the number of tiles fetched at a time from the server side cursor that csv exports read tiles with
+EXPORT_TILE_CHUNK_SIZE = 2000
+
+# the number of concept values (and concepts' prefLabels) each process keeps in its concept label cache,
+# the least recently used are dropped first
+CONCEPT_LABEL_CACHE_SIZE = 100000
+
+# the number of concepts whose descendants (read from the concept_closure table) each process keeps in its cache,
+# the least recently used are dropped first
+CONCEPT_CLOSURE_CACHE_SIZE = 1000
+
+# the name of the cache (in CACHES) used to store the vector tiles rendered by the "mvt" api, or None to
+# render every tile when it's requested.  Cached tiles are removed when the geometries they contain are
+# saved or deleted.  Tiles shouldn't share the "default" cache (they'd evict the version keys that keep each
+# process's caches in step), so add a cache of their own, eg: a separate memcached started with an item size
+# limit (-I) larger than the biggest tile, memcached refuses items over 1MB by default
+MVT_CACHE = None
+MVT_CACHE_TIMEOUT = 3600 * 24 * 7
+# tiles above this zoom level aren't cached
+MVT_CACHE_MAX_ZOOM = 20
+# if an edited geometry is covered by more tiles than this at a zoom level,
+# every cached tile of the node at that zoom level is dropped rather than removing the tiles one by one
+MVT_CACHE_MAX_INVALIDATED_TILES = 256
+
 DATE_IMPORT_EXPORT_FORMAT = "%Y-%m-%d"
 
 API_MAX_PAGE_SIZE = 500
@@ -477,6 +534,11 @@ SEARCH_ITEMS_PER_PAGE = 5
 SEARCH_EXPORT_ITEMS_PER_PAGE = 100000
 RELATED_RESOURCES_PER_PAGE = 15
 RELATED_RESOURCES_EXPORT_LIMIT = 10000
+
+# read the related resources of a resource (and the number of relations of each) from the resource_x_resource
+# table instead of the resource_relations index, eg: if the index can't be relied on to be up to date
+RELATED_RESOURCES_FROM_DATABASE = False
+
 SEARCH_DROPDOWN_LENGTH = 100
 SEARCH_TERM_SENSITIVITY = 3  # a lower number will give more "Fuzzy" matches, recomend between 0-4, see "prefix_length" at https://www.elastic.co/guide/en/elasticsearch/reference/6.7/query-dsl-fuzzy-query.html#_parameters_7
 WORDS_PER_SEARCH_TERM = (
@@ -1,6 +1,4 @@
-from arches.app.utils.permission_backend import get_editable_resource_types
-from arches.app.utils.permission_backend import get_createable_resource_types
-from arches.app.utils.permission_backend import get_resource_types_by_perm
+from arches.app.utils.permission_backend import user_has_resource_perm
 from django import template
 
 register = template.Library()
@@ -14,12 +12,12 @@ def has_group(user, group_names):
 
 @register.filter(name='can_edit_resource_instance')
 def can_edit_resource_instance(user):
-    return len(get_editable_resource_types(user)) > 0
+    return user_has_resource_perm(user, ['models.write_nodegroup', 'models.delete_nodegroup'])
 
 @register.filter(name='can_read_resource_instance')
 def can_read_resource_instance(user):
-    return len(get_resource_types_by_perm(user, ['models.write_nodegroup', 'models.delete_nodegroup', 'models.read_nodegroup'])) > 0
+    return user_has_resource_perm(user, ['models.write_nodegroup', 'models.delete_nodegroup', 'models.read_nodegroup'])
 
 @register.filter(name='can_create_resource_instance')
 def can_create_resource_instance(user):
-    return len(get_createable_resource_types(user)) > 0
+    return user_has_resource_perm(user, 'models.write_nodegroup')
@@ -19,16 +19,21 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 import os
 import json
 import csv
+import shutil
+import tempfile
 from io import BytesIO
 from tests import test_settings
 from operator import itemgetter
 from django.core import management
 from tests.base_test import ArchesTestCase
+from rdflib import ConjunctiveGraph
+from rdflib.compare import isomorphic
 from arches.app.utils.skos import SKOSReader
 from arches.app.models.models import TileModel, ResourceInstance
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 from arches.app.utils.data_management.resources.importer import BusinessDataImporter
 from arches.app.utils.data_management.resources.exporter import ResourceExporter as BusinessDataExporter
+from arches.app.utils.data_management.resources.formats.rdffile import RdfWriter
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as ResourceGraphImporter
 
 
@@ -73,6 +78,26 @@ class BusinessDataExportTests(ArchesTestCase):
 
         self.assertDictEqual(dict(csv_input), dict(csv_output))
 
+    def test_csv_export_to_dir(self):
+        BusinessDataImporter('tests/fixtures/data/csv/resource_export_test.csv').import_business_data()
+
+        dest_dir = tempfile.mkdtemp()
+        try:
+            names = BusinessDataExporter('csv',
+                                         configs='tests/fixtures/data/csv/resource_export_test.mapping',
+                                         single_file=True).export_to_dir(dest_dir)
+            with open(os.path.join(dest_dir, names[0]), encoding="utf-8") as f:
+                csv_output = list(csv.DictReader(f))[0]
+        finally:
+            shutil.rmtree(dest_dir)
+
+        csvinputfile = 'tests/fixtures/data/csv/resource_export_test.csv'
+        csv_input = list(csv.DictReader(open(csvinputfile, 'rU', encoding="utf-8"),
+                         restkey='ADDITIONAL',
+                         restval='MISSING'))[0]
+
+        self.assertDictEqual(dict(csv_input), dict(csv_output))
+
     def test_json_export(self):
 
         def deep_sort(obj):
@@ -108,3 +133,27 @@ class BusinessDataExportTests(ArchesTestCase):
             open('tests/fixtures/data/json/resource_export_business_data_truth.json')))
 
         self.assertDictEqual(json_export, json_truth)
+
+    def test_streamed_rdf_export(self):
+        BusinessDataImporter(
+            'tests/fixtures/data/json/resource_export_business_data_truth.json').import_business_data()
+        graph_id = 'ab74af76-fa0e-11e6-9e3e-026d961c88e6'
+
+        writer = RdfWriter(format='xml')
+        writer.get_tiles(graph_id=graph_id)
+        rdf_graph = writer.get_rdf_graph()
+
+        export = BusinessDataExporter('nt').export(graph_id)
+        ntriples = ConjunctiveGraph()
+        ntriples.parse(data=export[0]['outputfile'].getvalue(), format='nt')
+        self.assertTrue(isomorphic(rdf_graph, ntriples))
+
+        # each resource's triples are in a graph named by the resource's uri
+        export = BusinessDataExporter('nquads').export(graph_id)
+        nquads = ConjunctiveGraph()
+        nquads.parse(data=export[0]['outputfile'].getvalue(), format='nquads')
+        self.assertEqual(len(nquads), len(rdf_graph))
+        resource_graphs = [context.identifier for context in nquads.contexts() if len(context) > 0]
+        self.assertEqual(len(resource_graphs), len(writer.resourceinstances))
+        for identifier in resource_graphs:
+            self.assertIn('resources/', str(identifier))
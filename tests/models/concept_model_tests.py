@@ -16,11 +16,15 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import uuid
 from tests import test_settings
 from tests.base_test import ArchesTestCase
 from arches.app.models import models
 from arches.app.models.concept import Concept
-from arches.app.models.concept import ConceptValue
+from arches.app.models.concept import ConceptValue, get_preflabel_from_valueid
+from arches.app.models.concept_closure import concept_closure
+from arches.app.models.concept_labels import concept_labels, ConceptLabel
+from arches.app.models.system_settings import settings
 
 # these tests can be run from the command line via
 # python manage.py test tests/models/concept_model_tests.py --pattern="*.py" --settings="tests.test_settings"
@@ -245,3 +249,85 @@ class ConceptModelTests(ArchesTestCase):
         self.assertEqual(pl.type,'prefLabel')
         self.assertEqual(pl.value,'bier' or 'beer')
         self.assertEqual(pl.language,'nl' or 'es-SP')
+
+    def test_concept_label_cache(self):
+        """
+        Test that cached concept values are looked up in bulk and dropped when a value is saved
+
+        """
+
+        concept = Concept()
+        concept.nodetype = 'Concept'
+        concept.values = [
+            ConceptValue({'type': 'prefLabel', 'category': 'label', 'value': 'test label cache', 'language': 'en-US'}),
+            ConceptValue({'type': 'altLabel', 'category': 'label', 'value': 'test label cache alt', 'language': 'en-US'})
+        ]
+        concept.save()
+        valueids = [value.id for value in concept.values]
+
+        labels = concept_labels.get_many(valueids)
+        self.assertEqual(labels[valueids[0]], ConceptLabel(valueids[0], 'test label cache', concept.id, 'en-US', 'prefLabel', 'label'))
+        self.assertEqual(labels[valueids[1]].value, 'test label cache alt')
+        self.assertEqual([label.value for label in concept_labels.get_preflabels(concept.id)], ['test label cache'])
+        self.assertIsNone(concept_labels.get(str(uuid.uuid4())))
+
+        concept.values[0].value = 'updated label cache'
+        concept.values[0].save()
+        self.assertEqual(concept_labels.get(valueids[0]).value, 'updated label cache')
+        self.assertEqual(get_preflabel_from_valueid(valueids[1], 'en-US')['value'], 'updated label cache')
+
+    def test_concept_closure(self):
+        """
+        Test that the concept_closure table follows relations as they're added and removed
+
+        """
+
+        concepts = {}
+        for name in ('scheme', 'a', 'b', 'c'):
+            concept = Concept()
+            concept.nodetype = 'ConceptScheme' if name == 'scheme' else 'Concept'
+            concept.values = [ConceptValue({'type': 'prefLabel', 'category': 'label', 'value': 'closure %s' % name, 'language': 'en-US'})]
+            concept.save()
+            concepts[name] = concept
+        concepts['scheme'].add_relation(concepts['a'], 'hasTopConcept')
+        concepts['a'].add_relation(concepts['b'], 'narrower')
+        concepts['b'].add_relation(concepts['c'], 'narrower')
+        concepts['a'].add_relation(concepts['c'], 'narrower')
+
+        def get_depth(ancestor, descendant):
+            return models.ConceptClosure.objects.get(ancestor_id=concepts[ancestor].id, descendant_id=concepts[descendant].id, relationtype_id='narrower').depth
+
+        self.assertCountEqual(concept_closure.get_descendants(concepts['scheme'].id), [concepts[name].id for name in ('a', 'b', 'c')])
+        self.assertEqual(get_depth('scheme', 'c'), 2)
+        self.assertCountEqual(concept_closure.get_ancestors(concepts['c'].id), [concepts[name].id for name in ('scheme', 'a', 'b')])
+
+        models.Relation.objects.get(conceptfrom_id=concepts['a'].id, conceptto_id=concepts['c'].id).delete()
+        self.assertEqual(get_depth('scheme', 'c'), 3)
+
+        models.Relation.objects.get(conceptfrom_id=concepts['a'].id, conceptto_id=concepts['b'].id).delete()
+        self.assertEqual(concept_closure.get_descendants(concepts['scheme'].id), [concepts['a'].id])
+        self.assertEqual(concept_closure.get_descendants(concepts['b'].id), [concepts['c'].id])
+        self.assertEqual([row[0] for row in Concept().get_child_concepts(concepts['b'].id, columns='conceptidto::text')], [concepts['c'].id])
+
+    def test_concept_closure_without_cache(self):
+        """
+        Test that descendants are read from the concept_closure table when none are kept in the cache
+
+        """
+
+        concepts = {}
+        for name in ('parent', 'child'):
+            concept = Concept()
+            concept.nodetype = 'Concept'
+            concept.values = [ConceptValue({'type': 'prefLabel', 'category': 'label', 'value': 'uncached %s' % name, 'language': 'en-US'})]
+            concept.save()
+            concepts[name] = concept
+        concepts['parent'].add_relation(concepts['child'], 'narrower')
+
+        cache_size = settings.CONCEPT_CLOSURE_CACHE_SIZE
+        try:
+            settings.CONCEPT_CLOSURE_CACHE_SIZE = 0
+            self.assertEqual(concept_closure.get_descendants(concepts['parent'].id), [concepts['child'].id])
+            self.assertEqual(concept_closure.get_descendants(concepts['parent'].id), [concepts['child'].id])
+        finally:
+            settings.CONCEPT_CLOSURE_CACHE_SIZE = cache_size
@@ -23,6 +23,7 @@ from tests.base_test import ArchesTestCase
 from arches.app.models import models
 from arches.app.models.graph import Graph, GraphValidationError
 from arches.app.models.card import Card
+from arches.app.models.graph_metadata import graph_metadata
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 
 # these tests can be run from the command line via
@@ -836,6 +837,49 @@ class GraphTests(ArchesTestCase):
         self.assertEqual(len(graph.cards), 2)
         self.assertEqual(len(graph.get_nodegroups()), 2)
 
+    def test_graph_metadata_is_reloaded_after_save(self):
+        """
+        test that the cached graph metadata reflects changes saved to a graph
+
+        """
+        graph = Graph.new(name='TEST',is_resource=False,author='TEST')
+        graph.append_branch('http://www.cidoc-crm.org/cidoc-crm/P1_is_identified_by', graphid=self.NODE_NODETYPE_GRAPHID)
+        graph.save()
+
+        metadata = graph_metadata.get(graph.pk)
+        self.assertEqual(len(metadata.nodes), 3)
+        self.assertEqual(metadata.root_ontology_class, graph.root.ontologyclass)
+        self.assertEqual(len(metadata.nodegroups), 1)
+
+        graph.append_branch('http://www.cidoc-crm.org/cidoc-crm/P1_is_identified_by', graphid=self.NODE_NODETYPE_GRAPHID)
+        graph.save()
+
+        metadata = graph_metadata.get(graph.pk)
+        self.assertEqual(len(metadata.nodes), 5)
+        self.assertEqual(len(metadata.nodegroups), 2)
+        for nodeid, datatype in metadata.node_datatypes.items():
+            self.assertEqual(models.Node.objects.get(pk=nodeid).datatype, datatype)
+
+    def test_graph_metadata_is_reloaded_after_nodegroup_save(self):
+        """
+        test that saving a nodegroup reloads the metadata of its graph, even when the
+        nodegroup's graph hadn't been loaded by the process that saved it
+
+        """
+        graph = Graph.new(name='TEST',is_resource=False,author='TEST')
+        graph.append_branch('http://www.cidoc-crm.org/cidoc-crm/P1_is_identified_by', graphid=self.NODE_NODETYPE_GRAPHID)
+        graph.save()
+
+        metadata = graph_metadata.get(graph.pk)
+        nodegroupid, cardinality = list(metadata.cardinality.items())[0]
+        graph_metadata._nodegroup_graphs.clear()
+
+        nodegroup = models.NodeGroup.objects.get(pk=nodegroupid)
+        nodegroup.cardinality = 'n' if cardinality == '1' else '1'
+        nodegroup.save()
+
+        self.assertEqual(graph_metadata.get(graph.pk).cardinality[nodegroupid], nodegroup.cardinality)
+
     def test_derive_card_values(self):
         """
         test to make sure we get the proper name and description for display in the ui
@@ -27,7 +27,7 @@ from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializ
 from arches.app.utils.skos import SKOSReader
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as ResourceGraphImporter
-from arches.app.utils.data_management.resources.importer import  BusinessDataImporter
+from arches.app.utils.data_management.resources.importer import  BusinessDataImporter, RowReader, read_csv_rows, group_rows_by_resource
 
 
 # these tests can be run from the command line via
@@ -145,3 +145,20 @@ class mappedCSVFileImportTests(ArchesTestCase):
         new_tile_count = TileModel.objects.count()
         tile_difference = new_tile_count - og_tile_count
         self.assertEqual(tile_difference, 1)
+
+    def test_bulk_csv_import(self):
+        og_tile_count = TileModel.objects.count()
+        BusinessDataImporter('tests/fixtures/data/csv/cardinality_test_data/single-n_to_n.csv').import_business_data(bulk=True)
+        new_tile_count = TileModel.objects.count()
+        tile_difference = new_tile_count - og_tile_count
+        self.assertEqual(tile_difference, 2)
+
+    def test_csv_rows_are_read_lazily(self):
+        rows = RowReader(read_csv_rows, 'tests/fixtures/data/csv/cardinality_test_data/single-n_to_n.csv')
+        self.assertFalse(isinstance(rows, list))
+        self.assertEqual(list(rows), list(rows))
+
+    def test_group_rows_by_resource(self):
+        rows = [{'ResourceID': resourceid} for resourceid in ['a', 'a', 'b', 'c', 'c', 'c', 'd']]
+        batches = list(group_rows_by_resource(rows, 2))
+        self.assertEqual([[row['ResourceID'] for row in batch] for batch in batches], [['a', 'a', 'b'], ['c', 'c', 'c', 'd']])
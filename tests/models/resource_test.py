@@ -23,10 +23,13 @@ import time
 from django.contrib.auth.models import User, Group
 from django.urls import reverse
 from django.test.client import Client
+from mock import patch
 from guardian.shortcuts import assign_perm
 
+from arches.app.datatypes.datatypes import DataTypeFactory
 from arches.app.models import models
 from arches.app.models.resource import Resource
+from arches.app.models.system_settings import settings
 from arches.app.models.tile import Tile
 from arches.app.search.mappings import prepare_terms_index, delete_terms_index, \
     prepare_concepts_index, delete_concepts_index, prepare_search_index, delete_search_index, \
@@ -35,6 +38,8 @@ from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializ
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as resource_graph_importer
 from arches.app.utils.exceptions import InvalidNodeNameException, MultipleNodesFoundException
 from arches.app.utils.index_database import index_resources_by_type
+from arches.app.utils import index_queue
+from arches.app.utils.data_management.resources import copy_loader
 from tests.base_test import ArchesTestCase
 
 
@@ -246,3 +251,127 @@ class ResourceTests(ArchesTestCase):
 
         result = index_resources_by_type([self.search_model_graphid], clear_index=True, batch_size=4000)
         self.assertEqual(result, 'Passed')
+
+    def test_get_documents_to_index_in_bulk(self):
+        """
+        Test that documents built for a batch of resources match those built one at a time
+        """
+
+        datatype_factory = DataTypeFactory()
+        node_datatypes = {str(nodeid): datatype for nodeid, datatype in models.Node.objects.values_list('nodeid', 'datatype')}
+        document, terms = self.test_resource.get_documents_to_index(
+            fetchTiles=True, datatype_factory=datatype_factory, node_datatypes=node_datatypes)
+        documents, bulk_terms = Resource.get_documents_to_index_in_bulk([self.test_resource.resourceinstanceid])
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(documents[0]['resourceinstanceid'], document['resourceinstanceid'])
+        self.assertEqual(len(documents[0]['tiles']), len(document['tiles']))
+        self.assertEqual(documents[0]['strings'], document['strings'])
+        self.assertEqual(sorted(term['_id'] for term in bulk_terms), sorted(term['_id'] for term in terms))
+
+        # the descriptors of the batch are rendered together
+        with patch.object(Resource, 'get_descriptors_in_bulk', wraps=Resource.get_descriptors_in_bulk) as get_descriptors_in_bulk:
+            Resource.get_documents_to_index_in_bulk([self.test_resource.resourceinstanceid, self.test_resource.resourceinstanceid])
+        self.assertEqual(get_descriptors_in_bulk.call_count, 1)
+
+    def test_get_descriptors_without_descriptor_function(self):
+        """
+        Test that a resource whose graph has no primary descriptors function has undefined descriptors
+        """
+
+        descriptors = Resource.get_descriptors_in_bulk([self.test_resource])[str(self.test_resource.resourceinstanceid)]
+        self.assertEqual(descriptors, {'name': 'undefined', 'description': 'undefined', 'map_popup': 'undefined'})
+        self.assertEqual(self.test_resource.displayname, 'undefined')
+
+    def test_get_tile_index_values(self):
+        """
+        Test that the values a tile contributes to its resource's document are tagged with the tile's id
+        """
+
+        datatype_factory = DataTypeFactory()
+        node_datatypes = {str(nodeid): datatype for nodeid, datatype in models.Node.objects.values_list('nodeid', 'datatype')}
+        tile = models.TileModel.objects.get(resourceinstance_id=self.test_resource.resourceinstanceid,
+                                            nodegroup_id=self.search_model_name_nodeid)
+        values, terms = Resource.get_tile_index_values(tile, datatype_factory, node_datatypes)
+        self.assertEqual([value['string'] for value in values['strings']], ['Test Name 1'])
+        self.assertTrue(all(value['tileid'] == tile.tileid for value in values['strings']))
+        self.assertTrue(all(term['_source']['tileid'] == tile.tileid for term in terms))
+        self.assertEqual(values['dates'], [])
+
+    def test_index_queue(self):
+        """
+        Test that queued resources are indexed once and removed from the queue
+        """
+
+        index_queue.queue_resource(self.test_resource.resourceinstanceid)
+        index_queue.queue_resource(self.test_resource.resourceinstanceid)
+        status = index_queue.get_queue_status()
+        self.assertEqual(status['entries'], 2)
+        self.assertEqual(status['resources'], 1)
+
+        self.assertEqual(index_queue.process_queue(), 1)
+        self.assertEqual(index_queue.get_queue_status()['entries'], 0)
+
+        # the entries of resources that fail to index are kept, and retried once their claim expires
+        index_queue.queue_resource(self.test_resource.resourceinstanceid)
+        with patch.object(index_queue, '_index_resources', return_value={str(self.test_resource.resourceinstanceid)}):
+            self.assertEqual(index_queue.process_queue(), 0)
+        self.assertEqual(index_queue.get_queue_status()['entries'], 1)
+        self.assertEqual(index_queue.process_queue(), 0)
+
+        models.IndexQueue.objects.update(claimed=None)
+        self.assertEqual(index_queue.process_queue(), 1)
+        self.assertEqual(index_queue.get_queue_status()['entries'], 0)
+
+    def test_load_resources_with_copy(self):
+        """
+        Test that resources and tiles written with COPY are saved with their values intact
+        """
+
+        resource = Resource(graph_id=self.search_model_graphid)
+        tile = Tile(data={self.search_model_name_nodeid: 'Copied\tName\\'}, nodegroup_id=self.search_model_name_nodeid)
+        tile.resourceinstance_id = resource.resourceinstanceid
+        resource.tiles = [tile]
+        copy_loader.load_resources([resource])
+
+        self.assertTrue(models.ResourceInstance.objects.filter(pk=resource.resourceinstanceid).exists())
+        saved_tile = models.TileModel.objects.get(pk=tile.tileid)
+        self.assertEqual(saved_tile.data[self.search_model_name_nodeid], 'Copied\tName\\')
+        self.assertTrue(models.EditLog.objects.filter(resourceinstanceid=resource.resourceinstanceid, edittype='create').exists())
+
+        # rerunning a load through the staging tables doesn't duplicate the edit log
+        edits = models.EditLog.objects.filter(resourceinstanceid=resource.resourceinstanceid).count()
+        copy_staging = settings.BULK_IMPORT_COPY_STAGING
+        settings.BULK_IMPORT_COPY_STAGING = True
+        try:
+            copy_loader.load_resources([resource])
+            copy_loader.load_resources([resource])
+        finally:
+            settings.BULK_IMPORT_COPY_STAGING = copy_staging
+        self.assertEqual(models.EditLog.objects.filter(resourceinstanceid=resource.resourceinstanceid).count(), edits)
+        self.assertEqual(models.TileModel.objects.filter(pk=tile.tileid).count(), 1)
+
+    def test_get_related_resources(self):
+        """
+        Test that related resources are listed with the number of relations each has
+        """
+
+        related = []
+        for name in ('Related 1', 'Related 2'):
+            resource = Resource(graph_id=self.search_model_graphid)
+            resource.tiles.append(Tile(data={self.search_model_name_nodeid: name}, nodegroup_id=self.search_model_name_nodeid))
+            resource.save()
+            related.append(resource)
+        for resourcefrom, resourceto in ((self.test_resource, related[0]), (self.test_resource, related[1]), (related[0], related[1])):
+            models.ResourceXResource(resourceinstanceidfrom=resourcefrom, resourceinstanceidto=resourceto, relationshiptype='related').save()
+        time.sleep(1)
+
+        for from_database in (False, True):
+            settings.RELATED_RESOURCES_FROM_DATABASE = from_database
+            try:
+                ret = self.test_resource.get_related_resources(start=0, limit=1000)
+            finally:
+                settings.RELATED_RESOURCES_FROM_DATABASE = False
+            self.assertEqual(ret['total']['value'], 2)
+            self.assertEqual(set(relation['relationshiptype_label'] for relation in ret['resource_relationships']), {'related'})
+            self.assertCountEqual([resource['resourceinstanceid'] for resource in ret['related_resources']], [str(resource.pk) for resource in related])
+            self.assertEqual([resource['total_relations']['value'] for resource in ret['related_resources']], [2, 2])
@@ -0,0 +1,50 @@
+'''
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from tests.base_test import ArchesTestCase
+from arches.app.models.system_settings import settings, SystemSettings
+
+# these tests can be run from the command line via
+# python manage.py test tests/models/system_settings_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class SystemSettingsTests(ArchesTestCase):
+
+    def test_missing_settings_are_remembered(self):
+        """
+        Test that looking up a setting that doesn't exist only reads the database once per version of the settings
+
+        """
+
+        settings.refresh()
+        self.assertFalse(hasattr(settings, 'NOT_A_SYSTEM_SETTING'))
+        self.assertIn('NOT_A_SYSTEM_SETTING', SystemSettings._missing)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(hasattr(settings, 'NOT_A_SYSTEM_SETTING'))
+        self.assertEqual(len(queries), 0)
+
+        # a new version (saved by any process) reloads the settings and forgets the missing names
+        cache.set(SystemSettings.VERSION_KEY, 'changed', None)
+        SystemSettings._version_checked = 0
+        settings.refresh()
+        self.assertEqual(SystemSettings._loaded_version, settings.get_version())
+        self.assertNotIn('NOT_A_SYSTEM_SETTING', SystemSettings._missing)
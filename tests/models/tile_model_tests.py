@@ -29,6 +29,7 @@ from django.db import connection
 from django.core import management
 from django.contrib.auth.models import User
 from django.http import HttpRequest
+from arches.app.models import models
 from arches.app.models.tile import Tile
 from arches.app.search.mappings import prepare_terms_index, delete_terms_index, \
     prepare_concepts_index, delete_concepts_index, prepare_search_index, delete_search_index
@@ -375,6 +376,89 @@ class TileTests(ArchesTestCase):
 
         self.assertEqual(len(Tile.objects.all()), 0)
 
+    def test_geojson_geometries(self):
+        """
+        Tests that the geojson_geometries table is kept in step with the geometries of saved and deleted tiles
+
+        """
+
+        nodeid = "3ebc6785-fa61-11e6-8c85-14109fd34195"
+        point = {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [0, 0]}}
+        line = {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": [[0, 0], [1, 1]]}}
+
+        tile = models.TileModel.objects.create(
+            resourceinstance_id="40000000-0000-0000-0000-000000000000",
+            nodegroup_id=nodeid,
+            data={nodeid: {"type": "FeatureCollection", "features": [point, line]}},
+        )
+        geometries = models.GeoJSONGeometry.objects.filter(tile_id=tile.tileid)
+        self.assertEqual(geometries.count(), 2)
+        self.assertEqual(geometries.first().geom.srid, 3857)
+
+        tile.data = {nodeid: {"type": "FeatureCollection", "features": [point]}}
+        tile.save()
+        self.assertEqual(geometries.count(), 1)
+
+        tile.delete()
+        self.assertEqual(geometries.count(), 0)
+
+    def test_geojson_geometries_skip_invalid_features(self):
+        """
+        Tests that features with a missing or invalid geometry don't prevent a tile from being saved
+
+        """
+
+        nodeid = "3ebc6785-fa61-11e6-8c85-14109fd34195"
+        point = {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [0, 0]}}
+        empty = {"type": "Feature", "properties": {}, "geometry": None}
+        invalid = {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": "invalid"}}
+
+        tile = models.TileModel.objects.create(
+            resourceinstance_id="40000000-0000-0000-0000-000000000000",
+            nodegroup_id=nodeid,
+            data={nodeid: {"type": "FeatureCollection", "features": [empty, invalid, point]}},
+        )
+        self.assertEqual(models.GeoJSONGeometry.objects.filter(tile_id=tile.tileid).count(), 1)
+
+    def test_geojson_geometry_clusters(self):
+        """
+        Tests that the clusters drawn at low zoom levels are updated as geometries are added and removed
+
+        """
+
+        # the node is clustered up to zoom level 5 when there are at least 3 geometries in a cell
+        nodeid = "3ebc6785-fa61-11e6-8c85-14109fd34195"
+        points = [
+            {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [10 + i * 0.001, 10]}} for i in range(3)
+        ]
+
+        tile = models.TileModel.objects.create(
+            resourceinstance_id="40000000-0000-0000-0000-000000000000",
+            nodegroup_id=nodeid,
+            data={nodeid: {"type": "FeatureCollection", "features": points}},
+        )
+        clusters = models.GeoJSONGeometryCluster.objects.filter(node_id=nodeid)
+        # the clusters are rebuilt when the transaction commits
+        self.assertEqual(clusters.count(), 0)
+        self.commit_geometry_changes()
+        self.assertEqual(clusters.count(), 6)
+        self.assertTrue(all(cluster.total == 3 and cluster.members is None for cluster in clusters))
+
+        tile.data = {nodeid: {"type": "FeatureCollection", "features": points[:2]}}
+        tile.save()
+        self.commit_geometry_changes()
+        self.assertTrue(all(cluster.total == 2 and len(cluster.members) == 2 for cluster in clusters))
+
+        tile.delete()
+        self.commit_geometry_changes()
+        self.assertEqual(clusters.count(), 0)
+
+    def commit_geometry_changes(self):
+        # a test case never commits its transaction, so fire the deferred triggers that would run on commit
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
     def test_provisional_deletion(self):
         """
         Tests that a tile is NOT deleted if a user does not have the
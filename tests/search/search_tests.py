@@ -18,7 +18,10 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import time
 import uuid
+from mock import patch
 from tests.base_test import ArchesTestCase
+from django.test.client import RequestFactory
+from arches.app.search import results_cache
 from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Bool, Match, Query, Nested, Terms, GeoShape, Range
 
@@ -33,6 +36,9 @@ class SearchTests(ArchesTestCase):
         se = SearchEngineFactory().create()
         se.delete_index(index='test')
         se.delete_index(index='bulk')
+        se.delete_index(index='streaming')
+        se.delete_index(index='parallel')
+        se.delete_index(index='searchafter')
 
     def test_delete_by_query(self):
         """
@@ -105,3 +111,93 @@ class SearchTests(ArchesTestCase):
         count_after = se.count(index='bulk')
         self.assertEqual(count_after, 1001)
 
+    def test_streaming_bulk_index(self):
+        """
+        Test adding documents from a generator to Elasticsearch in bulk
+
+        """
+
+        se = SearchEngineFactory().create()
+        se.create_index(index='streaming')
+
+        def documents():
+            for i in range(1001):
+                doc = {
+                    'id': i,
+                    'type': 'prefLabel',
+                    'value': 'test pref label',
+                }
+                yield se.create_bulk_item(op_type='index', index='streaming', id=doc['id'], data=doc)
+
+        count = se.streaming_bulk_index(documents(), chunk_size=500, refresh=True)
+        self.assertEqual(count, 1001)
+        self.assertEqual(se.count(index='streaming'), 1001)
+
+    def test_parallel_bulk_index_errors(self):
+        """
+        Test that documents rejected by Elasticsearch are reported rather than stopping a parallel bulk index
+
+        """
+
+        se = SearchEngineFactory().create()
+        se.create_index(index='parallel', body={'mappings': {'_doc': {'properties': {'value': {'type': 'integer'}}}}})
+
+        def documents():
+            for i in range(10):
+                doc = {
+                    'id': i,
+                    'value': i if i != 5 else 'not a number',
+                }
+                yield se.create_bulk_item(op_type='index', index='parallel', id=doc['id'], data=doc)
+
+        errors = []
+        count = se.parallel_bulk_index(documents(), thread_count=2, chunk_size=3, errors=errors, refresh=True)
+        self.assertEqual(count, 9)
+        self.assertEqual([error['index']['_id'] for error in errors], ['5'])
+        self.assertEqual(se.count(index='parallel'), 9)
+
+    def test_search_all(self):
+        """
+        Test reading every hit of a query a page at a time with search_after
+
+        """
+
+        se = SearchEngineFactory().create()
+        se.create_index(index='searchafter')
+        documents = [se.create_bulk_item(op_type='index', index='searchafter', id=i, data={'id': i, 'value': 'test pref label'}) for i in range(25)]
+        se.bulk_index(documents, refresh=True)
+
+        query = Query(se)
+        query.add_query(Match(field='value', query='test'))
+        ids = [hit['_source']['id'] for hit in query.search_all(index='searchafter', page_size=10, tiebreaker='id')]
+        self.assertEqual(sorted(ids), list(range(25)))
+
+    def test_search_results_cache_key(self):
+        """
+        Test that cached search results are shared by equivalent requests and dropped when the resources index changes
+
+        """
+
+        factory = RequestFactory()
+        results_cache.invalidate()
+        # results read right after the index has changed aren't cached
+        self.assertIsNone(results_cache.get_cache_key(factory.get('/search/resources', {'paging-filter': 1}), ['a'], False))
+
+        time.sleep(results_cache.REFRESH_INTERVAL)
+        key = results_cache.get_cache_key(factory.get('/search/resources?paging-filter=1&term-filter=[]'), ['a', 'b'], False)
+        self.assertEqual(key, results_cache.get_cache_key(factory.get('/search/resources?term-filter=[]&paging-filter=1'), ['b', 'a'], False))
+        self.assertNotEqual(key, results_cache.get_cache_key(factory.get('/search/resources?term-filter=[]&paging-filter=1'), ['a'], False))
+        self.assertNotEqual(key, results_cache.get_cache_key(factory.get('/search/resources?term-filter=[]&paging-filter=1'), ['a', 'b'], True))
+
+        se = SearchEngineFactory().create()
+        se.delete(index='resources', id=str(uuid.uuid4()))
+        time.sleep(results_cache.REFRESH_INTERVAL)
+        self.assertNotEqual(key, results_cache.get_cache_key(factory.get('/search/resources?paging-filter=1&term-filter=[]'), ['a', 'b'], False))
+
+        # dropping or recreating the resources index discards the cached results too
+        with patch.object(results_cache, 'invalidate') as invalidate, patch.object(se.es.indices, 'delete'), patch.object(se.es.indices, 'create'):
+            se.create_index(index='test')
+            invalidate.assert_not_called()
+            se.delete_index(index='resources')
+            se.create_index(index='resources')
+            self.assertEqual(invalidate.call_count, 2)
@@ -0,0 +1,78 @@
+'''
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import shutil
+import tempfile
+from mock import patch
+from tests import test_settings
+from tests.base_test import ArchesTestCase
+from arches.app.models.graph import Graph
+from arches.app.models.system_settings import settings
+from arches.app.search.elasticsearch_dsl_builder import Query
+from arches.app.utils import index_database
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/index_database_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class InterruptedRun(Exception):
+    pass
+
+
+class IndexDatabaseTests(ArchesTestCase):
+
+    def test_resume_interrupted_reindex(self):
+        """
+        Test that resuming an interrupted multiprocessing reindex skips the resource types that were completed
+        and continues the interrupted one from its checkpoint without clearing its documents from the index
+
+        """
+
+        completed_type = str(Graph.new(name='Completed', is_resource=True).graphid)
+        interrupted_type = str(Graph.new(name='Interrupted', is_resource=True).graphid)
+        resume_from = '00000000-0000-0000-0000-000000000001'
+
+        def index_partitions(resource_type, **kwargs):
+            if resource_type == interrupted_type:
+                index_database._write_checkpoint(resource_type, resume_from)
+                raise InterruptedRun()
+
+        checkpoint_dir = settings.REINDEX_CHECKPOINT_DIR
+        settings.REINDEX_CHECKPOINT_DIR = tempfile.mkdtemp()
+        try:
+            with patch.object(index_database, '_index_resources_by_partition', side_effect=index_partitions):
+                with self.assertRaises(InterruptedRun):
+                    index_database.index_resources_by_type([completed_type, interrupted_type], use_multiprocessing=True)
+
+            self.assertEqual(index_database._read_checkpoint(completed_type), {'start': None, 'completed': True})
+            self.assertEqual(index_database._read_checkpoint(interrupted_type), {'start': resume_from, 'completed': False})
+
+            with patch.object(index_database, '_index_resources_by_partition') as index_partitions:
+                with patch.object(Query, 'delete') as delete:
+                    index_database.index_resources_by_type([completed_type, interrupted_type], use_multiprocessing=True, resume=True)
+
+            index_partitions.assert_called_once_with(interrupted_type, batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+                max_subprocesses=0, checkpoint=resume_from)
+            delete.assert_not_called()
+
+            # the checkpoints are removed once every resource type has been indexed
+            self.assertIsNone(index_database._read_checkpoint(completed_type))
+            self.assertIsNone(index_database._read_checkpoint(interrupted_type))
+        finally:
+            shutil.rmtree(settings.REINDEX_CHECKPOINT_DIR)
+            settings.REINDEX_CHECKPOINT_DIR = checkpoint_dir
@@ -0,0 +1,71 @@
+'''
+ARCHES - a program developed to inventory and manage immovable cultural heritage.
+Copyright (C) 2013 J. Paul Getty Trust and World Monuments Fund
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import uuid
+from tests.base_test import ArchesTestCase
+from arches.app.models import models
+from arches.app.models.system_settings import settings
+from arches.app.utils import mvt
+
+# these tests can be run from the command line via
+# python manage.py test tests/utils/mvt_tests.py --pattern="*.py" --settings="tests.test_settings"
+
+
+class MVTTests(ArchesTestCase):
+    def test_get_tile_range(self):
+        """
+        Test that the tiles covering a bounding box are found at different zoom levels
+
+        """
+
+        self.assertEqual(mvt.get_tile_range((0, 0, 0, 0), 0), (0, 0, 0, 0))
+        # the origin is on the corner shared by the four tiles at zoom level 1
+        self.assertEqual(mvt.get_tile_range((0, 0, 0, 0), 1), (1, 1, 1, 1))
+        self.assertEqual(mvt.get_tile_range((0, 0, 0, 0), 1, buffer=1), (0, 0, 1, 1))
+        self.assertEqual(mvt.get_tile_range((-mvt.MAXEXTENT, -mvt.MAXEXTENT, mvt.MAXEXTENT, mvt.MAXEXTENT), 2), (0, 0, 3, 3))
+
+    def test_invalidate_tiles(self):
+        """
+        Test that only the cached tiles covering an edited geometry are removed
+
+        """
+
+        node = models.Node(nodeid=uuid.uuid4(), config={"clusterMaxZoom": 5, "clusterDistance": 20, "clusterMinPoints": 3})
+        mvt_cache = settings.MVT_CACHE
+        try:
+            settings.MVT_CACHE = "default"
+            tile_cache = mvt.get_tile_cache()
+            generation = mvt.get_generation(tile_cache, node.nodeid, 10)
+            covering_key = mvt.get_tile_key(node.nodeid, generation, 10, 512, 512)
+            other_key = mvt.get_tile_key(node.nodeid, generation, 10, 100, 100)
+            tile_cache.set_many({covering_key: b"tile", other_key: b"tile"})
+
+            mvt.invalidate_tiles(node, (0, 0, 10, 10))
+
+            self.assertIsNone(tile_cache.get(covering_key))
+            self.assertEqual(tile_cache.get(other_key), b"tile")
+        finally:
+            settings.MVT_CACHE = mvt_cache
+
+    def test_tiles_are_not_cached_by_default(self):
+        """
+        Test that vector tiles are only cached once a cache has been chosen for them
+
+        """
+
+        self.assertIsNone(mvt.get_tile_cache())
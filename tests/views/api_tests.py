@@ -27,8 +27,10 @@ import os
 from tests import test_settings
 from tests.base_test import ArchesTestCase
 from django.urls import reverse
+from django.contrib.auth.models import User
 from django.test.client import RequestFactory, Client
-from arches.app.views.api import APIBase
+from arches.app.views.api import APIBase, GeoJSON
+from arches.app.models import models
 from arches.app.models.graph import Graph
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
 
@@ -63,6 +65,11 @@ class APITests(ArchesTestCase):
             cls.phase_type_assignment_graph = Graph(json['graph'][0])
             cls.phase_type_assignment_graph.save()
 
+        with open(os.path.join('tests/fixtures/resource_graphs/Resource Test Model.json'), 'rU') as f:
+            json = JSONDeserializer().deserialize(f)
+            cls.geometry_graph = Graph(json['graph'][0])
+            cls.geometry_graph.save()
+
     def test_api_base_view(self):
         """
         Test that our custom header parameters get pushed on to the GET QueryDict
@@ -81,3 +88,54 @@ class APITests(ArchesTestCase):
         request.user = None
         response = view(request)
         self.assertEqual(request.GET.get('ver'), '2.1')
+
+    def test_geojson_paging_parameters(self):
+        """
+        Test that invalid paging and bbox parameters are rejected before anything is read
+
+        """
+
+        factory = RequestFactory()
+        view = GeoJSON.as_view()
+
+        for params in ({'limit': 'all'}, {'offset': '-'}, {'bbox': '0,0,1'}, {'bbox': 'west,south,east,north'}):
+            request = factory.get(reverse('geojson'), params)
+            request.user = None
+            response = view(request)
+            self.assertEqual(response.status_code, 400)
+
+    def test_geojson_features(self):
+        """
+        Test that the features of every batch of tiles are streamed, and that they can be filtered by bbox and paged
+
+        """
+
+        nodeid = '3ebc6785-fa61-11e6-8c85-14109fd34195'
+        resource = models.ResourceInstance.objects.create(graph_id=self.geometry_graph.graphid)
+        for x in range(5):
+            point = {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Point', 'coordinates': [x, x]}}
+            models.TileModel.objects.create(
+                resourceinstance=resource,
+                nodegroup_id=nodeid,
+                sortorder=x,
+                data={nodeid: {'type': 'FeatureCollection', 'features': [point]}},
+            )
+
+        factory = RequestFactory()
+        # read two tiles at a time, so the features come from more than one batch
+        view = GeoJSON.as_view(batch_size=2)
+        user = User.objects.get(username='admin')
+
+        def get_features(params):
+            params.update({'nodeid': nodeid, 'resourceid': str(resource.pk)})
+            request = factory.get(reverse('geojson'), params)
+            request.user = user
+            response = view(request)
+            self.assertEqual(response.status_code, 200)
+            content = b''.join(response.streaming_content).decode('utf-8')
+            return [(feature['id'], feature['geometry']['coordinates']) for feature in JSONDeserializer().deserialize(content)['features']]
+
+        self.assertEqual(get_features({}), [(x + 1, [x, x]) for x in range(5)])
+        self.assertEqual(get_features({'bbox': '0.5,0.5,3.5,3.5'}), [(1, [1, 1]), (2, [2, 2]), (3, [3, 3])])
+        self.assertEqual(get_features({'limit': 2, 'offset': 2}), [(3, [2, 2]), (4, [3, 3])])
+        self.assertEqual(get_features({'bbox': '0.5,0.5,3.5,3.5', 'limit': 2, 'offset': 1}), [(2, [2, 2]), (3, [3, 3])])
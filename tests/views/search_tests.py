@@ -23,21 +23,27 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import io
 import os
+import csv
 import json
 import time
+from mock import patch
 from tests.base_test import ArchesTestCase
 from django.urls import reverse
 from django.contrib.auth.models import User, Group
+from django.core.cache import cache
 from django.test.client import Client
 from arches.app.models import models
 from arches.app.models.resource import Resource
+from arches.app.models.system_settings import settings
 from arches.app.models.tile import Tile
 from arches.app.search.mappings import prepare_terms_index, delete_terms_index, \
     prepare_concepts_index, delete_concepts_index, prepare_search_index, delete_search_index
 from arches.app.utils.data_management.resource_graphs.importer import import_graph as ResourceGraphImporter
 from arches.app.utils.betterJSONSerializer import JSONSerializer, JSONDeserializer
-from guardian.shortcuts import assign_perm
+from arches.app.utils.permission_backend import get_nodegroup_permissions, get_resource_type_ids_by_perm, user_can_read_resources
+from guardian.shortcuts import assign_perm, remove_perm
 
 
 # these tests can be run from the command line via
@@ -479,6 +485,70 @@ class SearchTests(ArchesTestCase):
         self.assertCountEqual(extract_pks(response_json), [str(self.date_resource.pk), str(self.date_and_cultural_period_resource.pk)])
 
 
+    def test_export_results(self):
+        """
+        Export every resource that has the string "test" in it as csv and as geojson
+
+        """
+
+        term_filter = [{"type": "string", "context": "", "context_label": "", "id": "test", "text": "test", "value": "test", "inverted": False}]
+        query = {'term-filter': JSONSerializer().serialize(term_filter)}
+        self.client.login(username='admin', password='admin')
+
+        response = self.client.get(reverse('export_results'), dict(query, format='csv'))
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertCountEqual(set(row['ResourceID'] for row in rows), [str(self.date_resource.pk), str(self.name_resource.pk)])
+        self.assertIn('some test name', [row['Value'] for row in rows])
+
+        response = self.client.get(reverse('export_results'), dict(query, format='geojson'))
+        features = json.loads(b''.join(response.streaming_content))['features']
+        self.assertEqual([feature['id'] for feature in features], [str(self.name_resource.pk)])
+
+        response = self.client.get(reverse('export_results'), dict(query, format='xls'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_nodegroup_permissions_snapshot(self):
+        """
+        Test that a user's nodegroup permissions snapshot is replaced when their object permissions change
+
+        """
+
+        user = User.objects.get(username='test')
+        nodegroup = models.NodeGroup.objects.get(pk=self.search_model_destruction_date_nodeid)
+        permissions = get_nodegroup_permissions(user)
+        self.assertNotIn(self.search_model_destruction_date_nodeid, permissions.readable)
+        self.assertIn(self.search_model_name_nodeid, permissions.readable)
+        self.assertIs(get_nodegroup_permissions(user), permissions)
+        # the permissions generation and the resource nodegroups version were both read moments ago
+        with patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            get_nodegroup_permissions(user)
+            cache_get.assert_not_called()
+
+        remove_perm('no_access_to_nodegroup', user, nodegroup)
+        try:
+            self.assertIn(self.search_model_destruction_date_nodeid, get_nodegroup_permissions(user).readable)
+            self.assertEqual(models.UserProfile(user=user).viewable_nodegroups, set(get_nodegroup_permissions(user).readable))
+        finally:
+            assign_perm('no_access_to_nodegroup', user, nodegroup)
+        self.assertNotIn(self.search_model_destruction_date_nodeid, get_nodegroup_permissions(user).readable)
+
+    def test_resource_permission_checks(self):
+        """
+        Test that the resource models a user can read are read from their permission snapshot
+
+        """
+
+        user = User.objects.get(username='test')
+        graphids = get_resource_type_ids_by_perm(user, 'models.read_nodegroup')
+        self.assertIn(self.search_model_graphid, graphids)
+        self.assertNotIn(settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID, graphids)
+        self.assertTrue(user_can_read_resources(user))
+
+        user_without_groups = User.objects.create_user('nogroups', 'nogroups@archesproject.org', 'nogroups')
+        self.assertEqual(get_resource_type_ids_by_perm(user_without_groups, 'models.read_nodegroup'), frozenset())
+        self.assertFalse(user_can_read_resources(user_without_groups))
+
+
 def extract_pks(response_json):
     return [result['_source']['resourceinstanceid'] for result in response_json['results']['hits']['hits']]
 